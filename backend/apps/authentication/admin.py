@@ -3,7 +3,8 @@ Admin configuration for authentication app
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, OTPCode
+from django.utils import timezone
+from .models import User, OTPCode, OutboundMessage, OutboundMessageStatus
 
 
 @admin.register(User)
@@ -21,3 +22,19 @@ class OTPCodeAdmin(admin.ModelAdmin):
     search_fields = ['phone_number']
     readonly_fields = ['created_at', 'expires_at']
 
+
+
+@admin.register(OutboundMessage)
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ['phone_number', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'instance', 'created_at']
+    search_fields = ['phone_number', 'dedupe_key']
+    readonly_fields = ['created_at', 'sent_at', 'locked_at', 'provider_message_id', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Повторить отправку сейчас')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundMessageStatus.SENT).update(
+            status=OutboundMessageStatus.PENDING, next_attempt_at=timezone.now(), attempts=0, locked_at=None
+        )
+        self.message_user(request, f"Поставлено в очередь: {updated}")
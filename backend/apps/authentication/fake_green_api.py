@@ -0,0 +1,74 @@
+"""
+Локальный заменитель Green-API для тестов и замеров пропускной способности
+
+Принимает POST /waInstance{id}/sendMessage/{token} и отвечает {"idMessage": ...}
+с настраиваемой задержкой. Поддерживает keep-alive (HTTP/1.1), поэтому на нем
+видна разница между пулом соединений и новым соединением на каждый запрос.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SEND_MESSAGE_PATH = re.compile(r'^/waInstance[^/]*/sendMessage/[^/]*$')
+
+
+class FakeGreenAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями - без TCP_NODELAY keep-alive упирается в задержку ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+
+        if not _SEND_MESSAGE_PATH.match(self.path):
+            return self._reply(404, {'error': 'not found'})
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            return self._reply(400, {'error': 'invalid json'})
+        if not payload.get('chatId') or 'message' not in payload:
+            return self._reply(400, {'error': 'chatId and message are required'})
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.received.append(payload)
+        self._reply(200, {'idMessage': uuid.uuid4().hex.upper()})
+
+    def _reply(self, status_code: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGreenAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0):
+        super().__init__((host, port), FakeGreenAPIHandler)
+        self.latency = latency
+        self.received = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start_in_thread(self) -> 'FakeGreenAPIServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,54 @@
+"""
+Замер пропускной способности отправки WhatsApp-сообщений
+Использование: python manage.py benchmark_green_api [--messages 500] [--workers 16] [--latency-ms 20] [--url URL]
+
+Без --url запускается встроенный заменитель Green-API. Сравниваются:
+новое соединение на запрос, пул соединений, пул + параллельная отправка.
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.authentication.fake_green_api import FakeGreenAPIServer
+from apps.authentication.services import GreenAPIService
+
+
+class Command(BaseCommand):
+    help = 'Замер сообщений в секунду с пулом соединений и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--latency-ms', type=float, default=20, help='Задержка встроенного сервера')
+        parser.add_argument('--url', help='Адрес Green-API (по умолчанию - встроенный заменитель)')
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server = FakeGreenAPIServer(latency=options['latency_ms'] / 1000).start_in_thread()
+            url = server.url
+
+        messages = [(f'7700{i:07d}', f'Бенчмарк {i}') for i in range(options['messages'])]
+        workers = options['workers']
+        scenarios = [
+            ('Без пула, последовательно', lambda: GreenAPIService.send_many(messages, max_workers=1, pooled=False)),
+            ('Пул, последовательно', lambda: GreenAPIService.send_many(messages, max_workers=1)),
+            (f'Без пула, {workers} потоков', lambda: GreenAPIService.send_many(messages, max_workers=workers, pooled=False)),
+            (f'Пул, {workers} потоков', lambda: GreenAPIService.send_many(messages, max_workers=workers)),
+        ]
+
+        self.stdout.write(f"{'Режим':<28} {'Сообщ/с':>10} {'Ошибок':>8}")
+        try:
+            with override_settings(GREEN_API_URL=url, GREEN_API_POOL_SIZE=workers):
+                for title, run in scenarios:
+                    GreenAPIService.reset_session()
+                    start = time.perf_counter()
+                    results = run()
+                    elapsed = time.perf_counter() - start
+                    errors = sum(isinstance(result, Exception) for result in results)
+                    self.stdout.write(f"{title:<28} {len(messages) / elapsed:>10.1f} {errors:>8}")
+        finally:
+            GreenAPIService.reset_session()
+            if server:
+                server.stop()
@@ -0,0 +1,28 @@
+"""
+Локальный заменитель Green-API
+Использование: python manage.py run_fake_green_api [--port 8765] [--latency-ms 20]
+
+Для отправки через него: GREEN_API_URL=http://127.0.0.1:8765
+"""
+from django.core.management.base import BaseCommand
+
+from apps.authentication.fake_green_api import FakeGreenAPIServer
+
+
+class Command(BaseCommand):
+    help = 'Запуск локального заменителя Green-API (для тестов и замеров)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help='Задержка ответа')
+
+    def handle(self, *args, **options):
+        server = FakeGreenAPIServer(options['host'], options['port'], latency=options['latency_ms'] / 1000)
+        self.stdout.write(self.style.SUCCESS(f'Fake Green-API: {server.url} (Ctrl+C - остановка)'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,34 @@
+"""
+Отправка WhatsApp-уведомлений из очереди (outbox)
+Использование: python manage.py send_notifications [--limit 100] [--loop] [--interval 5]
+
+Лимиты скорости: NOTIFICATION_RATE_PER_MINUTE / NOTIFICATION_INSTANCE_RATES (старты
+отправок по лимиту инстанса, сами отправки - параллельно, до GREEN_API_POOL_SIZE).
+Расписание инстанса общее (NotificationRateLimit): можно запускать несколько
+обработчиков, лимит от этого не растет.
+Неудачные отправки повторяются с экспоненциальной задержкой до
+NOTIFICATION_MAX_ATTEMPTS попыток.
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from apps.authentication.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = 'Отправка уведомлений из очереди исходящих сообщений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Сообщений за один проход')
+        parser.add_argument('--loop', action='store_true', help='Работать непрерывно')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза, если очередь пуста (секунды)')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = NotificationService.send_due(limit=options['limit'])
+            if stats['sent'] or stats['failed']:
+                self.stdout.write(f"Отправлено: {stats['sent']}, ошибок: {stats['failed']}")
+            if not options['loop']:
+                break
+            if not (stats['sent'] or stats['failed']):
+                time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_alter_user_managers_alter_user_username_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=20, verbose_name='Телефон')),
+                ('message', models.TextField(verbose_name='Текст')),
+                ('dedupe_key', models.CharField(blank=True, max_length=200, null=True, unique=True, verbose_name='Ключ дедупликации')),
+                ('instance', models.CharField(blank=True, max_length=50, verbose_name='Инстанс Green-API')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Не доставлено')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('provider_message_id', models.CharField(blank=True, max_length=100, verbose_name='ID сообщения Green-API')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Исходящее сообщение',
+                'verbose_name_plural': 'Исходящие сообщения',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='authenticat_status_cee380_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationRateLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance', models.CharField(max_length=50, unique=True, verbose_name='Инстанс Green-API')),
+                ('next_start_at', models.DateTimeField(blank=True, null=True, verbose_name='Ближайший свободный старт')),
+            ],
+            options={
+                'verbose_name': 'Лимит отправки инстанса',
+                'verbose_name_plural': 'Лимиты отправки инстансов',
+            },
+        ),
+    ]
@@ -3,6 +3,7 @@ Authentication models for ProfMed.kz
 """
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -93,3 +94,69 @@ class OTPCode(models.Model):
     def __str__(self):
         return f"{self.phone_number} - {self.code}"
 
+
+
+class OutboundMessageStatus(models.TextChoices):
+    PENDING = 'pending', 'Ожидает отправки'
+    SENDING = 'sending', 'Отправляется'
+    SENT = 'sent', 'Отправлено'
+    FAILED = 'failed', 'Не доставлено'
+
+
+class OutboundMessage(models.Model):
+    """
+    Исходящее WhatsApp-сообщение (outbox)
+
+    Записывается в той же транзакции, что и бизнес-изменение, и отправляется
+    командой send_notifications с ограничением скорости и повторами.
+    """
+    phone_number = models.CharField(max_length=20, verbose_name='Телефон')
+    message = models.TextField(verbose_name='Текст')
+    # Ключ идемпотентности: повторная постановка того же уведомления игнорируется
+    dedupe_key = models.CharField(
+        max_length=200, unique=True, null=True, blank=True, verbose_name='Ключ дедупликации'
+    )
+    # Инстанс Green-API, через который отправляется сообщение (лимиты считаются по нему)
+    instance = models.CharField(max_length=50, blank=True, verbose_name='Инстанс Green-API')
+    status = models.CharField(
+        max_length=20,
+        choices=OutboundMessageStatus.choices,
+        default=OutboundMessageStatus.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.IntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в отправку')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    provider_message_id = models.CharField(max_length=100, blank=True, verbose_name='ID сообщения Green-API')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Исходящее сообщение'
+        verbose_name_plural = 'Исходящие сообщения'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.phone_number} - {self.get_status_display()}"
+
+
+class NotificationRateLimit(models.Model):
+    """
+    Расписание отправок инстанса Green-API, общее для всех обработчиков
+
+    Обработчик резервирует старты своих сообщений под блокировкой строки,
+    поэтому несколько процессов send_notifications вместе не превышают лимит.
+    """
+    instance = models.CharField(max_length=50, unique=True, verbose_name='Инстанс Green-API')
+    next_start_at = models.DateTimeField(null=True, blank=True, verbose_name='Ближайший свободный старт')
+
+    class Meta:
+        verbose_name = 'Лимит отправки инстанса'
+        verbose_name_plural = 'Лимиты отправки инстансов'
+
+    def __str__(self):
+        return f"{self.instance or 'по умолчанию'} - {self.next_start_at}"
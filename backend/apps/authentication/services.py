@@ -1,26 +1,70 @@
 """
 Authentication services for WhatsApp OTP via Green-API
 """
+import logging
 import random
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
 import requests
-from .models import OTPCode
+from .models import OTPCode, OutboundMessage, OutboundMessageStatus, NotificationRateLimit
+
+logger = logging.getLogger(__name__)
 
 
 class GreenAPIService:
-    """Service for interacting with Green-API"""
+    """
+    Клиент Green-API
+    
+    Запросы идут через общую сессию requests с пулом keep-alive соединений,
+    поэтому TCP/TLS-соединение устанавливается один раз на поток пула, а не
+    на каждое сообщение. Базовый адрес - GREEN_API_URL (для тестов и замеров
+    можно указать локальный сервер run_fake_green_api).
+    """
+    
+    _session = None
+    _session_lock = threading.Lock()
+    
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Общая сессия с пулом соединений (создается при первом обращении)"""
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    pool_size = getattr(settings, 'GREEN_API_POOL_SIZE', 16)
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=pool_size,
+                        max_retries=0
+                    )
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    cls._session = session
+        return cls._session
+    
+    @classmethod
+    def reset_session(cls):
+        """Закрыть соединения пула (например, после смены GREEN_API_URL)"""
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+            cls._session = None
     
     @staticmethod
-    def send_whatsapp_message(phone_number: str, message: str) -> dict:
+    def send_whatsapp_message(phone_number: str, message: str, pooled: bool = True) -> dict:
         """
         Отправка сообщения через Green-API WhatsApp
         
         Args:
             phone_number: Номер телефона в формате 77001234567
             message: Текст сообщения
+            pooled: Использовать общий пул соединений (False - новое соединение на запрос)
             
         Returns:
             dict: Ответ от API
@@ -34,13 +78,53 @@ class GreenAPIService:
             "chatId": f"{formatted_phone}@c.us",
             "message": message
         }
+        timeout = (
+            getattr(settings, 'GREEN_API_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'GREEN_API_READ_TIMEOUT', 10),
+        )
         
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            post = GreenAPIService.get_session().post if pooled else requests.post
+            response = post(url, json=payload, timeout=timeout)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
             raise Exception(f"Ошибка отправки WhatsApp сообщения: {str(e)}")
+    
+    @staticmethod
+    def send_many(messages, max_workers: int = None, pooled: bool = True, start_at: list = None, sleep=time.sleep) -> list:
+        """
+        Параллельная отправка сообщений ограниченным пулом потоков
+        
+        Args:
+            messages: [(phone_number, message), ...]
+            max_workers: Число потоков (по умолчанию GREEN_API_POOL_SIZE)
+            start_at: Моменты time.monotonic(), раньше которых сообщение не отправляется
+                (для лимитов; сообщения должны идти по возрастанию моментов)
+            
+        Returns:
+            Список в порядке messages: dict ответа или Exception
+        """
+        messages = list(messages)
+        start_at = list(start_at) if start_at is not None else [None] * len(messages)
+        max_workers = max_workers or getattr(settings, 'GREEN_API_POOL_SIZE', 16)
+        
+        def send(item):
+            (phone_number, message), not_before = item
+            if not_before is not None:
+                wait = not_before - time.monotonic()
+                if wait > 0:
+                    sleep(wait)
+            try:
+                return GreenAPIService.send_whatsapp_message(phone_number, message, pooled=pooled)
+            except Exception as e:
+                return e
+        
+        items = list(zip(messages, start_at))
+        if max_workers <= 1 or len(items) <= 1:
+            return [send(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(send, items))
 
 
 class OTPService:
@@ -114,3 +198,196 @@ class OTPService:
         except OTPCode.DoesNotExist:
             return False, None
 
+
+
+class NotificationService:
+    """
+    Уведомления через outbox (OutboundMessage)
+    
+    enqueue() только записывает сообщение в текущей транзакции - оно уйдет,
+    только если транзакция зафиксирована. Отправку выполняет команда
+    send_notifications: пакетами, с ограничением скорости на инстанс Green-API
+    и повторами с экспоненциальной задержкой. OTP-коды отправляются напрямую
+    (GreenAPIService), так как пользователь ждет их немедленно.
+    """
+    
+    @staticmethod
+    def enqueue(phone_number: str, message: str, dedupe_key: str = None):
+        """Поставить сообщение в очередь (повтор с тем же dedupe_key игнорируется)"""
+        NotificationService.enqueue_many([(phone_number, message, dedupe_key)])
+    
+    @staticmethod
+    def enqueue_many(items):
+        """
+        Поставить в очередь несколько сообщений одним запросом
+        
+        Args:
+            items: [(phone_number, message, dedupe_key | None), ...]
+        """
+        messages = [
+            OutboundMessage(
+                phone_number=phone_number,
+                message=message,
+                dedupe_key=dedupe_key,
+                instance=settings.GREEN_API_ID_INSTANCE,
+            )
+            for phone_number, message, dedupe_key in items
+            if phone_number
+        ]
+        if messages:
+            OutboundMessage.objects.bulk_create(messages, batch_size=1000, ignore_conflicts=True)
+    
+    @staticmethod
+    def requeue_stale(timeout_seconds: int = None) -> int:
+        """
+        Вернуть в очередь сообщения, взятые упавшим обработчиком
+        
+        locked_at - запланированное начало последней отправки пакета (send_due):
+        статусы сохраняются после всего пакета, поэтому пакет, растянутый лимитом
+        скорости, брошенным не считается. Таймаут (NOTIFICATION_STALE_SECONDS)
+        должен быть больше таймаутов HTTP.
+        """
+        if timeout_seconds is None:
+            timeout_seconds = getattr(settings, 'NOTIFICATION_STALE_SECONDS', 120)
+        return OutboundMessage.objects.filter(
+            status=OutboundMessageStatus.SENDING,
+            locked_at__lt=timezone.now() - timedelta(seconds=timeout_seconds)
+        ).update(status=OutboundMessageStatus.PENDING, locked_at=None)
+    
+    @staticmethod
+    def claim_batch(limit: int = 100) -> list:
+        """Взять пакет готовых к отправке сообщений (параллельные обработчики не пересекаются)"""
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboundMessage.objects.select_for_update(skip_locked=True).filter(
+                    status=OutboundMessageStatus.PENDING,
+                    next_attempt_at__lte=now
+                ).order_by('next_attempt_at', 'id')[:limit]
+            )
+            OutboundMessage.objects.filter(id__in=[m.id for m in batch]).update(
+                status=OutboundMessageStatus.SENDING, locked_at=now
+            )
+        return batch
+    
+    @staticmethod
+    def retry_delay(attempts: int) -> timedelta:
+        """Экспоненциальная задержка повтора со случайным разбросом"""
+        base = getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 30)
+        delay = min(base * 2 ** max(attempts - 1, 0), 3600)
+        return timedelta(seconds=delay * random.uniform(1.0, 1.1))
+    
+    @staticmethod
+    def deliver(message: OutboundMessage) -> bool:
+        """Отправить одно сообщение и сохранить статус доставки"""
+        try:
+            response = GreenAPIService.send_whatsapp_message(message.phone_number, message.message)
+        except Exception as e:
+            return NotificationService.record_result(message, e)
+        return NotificationService.record_result(message, response)
+    
+    @staticmethod
+    def record_result(message: OutboundMessage, response) -> bool:
+        """Сохранить статус доставки: response - ответ API или Exception"""
+        message.attempts += 1
+        if isinstance(response, Exception):
+            max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 6)
+            message.last_error = str(response)[:1000]
+            if message.attempts >= max_attempts:
+                message.status = OutboundMessageStatus.FAILED
+            else:
+                message.status = OutboundMessageStatus.PENDING
+                message.next_attempt_at = timezone.now() + NotificationService.retry_delay(message.attempts)
+            message.locked_at = None
+            message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'locked_at'])
+            return False
+        
+        message.status = OutboundMessageStatus.SENT
+        message.sent_at = timezone.now()
+        message.locked_at = None
+        message.last_error = ''
+        message.provider_message_id = str((response or {}).get('idMessage', ''))[:100]
+        message.save(update_fields=['attempts', 'status', 'sent_at', 'locked_at', 'last_error', 'provider_message_id'])
+        return True
+    
+    @staticmethod
+    def rate_per_minute(instance: str) -> float:
+        """Лимит сообщений в минуту для инстанса (NOTIFICATION_INSTANCE_RATES или общий)"""
+        rates = getattr(settings, 'NOTIFICATION_INSTANCE_RATES', {})
+        return float(rates.get(instance) or getattr(settings, 'NOTIFICATION_RATE_PER_MINUTE', 60))
+    
+    @staticmethod
+    def reserve_starts(instance: str, count: int) -> list:
+        """
+        Зарезервировать count стартов отправки инстанса (общее расписание обработчиков)
+        
+        Старты идут через 60 / rate_per_minute секунд от ближайшего свободного,
+        строка инстанса блокируется на время резервирования.
+        
+        Returns:
+            Список datetime по возрастанию
+        """
+        interval = timedelta(seconds=60.0 / NotificationService.rate_per_minute(instance))
+        with transaction.atomic():
+            limit, _ = NotificationRateLimit.objects.select_for_update().get_or_create(instance=instance)
+            now = timezone.now()
+            first = max(now, limit.next_start_at) if limit.next_start_at else now
+            starts = [first + interval * index for index in range(count)]
+            limit.next_start_at = starts[-1] + interval
+            limit.save(update_fields=['next_start_at'])
+        return starts
+    
+    @staticmethod
+    def send_due(limit: int = 100, sleep=time.sleep, max_workers: int = None) -> dict:
+        """
+        Отправить пакет готовых сообщений с соблюдением лимитов инстансов
+        
+        Отправки идут параллельно (GreenAPIService.send_many), но начало каждой
+        назначено по лимиту своего инстанса: старты резервируются в общем
+        расписании (reserve_starts), поэтому сообщения инстанса стартуют не чаще
+        rate_per_minute даже при нескольких обработчиках, а ожидание ответа не
+        задерживает следующие. Разные инстансы не ждут друг друга. Статусы
+        сохраняются в вызывающем потоке.
+        
+        Returns:
+            {'sent': ..., 'failed': ...}
+        """
+        NotificationService.requeue_stale()
+        batch = NotificationService.claim_batch(limit)
+        
+        # Расписание стартов из общего расписания инстансов (в шкале time.monotonic)
+        by_instance = {}
+        for message in batch:
+            by_instance.setdefault(message.instance, []).append(message)
+        scheduled = []
+        for instance, messages in by_instance.items():
+            starts = NotificationService.reserve_starts(instance, len(messages))
+            now, wall_now = time.monotonic(), timezone.now()
+            scheduled.extend(
+                (now + (start - wall_now).total_seconds(), message) for start, message in zip(starts, messages)
+            )
+        scheduled.sort(key=lambda item: item[0])
+        now = time.monotonic()
+        
+        # Блокировка - до начала последней отправки пакета: пакет, растянутый
+        # лимитом, не возвращается в очередь другим обработчиком (requeue_stale)
+        if scheduled:
+            OutboundMessage.objects.filter(id__in=[message.id for _, message in scheduled]).update(
+                locked_at=timezone.now() + timedelta(seconds=scheduled[-1][0] - now)
+            )
+        
+        responses = GreenAPIService.send_many(
+            [(message.phone_number, message.message) for _, message in scheduled],
+            max_workers=max_workers,
+            start_at=[start for start, _ in scheduled],
+            sleep=sleep,
+        )
+        
+        stats = {'sent': 0, 'failed': 0}
+        for (_, message), response in zip(scheduled, responses):
+            if NotificationService.record_result(message, response):
+                stats['sent'] += 1
+            else:
+                stats['failed'] += 1
+                logger.warning(f"Не удалось отправить сообщение {message.id}: {message.last_error}")
+        return stats
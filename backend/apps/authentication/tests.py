@@ -0,0 +1,114 @@
+"""
+Tests for authentication app
+"""
+import time
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from .fake_green_api import FakeGreenAPIServer
+from .models import OutboundMessage, OutboundMessageStatus
+from .services import GreenAPIService, NotificationService
+
+
+class NotificationOutboxTestCase(TestCase):
+    """Тесты отправки очереди уведомлений через Green-API"""
+    
+    def start_server(self, latency: float = 0):
+        server = FakeGreenAPIServer(latency=latency).start_in_thread()
+        self.addCleanup(server.stop)
+        self.addCleanup(GreenAPIService.reset_session)
+        GreenAPIService.reset_session()
+        return server
+    
+    def test_outbox_delivers_through_pooled_green_api(self):
+        """Тест: отправка очереди через локальный заменитель Green-API по общему пулу соединений"""
+        server = self.start_server()
+        
+        with override_settings(GREEN_API_URL=server.url, NOTIFICATION_RATE_PER_MINUTE=60000):
+            NotificationService.enqueue_many([
+                (f'+7 700 000 00 0{i}', f'Сообщение {i}', f'pool-test:{i}') for i in range(3)
+            ])
+            self.assertEqual(NotificationService.send_due(limit=10), {'sent': 3, 'failed': 0})
+            
+            results = GreenAPIService.send_many([('77000000010', 'a'), ('77000000011', 'b')], max_workers=2)
+        
+        messages = OutboundMessage.objects.order_by('id')
+        self.assertTrue(all(m.status == OutboundMessageStatus.SENT and m.provider_message_id for m in messages))
+        self.assertTrue(all('idMessage' in result for result in results))
+        self.assertEqual(len(server.received), 5)
+        # Отправки параллельны - порядок получения не гарантирован
+        self.assertIn('77000000000@c.us', {payload['chatId'] for payload in server.received})
+    
+    def test_send_due_fans_out_within_instance_rate(self):
+        """Тест: отправки идут параллельно, старты одного инстанса - не чаще лимита, другой инстанс не ждет"""
+        server = self.start_server(latency=0.3)
+        NotificationService.enqueue_many([
+            (f'7700000002{i}', f'Сообщение {i}', f'fan-out:{i}') for i in range(4)
+        ])
+        OutboundMessage.objects.filter(phone_number='77000000023').update(instance='second')
+        
+        starts = {}
+        original = GreenAPIService.send_whatsapp_message
+        
+        def recording(phone_number, message, pooled=True):
+            starts[phone_number] = time.monotonic()
+            return original(phone_number, message, pooled=pooled)
+        
+        with override_settings(GREEN_API_URL=server.url, NOTIFICATION_RATE_PER_MINUTE=600), \
+                mock.patch.object(GreenAPIService, 'send_whatsapp_message', side_effect=recording):
+            began = time.monotonic()
+            stats = NotificationService.send_due(limit=10, max_workers=4)
+            elapsed = time.monotonic() - began
+        
+        self.assertEqual(stats, {'sent': 4, 'failed': 0})
+        first = [starts[f'7700000002{i}'] for i in range(3)]
+        # Лимит 600 в минуту - старты не чаще раза в 0.1 с; ответы (0.3 с) следующие не задерживают
+        self.assertTrue(all(later - earlier >= 0.095 for earlier, later in zip(first, first[1:])))
+        self.assertLess(starts['77000000023'] - first[0], 0.09)
+        self.assertLess(elapsed, 4 * 0.3)
+        self.assertTrue(all(m.status == OutboundMessageStatus.SENT for m in OutboundMessage.objects.all()))
+    
+    def test_rate_limited_batch_is_not_requeued_as_stale(self):
+        """Тест: сообщения, ждущие очереди по лимиту, заблокированы до своего старта и не возвращаются в очередь"""
+        server = self.start_server()
+        NotificationService.enqueue_many([
+            (f'7700000003{i}', f'Сообщение {i}', f'stale:{i}') for i in range(3)
+        ])
+        checks = []
+        
+        def fake_sleep(seconds):
+            # Ожидание до старта отсчитывается от начала пакета: время "идет" сдвигом блокировок в прошлое
+            elapsed = seconds - sum(waited for waited, _ in checks)
+            for message in OutboundMessage.objects.all():
+                OutboundMessage.objects.filter(pk=message.pk).update(
+                    locked_at=message.locked_at - timedelta(seconds=elapsed)
+                )
+            # Тем временем другой обработчик ищет брошенные сообщения
+            checks.append((elapsed, NotificationService.requeue_stale(timeout_seconds=60)))
+        
+        with override_settings(GREEN_API_URL=server.url, NOTIFICATION_RATE_PER_MINUTE=0.5):
+            stats = NotificationService.send_due(limit=10, sleep=fake_sleep, max_workers=1)
+        
+        self.assertEqual(stats, {'sent': 3, 'failed': 0})
+        # Интервал 120 с: пакет длится 240 с, но ни одно сообщение не возвращено в очередь
+        self.assertEqual([requeued for _, requeued in checks], [0, 0])
+        self.assertTrue(all(seconds > 100 for seconds, _ in checks))
+        self.assertFalse(OutboundMessage.objects.exclude(status=OutboundMessageStatus.SENT).exists())
+        self.assertEqual(len(server.received), 3)
+    
+    def test_rate_limit_is_shared_between_workers(self):
+        """Тест: старты резервируются в общем расписании - второй обработчик продолжает его, а не начинает заново"""
+        server = self.start_server()
+        NotificationService.enqueue_many([
+            (f'7700000004{i}', f'Сообщение {i}', f'shared-rate:{i}') for i in range(4)
+        ])
+        waits = []
+        
+        with override_settings(GREEN_API_URL=server.url, NOTIFICATION_RATE_PER_MINUTE=6):
+            # Два обработчика по два сообщения (интервал 10 с)
+            for _ in range(2):
+                NotificationService.send_due(limit=2, sleep=waits.append, max_workers=1)
+        
+        self.assertEqual(OutboundMessage.objects.filter(status=OutboundMessageStatus.SENT).count(), 4)
+        # Первый: сразу и через 10 с; второй: через 20 и 30 с от начала расписания
+        self.assertEqual([round(wait) for wait in waits], [10, 20, 30])
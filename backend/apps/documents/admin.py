@@ -2,7 +2,7 @@
 Admin configuration for documents app
 """
 from django.contrib import admin
-from .models import Document, DocumentSignature, CalendarPlan
+from .models import Document, DocumentSignature, CalendarPlan, CalendarSlot, DocumentRegenerationRequest, DocumentJob
 
 
 @admin.register(Document)
@@ -27,3 +27,25 @@ class CalendarPlanAdmin(admin.ModelAdmin):
     list_filter = ['year', 'created_at']
     search_fields = ['employer__name', 'clinic__name']
 
+
+@admin.register(CalendarSlot)
+class CalendarSlotAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'date', 'clinic', 'plan']
+    list_filter = ['date']
+    search_fields = ['employee__last_name', 'employee__iin', 'clinic__name']
+    raw_id_fields = ['plan', 'employee', 'clinic']
+
+
+@admin.register(DocumentRegenerationRequest)
+class DocumentRegenerationRequestAdmin(admin.ModelAdmin):
+    list_display = ['document_type', 'organization', 'year', 'requested_at', 'attempts', 'next_attempt_at']
+    list_filter = ['document_type', 'year']
+    search_fields = ['organization__name']
+    readonly_fields = ['first_requested_at', 'requested_at', 'last_error']
+
+
+@admin.register(DocumentJob)
+class DocumentJobAdmin(admin.ModelAdmin):
+    list_display = ['job_type', 'status', 'phase', 'params', 'processed', 'failed', 'total', 'created_at', 'finished_at']
+    list_filter = ['job_type', 'status']
+    readonly_fields = ['phase', 'total', 'processed', 'failed', 'completed_keys', 'errors', 'result', 'created_at', 'started_at', 'finished_at']
@@ -0,0 +1,216 @@
+"""
+Eligibility engine - Определение лиц, подлежащих осмотру (Приложение 3)
+
+Вся выборка для работодателя выполняется несколькими множественными запросами:
+сотрудники с агрегатами по осмотрам, карта "должность -> вредные факторы" и
+дата последнего завершенного осмотра по каждой паре (сотрудник, фактор).
+Правила периодичности применяются в памяти.
+"""
+from datetime import date, datetime
+from itertools import islice
+from django.utils import timezone
+from django.db.models import Q, Max, Count
+from apps.organizations.models import Organization, Employee
+from apps.compliance.models import Profession
+from apps.medical_examinations.models import DoctorExamination
+
+
+def _experience(hire_date):
+    """Стаж в формате "N л. M м." """
+    if not hire_date:
+        return None
+    total_days = (date.today() - hire_date).days
+    total_years = total_days // 365
+    total_months = (total_days % 365) // 30
+    return f"{total_years} л. {total_months} м." if total_years > 0 else f"{total_months} м."
+
+
+class EligibilityService:
+    """Сервис определения сотрудников, подлежащих осмотру"""
+
+    @staticmethod
+    def factors_by_position(position_ids) -> dict:
+        """
+        Активные вредные факторы по должностям (один запрос)
+
+        Returns:
+            {position_id: [HarmfulFactor, ...]} в порядке кодов факторов
+        """
+        through = Profession.harmful_factors.through
+        links = through.objects.filter(
+            profession_id__in=position_ids,
+            harmfulfactor__is_active=True
+        ).select_related('harmfulfactor').order_by('harmfulfactor__code', 'harmfulfactor_id')
+
+        factors = {}
+        for link in links:
+            factors.setdefault(link.profession_id, []).append(link.harmfulfactor)
+        return factors
+
+    @staticmethod
+    def last_factor_examinations(employer: Organization, employee_ids=None) -> dict:
+        """
+        Дата последнего завершенного осмотра по каждой паре (сотрудник, фактор)
+
+        Returns:
+            {(employee_id, harmful_factor_id): datetime | None}
+        """
+        queryset = DoctorExamination.objects.filter(
+            examination__employee__employer=employer,
+            examination__status='completed'
+        )
+        if employee_ids is not None:
+            queryset = queryset.filter(examination__employee_id__in=employee_ids)
+
+        rows = queryset.values(
+            'examination__employee_id', 'harmful_factor_id'
+        ).annotate(
+            last_completed=Max('examination__completed_date')
+        ).order_by()
+
+        return {
+            (row['examination__employee_id'], row['harmful_factor_id']): row['last_completed']
+            for row in rows
+        }
+
+    @staticmethod
+    def needs_examination(factors, last_by_factor: dict, year_periodic_count: int, today: date = None) -> bool:
+        """
+        Правила периодичности Приказа 131
+
+        Args:
+            factors: Активные вредные факторы должности
+            last_by_factor: {harmful_factor_id: дата последнего завершенного осмотра}
+            year_periodic_count: Количество завершенных периодических осмотров с начала года
+        """
+        today = today or timezone.now().date()
+        for factor in factors:
+            last_completed = last_by_factor.get(factor.id)
+            if not last_completed:
+                return True
+            months_passed = (today - last_completed.date()).days // 30
+            if months_passed >= factor.periodicity_months:
+                return True
+
+        # Нет ни одного завершенного периодического осмотра за этот год
+        return year_periodic_count == 0
+
+    @staticmethod
+    def build_row(employee: Employee, factors, last_examination) -> dict:
+        """Строка таблицы Приложения 3 (как в Excel форме)"""
+        harmful_factors_list = [f.name for f in factors]
+        experience = _experience(employee.hire_date)
+
+        return {
+            'id': employee.id,
+            'full_name': employee.full_name,
+            # Дата рождения и пол хранятся в карточке (заполняются из ИИН при сохранении)
+            'date_of_birth': employee.date_of_birth.isoformat() if employee.date_of_birth else None,
+            'gender': employee.get_gender_display() if employee.gender else None,
+            'department': employee.department or '-',
+            'position': employee.position.name if employee.position else 'Не указана',
+            'total_experience': experience or '-',
+            # Стаж по должности (пока используем общий стаж)
+            'position_experience': experience or '-',
+            'last_examination_date': last_examination.isoformat() if last_examination else None,
+            'harmful_factors': ', '.join(harmful_factors_list) if harmful_factors_list else '-',
+            'notes': employee.notes or '',  # Примечание из модели Employee
+            'iin': employee.iin,
+        }
+
+    @staticmethod
+    def _employees_queryset(employer: Organization, year: int, employee_ids=None):
+        """Активные сотрудники с должностью и агрегатами по осмотрам"""
+        year_start = timezone.make_aware(datetime(year, 1, 1))
+        completed = Q(examinations__status='completed')
+
+        employees = Employee.objects.filter(
+            employer=employer,
+            is_active=True,
+            position__isnull=False
+        ).select_related('position').annotate(
+            last_completed_date=Max('examinations__completed_date', filter=completed),
+            year_periodic_count=Count(
+                'examinations',
+                filter=completed & Q(
+                    examinations__examination_type='periodic',
+                    examinations__completed_date__gte=year_start
+                )
+            ),
+        )
+        if employee_ids is not None:
+            employees = employees.filter(id__in=employee_ids)
+        return employees
+
+    @staticmethod
+    def _rows_for(employer: Organization, employees: list, factors_map: dict, last_exams: dict, today: date):
+        """Строки для уже загруженных сотрудников"""
+        rows = []
+        for employee in employees:
+            factors = factors_map.get(employee.position_id, [])
+            # Если нет факторов - не включаем
+            if not factors:
+                continue
+
+            last_by_factor = {
+                factor.id: last_exams.get((employee.id, factor.id))
+                for factor in factors
+            }
+            if EligibilityService.needs_examination(
+                factors, last_by_factor, employee.year_periodic_count, today
+            ):
+                rows.append(
+                    EligibilityService.build_row(employee, factors, employee.last_completed_date)
+                )
+        return rows
+
+    @staticmethod
+    def build_appendix_3_rows(employer: Organization, year: int, employee_ids=None) -> list:
+        """
+        Строки Приложения 3 для всего работодателя (или для указанных сотрудников)
+
+        Количество запросов не зависит от числа сотрудников.
+
+        Args:
+            employer: Работодатель
+            year: Год
+            employee_ids: Ограничить расчет этими сотрудниками (опционально)
+
+        Returns:
+            Список строк в порядке сортировки сотрудников
+        """
+        employees = list(EligibilityService._employees_queryset(employer, year, employee_ids))
+
+        factors_map = EligibilityService.factors_by_position(
+            {employee.position_id for employee in employees}
+        )
+        last_exams = EligibilityService.last_factor_examinations(employer, employee_ids)
+
+        return EligibilityService._rows_for(
+            employer, employees, factors_map, last_exams, timezone.now().date()
+        )
+
+    @staticmethod
+    def iter_appendix_3_rows(employer: Organization, year: int, chunk_size: int = 2000):
+        """
+        Строки Приложения 3 потоком, пачками по chunk_size сотрудников
+
+        Память не зависит от числа сотрудников: на каждую пачку выполняется
+        один запрос дат последних осмотров по факторам.
+        """
+        employees = EligibilityService._employees_queryset(employer, year).iterator(chunk_size=chunk_size)
+        factors_map = {}
+        today = timezone.now().date()
+
+        while True:
+            batch = list(islice(employees, chunk_size))
+            if not batch:
+                return
+
+            new_positions = {e.position_id for e in batch} - set(factors_map)
+            if new_positions:
+                factors_map.update(EligibilityService.factors_by_position(new_positions))
+                factors_map.update({position_id: [] for position_id in new_positions - set(factors_map)})
+
+            last_exams = EligibilityService.last_factor_examinations(employer, [e.id for e in batch])
+            yield from EligibilityService._rows_for(employer, batch, factors_map, last_exams, today)
@@ -0,0 +1,220 @@
+"""
+Потоковая выгрузка Приложения 3 в XLSX и CSV
+
+Строки пишутся по мере получения из генератора, файл целиком в памяти
+не собирается. XLSX формируется стандартной библиотекой (zipfile) в
+потоковом режиме: строки листа записываются как inline-строки, без
+таблицы sharedStrings, поэтому память не растет с числом строк.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Колонки в порядке формы Приложения 3 (как в generate_appendix_3)
+APPENDIX_3_COLUMNS = [
+    ('number', '№ п/п'),
+    ('full_name', 'ФИО'),
+    ('date_of_birth', 'Дата рождения'),
+    ('gender', 'Пол'),
+    ('department', 'Объект или участок'),
+    ('position', 'Профессия (должность)'),
+    ('total_experience', 'Общий стаж'),
+    ('position_experience', 'Стаж по занимаемой должности'),
+    ('last_examination_date', 'Дата последнего медосмотра'),
+    ('harmful_factors', 'Вредные производственные факторы'),
+    ('notes', 'Примечание'),
+]
+
+EXPORT_CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Сколько строк накапливать перед отдачей очередного куска
+FLUSH_ROWS = 500
+
+# Управляющие символы, недопустимые в XML 1.0
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _values(number: int, row: dict) -> list:
+    """Значения строки в порядке колонок"""
+    values = []
+    for key, _ in APPENDIX_3_COLUMNS:
+        value = number if key == 'number' else row.get(key)
+        if key == 'last_examination_date' and value:
+            value = value[:10]
+        values.append('' if value is None else value)
+    return values
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """
+    CSV построчно (разделитель ";", UTF-8 с BOM - корректно открывается в Excel)
+
+    Yields:
+        bytes
+    """
+    writer = csv.writer(_Echo(), delimiter=';')
+    buffer = ['\ufeff', writer.writerow([title for _, title in APPENDIX_3_COLUMNS])]
+    for number, row in enumerate(rows, start=1):
+        buffer.append(writer.writerow(_values(number, row)))
+        if len(buffer) >= FLUSH_ROWS:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Несмещаемый поток для zipfile: накапливает записанные байты до pop()
+
+    seek() не поддерживается, поэтому zipfile пишет размеры в data descriptor
+    после каждого файла архива и не возвращается назад.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Стиль 1 - жирный шрифт для заголовка
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+    '<cellXfs count="2"><xf fontId="0"/><xf fontId="1" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+_SHEET_FOOTER = '</sheetData></worksheet>'
+
+
+def _xlsx_cell(value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c t="n"{style_attr}><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(index: int, values, style: int = 0) -> str:
+    cells = ''.join(_xlsx_cell(value, style) for value in values)
+    return f'<row r="{index}">{cells}</row>'
+
+
+def iter_xlsx(rows, sheet_name: str = 'Приложение 3'):
+    """
+    XLSX (один лист) по частям
+
+    Yields:
+        bytes - очередной фрагмент zip-архива
+    """
+    stream = _StreamBuffer()
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        archive.writestr('_rels/.rels', _ROOT_RELS_XML)
+        archive.writestr('xl/workbook.xml', _WORKBOOK_XML.format(sheet_name=escape(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        archive.writestr('xl/styles.xml', _STYLES_XML)
+        yield stream.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as sheet:
+            buffer = [_SHEET_HEADER, _xlsx_row(1, [title for _, title in APPENDIX_3_COLUMNS], style=1)]
+            for number, row in enumerate(rows, start=1):
+                buffer.append(_xlsx_row(number + 1, _values(number, row)))
+                if len(buffer) >= FLUSH_ROWS:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+                    data = stream.pop()
+                    if data:
+                        yield data
+            buffer.append(_SHEET_FOOTER)
+            sheet.write(''.join(buffer).encode('utf-8'))
+
+    yield stream.pop()
+
+
+def iter_export(rows, file_format: str):
+    """Выгрузка в указанном формате (xlsx / csv)"""
+    if file_format == 'csv':
+        return iter_csv(rows)
+    return iter_xlsx(rows)
@@ -0,0 +1,334 @@
+"""
+Пакетное формирование документов сезона (Пункт 20 Приказа 131)
+
+Приложение 3 для всех работодателей и заключительные акты для всех
+партнерств формируются пулом процессов. Каждый процесс открывает
+собственное подключение к БД; число одновременно выполняемых документов
+ограничено. Прогресс сохраняется в DocumentJob после каждого документа,
+поэтому прерванное задание продолжается с того же места.
+
+Календарный план работодателя (DocumentJobType.CALENDAR_PLAN) выполняется
+тем же исполнителем (run_document_jobs) в одном процессе. Формирование плана
+идет в одной транзакции, поэтому ход выполнения до ее фиксации публикуется
+в кэш, а в DocumentJob записывается по завершении.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from apps.organizations.models import Organization, ClinicEmployerPartnership
+from .models import DocumentJob, DocumentJobType, DocumentJobStatus
+from . import workers
+
+
+_PROGRESS_PREFIX = 'document-job:progress:'
+_PROGRESS_TTL_SECONDS = 3600
+
+
+def _task_key(employer_id: int, clinic_id: int = None) -> str:
+    return f"{employer_id}:{clinic_id or 0}"
+
+
+class DocumentJobService:
+    """Сервис пакетного формирования документов"""
+
+    @staticmethod
+    def create_season_job(job_type: str, year: int, clinic_id: int = None, created_by=None) -> DocumentJob:
+        """Создать задание (запускается командой run_document_jobs или generate_season_documents)"""
+        return DocumentJob.objects.create(
+            job_type=job_type,
+            params={'year': year, 'clinic_id': clinic_id},
+            created_by=created_by,
+        )
+
+    @staticmethod
+    def create_calendar_plan_job(
+        employer: Organization,
+        clinic: Organization,
+        year: int,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        mode: str = 'full',
+        created_by=None,
+        objective: str = None
+    ) -> DocumentJob:
+        """
+        Создать задание календарного плана
+
+        mode: 'full' - формирование, 'replan' - перепланирование,
+        'split' - распределение по всем клиникам-партнерам (clinic = None, objective)
+        """
+        params = {
+            'year': year,
+            'clinic_id': clinic.id if clinic else None,
+            'employer_id': employer.id,
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'mode': mode,
+        }
+        if objective:
+            params['objective'] = objective
+        return DocumentJob.objects.create(
+            job_type=DocumentJobType.CALENDAR_PLAN,
+            params=params,
+            created_by=created_by,
+        )
+
+    @staticmethod
+    def task_keys(job: DocumentJob) -> list:
+        """
+        Ключи документов задания: "employer_id:clinic_id"
+
+        Приложение 3 - по работодателю (clinic_id = 0): все работодатели или
+        партнеры указанной клиники. Заключительный акт - по каждому активному
+        партнерству клиника-работодатель.
+        """
+        clinic_id = job.params.get('clinic_id')
+        partnerships = ClinicEmployerPartnership.objects.filter(
+            status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+        )
+        if clinic_id:
+            partnerships = partnerships.filter(clinic_id=clinic_id)
+
+        if job.job_type == DocumentJobType.SEASON_APPENDIX_3:
+            if clinic_id:
+                employer_ids = {p.employer_id for p in partnerships if p.is_active()}
+            else:
+                employer_ids = Organization.objects.filter(org_type='employer').values_list('id', flat=True)
+            return [_task_key(employer_id) for employer_id in sorted(employer_ids)]
+
+        pairs = {(p.employer_id, p.clinic_id) for p in partnerships if p.is_active()}
+        return [_task_key(employer_id, clinic) for employer_id, clinic in sorted(pairs)]
+
+    @staticmethod
+    def claim(job: DocumentJob) -> bool:
+        """Захватить ожидающее задание (защита от параллельного запуска несколькими процессами)"""
+        return DocumentJob.objects.filter(
+            id=job.id, status=DocumentJobStatus.PENDING
+        ).update(status=DocumentJobStatus.RUNNING, started_at=timezone.now()) == 1
+
+    @staticmethod
+    def run(job: DocumentJob, workers_count: int = 4, progress=None) -> dict:
+        """
+        Выполнить задание (или продолжить прерванное)
+
+        Args:
+            job: Задание
+            workers_count: Число процессов; 0 или 1 - в текущем процессе
+            progress: Необязательный callback(job) после каждого документа
+
+        Returns:
+            Сводка: total, skipped, processed, failed, elapsed, per_second
+        """
+        if job.job_type == DocumentJobType.CALENDAR_PLAN:
+            return DocumentJobService.run_calendar_plan(job, progress=progress)
+
+        year = job.params['year']
+        keys = DocumentJobService.task_keys(job)
+        done = set(job.completed_keys)
+        pending = [key for key in keys if key not in done]
+
+        job.status = DocumentJobStatus.RUNNING
+        job.started_at = job.started_at or timezone.now()
+        job.finished_at = None
+        job.total = len(keys)
+        # Ошибки прошлого запуска повторяются заново
+        job.errors = []
+        job.failed = 0
+        job.save(update_fields=['status', 'started_at', 'finished_at', 'total', 'errors', 'failed'])
+
+        start = time.perf_counter()
+        processed = 0
+
+        def record(key, error=None):
+            nonlocal processed
+            if error is None:
+                processed += 1
+                job.completed_keys.append(key)
+                job.processed = len(job.completed_keys)
+            else:
+                job.failed += 1
+                job.errors.append({'key': key, 'error': str(error)[:500]})
+            job.save(update_fields=['processed', 'completed_keys', 'failed', 'errors'])
+            if progress:
+                progress(job)
+
+        def task_args(key):
+            employer_id, clinic_id = (int(part) for part in key.split(':'))
+            return job.job_type, employer_id, clinic_id, year
+
+        if workers_count <= 1:
+            for key in pending:
+                try:
+                    workers.generate_document(*task_args(key))
+                except Exception as e:
+                    record(key, e)
+                else:
+                    record(key)
+        elif pending:
+            # Дочерние процессы не должны наследовать открытые подключения родителя
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers_count,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=workers.init_worker,
+            ) as executor:
+                queue = iter(pending)
+                in_flight = {}
+
+                def submit_next():
+                    key = next(queue, None)
+                    if key is not None:
+                        in_flight[executor.submit(workers.generate_document, *task_args(key))] = key
+
+                # Не более 2 документов на процесс в очереди пула
+                for _ in range(workers_count * 2):
+                    submit_next()
+
+                while in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        key = in_flight.pop(future)
+                        error = future.exception()
+                        record(key, error)
+                        submit_next()
+
+        job.status = DocumentJobStatus.FAILED if job.failed else DocumentJobStatus.COMPLETED
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+
+        elapsed = time.perf_counter() - start
+        return {
+            'total': job.total,
+            'skipped': len(keys) - len(pending),
+            'processed': processed,
+            'failed': job.failed,
+            'elapsed': elapsed,
+            'per_second': processed / elapsed if elapsed else 0,
+        }
+
+    @staticmethod
+    def run_calendar_plan(job: DocumentJob, progress=None) -> dict:
+        """
+        Сформировать, перепланировать или распределить по клиникам календарный план по заданию
+
+        processed/total - сотрудники текущего этапа (scheduling, examinations,
+        notifications); итог (plan_id / plan_ids, сводка изменений) - в job.result.
+        """
+        from .services import DocumentService
+
+        params = job.params
+        start = time.perf_counter()
+        job.status = DocumentJobStatus.RUNNING
+        job.started_at = job.started_at or timezone.now()
+        job.finished_at = None
+        job.phase = 'scheduling'
+        job.errors = []
+        job.failed = 0
+        job.save(update_fields=['status', 'started_at', 'finished_at', 'phase', 'errors', 'failed'])
+
+        def report(phase, processed, total):
+            job.phase, job.processed, job.total = phase, processed, total
+            DocumentJobService.publish_progress(job)
+            if progress:
+                progress(job)
+
+        try:
+            employer = Organization.objects.get(id=params['employer_id'], org_type='employer')
+            start_date = datetime.fromisoformat(params['start_date']) if params.get('start_date') else None
+            end_date = datetime.fromisoformat(params['end_date']) if params.get('end_date') else None
+
+            if params.get('mode') == 'split':
+                plans, summary = DocumentService.generate_split_calendar_plans(
+                    employer, params['year'], start_date or timezone.now(), end_date,
+                    objective=params.get('objective', 'cost'), progress=report
+                )
+                job.result = {'plan_ids': [plan.id for plan in plans], 'split': summary}
+            elif params.get('mode') == 'replan':
+                clinic = Organization.objects.get(id=params['clinic_id'], org_type='clinic')
+                calendar_plan, changes = DocumentService.replan_calendar_plan(
+                    employer, clinic, params['year'], start_date, progress=report
+                )
+                job.result = {'plan_id': calendar_plan.id, 'replan': changes}
+                plans = [calendar_plan]
+            else:
+                clinic = Organization.objects.get(id=params['clinic_id'], org_type='clinic')
+                calendar_plan = DocumentService.generate_calendar_plan(
+                    employer, clinic, params['year'], start_date or timezone.now(), end_date, progress=report
+                )
+                job.result = {
+                    'plan_id': calendar_plan.id,
+                    'past_deadline': calendar_plan.document.content.get('past_deadline'),
+                }
+                plans = [calendar_plan]
+            DocumentJobService._set_documents_author(plans, job)
+        except Exception as e:
+            job.failed = 1
+            job.errors = [{'key': str(params.get('employer_id')), 'error': str(e)[:500]}]
+
+        job.status = DocumentJobStatus.FAILED if job.failed else DocumentJobStatus.COMPLETED
+        job.phase = 'failed' if job.failed else 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'phase', 'processed', 'total', 'failed', 'errors', 'result', 'finished_at'
+        ])
+        cache.delete(_PROGRESS_PREFIX + str(job.id))
+
+        elapsed = time.perf_counter() - start
+        return {
+            'total': job.total,
+            'skipped': 0,
+            'processed': job.processed,
+            'failed': job.failed,
+            'elapsed': elapsed,
+            'per_second': job.processed / elapsed if elapsed else 0,
+        }
+
+    @staticmethod
+    def _set_documents_author(calendar_plans, job: DocumentJob):
+        """Автор документов плана - создатель задания"""
+        if not job.created_by_id:
+            return
+        for calendar_plan in calendar_plans:
+            if calendar_plan.document:
+                calendar_plan.document.created_by_id = job.created_by_id
+                calendar_plan.document.save(update_fields=['created_by'])
+
+    @staticmethod
+    def publish_progress(job: DocumentJob):
+        """Ход выполнения в кэш (виден до фиксации транзакции задания)"""
+        try:
+            cache.set(_PROGRESS_PREFIX + str(job.id), {
+                'phase': job.phase, 'processed': job.processed, 'total': job.total,
+            }, timeout=_PROGRESS_TTL_SECONDS)
+        except Exception:
+            # Без кэша прогресс виден только по завершении
+            pass
+
+    @staticmethod
+    def status(job: DocumentJob) -> dict:
+        """Состояние задания для опроса: поля DocumentJob + ход выполнения из кэша"""
+        data = {
+            'id': job.id,
+            'job_type': job.job_type,
+            'status': job.status,
+            'phase': job.phase,
+            'processed': job.processed,
+            'total': job.total,
+            'failed': job.failed,
+            'errors': job.errors,
+            'result': job.result,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+        if job.status == DocumentJobStatus.RUNNING:
+            try:
+                data.update(cache.get(_PROGRESS_PREFIX + str(job.id)) or {})
+            except Exception:
+                pass
+        return data
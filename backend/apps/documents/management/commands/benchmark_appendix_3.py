@@ -0,0 +1,94 @@
+"""
+Бенчмарк формирования Приложения 3
+Использование: python manage.py benchmark_appendix_3 --sizes 100 1000 10000
+
+Создает синтетического работодателя с N сотрудниками и историей осмотров,
+замеряет количество SQL-запросов и время формирования. Все данные
+создаются в транзакции, которая откатывается в конце.
+"""
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.organizations.models import Organization, OrganizationMember, Employee
+from apps.compliance.models import HarmfulFactor, Profession
+from apps.medical_examinations.models import MedicalExamination, DoctorExamination
+from apps.documents.services import DocumentService
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк формирования Приложения 3: количество запросов и время в зависимости от числа сотрудников'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 5000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Сотрудников':>12} {'Запросов':>10} {'Время, с':>10}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    queries, elapsed = self.run_once(size)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            self.stdout.write(f"{size:>12} {queries:>10} {elapsed:>10.3f}")
+
+    def run_once(self, size):
+        now = timezone.now()
+        prefix = f"99{size:07d}"
+
+        owner = User.objects.create(phone_number=f"{prefix}000", username=f"{prefix}000")
+        employer = Organization.objects.create(name=f'Бенчмарк {size}', org_type='employer', owner=owner)
+        clinic = Organization.objects.create(name=f'Клиника {size}', org_type='clinic', owner=owner)
+        doctor = OrganizationMember.objects.create(organization=clinic, user=owner, role='doctor')
+
+        factors = [
+            HarmfulFactor.objects.create(code=f'bench-{size}-{i}', name=f'Фактор {i}', periodicity_months=12)
+            for i in range(3)
+        ]
+        profession = Profession.objects.create(name=f'Бенчмарк профессия {size}')
+        profession.harmful_factors.add(*factors)
+
+        users = User.objects.bulk_create([
+            User(phone_number=f"{prefix}{i:06d}1", username=f"{prefix}{i:06d}1")
+            for i in range(size)
+        ])
+        # bulk_create не вызывает сигналы - формирование документа замеряется отдельно
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user, employer=employer, first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                iin=f'{850101300000 + i}', date_of_birth=date(1985, 1, 1), gender='male', position=profession,
+                hire_date=now.date() - timedelta(days=400 + i % 1000)
+            )
+            for i, user in enumerate(users)
+        ])
+
+        # Половина сотрудников имеет завершенный осмотр (часть - просроченный)
+        examinations = MedicalExamination.objects.bulk_create([
+            MedicalExamination(
+                examination_type='periodic', status='completed', result='fit',
+                employee=employee, employer=employer, clinic=clinic,
+                scheduled_date=now, completed_date=now - timedelta(days=30 * (i % 15))
+            )
+            for i, employee in enumerate(employees[::2])
+        ])
+        DoctorExamination.objects.bulk_create([
+            DoctorExamination(examination=exam, doctor=doctor, harmful_factor=factor, result='fit')
+            for exam in examinations
+            for factor in factors
+        ])
+
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            DocumentService.generate_appendix_3(employer, now.year)
+        return len(ctx.captured_queries), time.perf_counter() - start
@@ -0,0 +1,125 @@
+"""
+Бенчмарк распределения календарного плана по нескольким клиникам
+Использование: python manage.py benchmark_split_planner [--employees 50000] [--clinics 10] [--with-db]
+
+Сначала замеряется только алгоритм распределения (в памяти) для обеих целей,
+с --with-db - полное формирование планов и осмотров на синтетических данных
+в транзакции, которая откатывается в конце.
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.organizations.models import Organization, Employee, ClinicEmployerPartnership
+from apps.compliance.models import HarmfulFactor, Profession
+from apps.medical_examinations.services import CapacityService
+from apps.documents.models import Document, DocumentType
+from apps.documents.planning import CalendarPlanService
+from apps.documents.services import DocumentService
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк распределения Приложения 3 по клиникам-партнерам (цена / дата завершения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50000)
+        parser.add_argument('--clinics', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--with-db', action='store_true', help='Также полное формирование в БД (с откатом)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        clinics = [
+            (clinic_id, rng.randrange(40, 140), Decimal(rng.randrange(4000, 9000, 250)))
+            for clinic_id in range(1, options['clinics'] + 1)
+        ]
+        start = date(timezone.now().year + 1, 1, 10)
+        count = options['employees']
+
+        def working_days(capacity):
+            day = start
+            while True:
+                if CapacityService.is_working_day(day):
+                    yield day, capacity
+                day += timedelta(days=1)
+
+        self.stdout.write(f"{count} сотрудников, {len(clinics)} клиник")
+        self.stdout.write(f"{'Цель':<6} {'Время, мс':>10} {'Стоимость':>14} {'Завершение':>12}")
+        for objective in ('cost', 'date'):
+            began = time.perf_counter()
+            allocation = CalendarPlanService.split_allocation(
+                [(clinic_id, price, working_days(capacity)) for clinic_id, capacity, price in clinics],
+                count,
+                objective=objective,
+                deadline=start.replace(month=12, day=31),
+            )
+            elapsed = time.perf_counter() - began
+            prices = {clinic_id: price for clinic_id, _, price in clinics}
+            cost = sum(prices[clinic_id] * n for clinic_id, days in allocation.items() for _, n in days)
+            finish = max(days[-1][0] for days in allocation.values())
+            self.stdout.write(f"{objective:<6} {elapsed * 1000:>10.1f} {cost:>14} {finish.isoformat():>12}")
+
+        if options['with_db']:
+            try:
+                with transaction.atomic():
+                    self.run_with_db(count, clinics, start)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def run_with_db(self, count, clinics, start):
+        prefix = '98'
+        owner = User.objects.create(phone_number=f'{prefix}000000000', username=f'{prefix}000000000')
+        employer = Organization.objects.create(name='Бенчмарк распределения', org_type='employer', owner=owner)
+        for clinic_id, capacity, price in clinics:
+            clinic = Organization.objects.create(
+                name=f'Клиника {clinic_id}', org_type='clinic', owner=owner, capacity_per_day=capacity
+            )
+            ClinicEmployerPartnership.objects.create(
+                clinic=clinic, employer=employer, default_price=price,
+                status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+            )
+
+        factor = HarmfulFactor.objects.create(code='bench-split', name='Фактор', periodicity_months=12)
+        profession = Profession.objects.create(name='Бенчмарк распределения')
+        profession.harmful_factors.add(factor)
+        users = User.objects.bulk_create([
+            User(phone_number=f'{prefix}{i:08d}1', username=f'{prefix}{i:08d}1') for i in range(count)
+        ], batch_size=5000)
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user, employer=employer, first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                position=profession, hire_date=start - timedelta(days=400)
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        # Приложение 3 задается напрямую - замеряется только распределение и создание осмотров
+        Document.objects.create(
+            document_type=DocumentType.APPENDIX_3, organization=employer, year=start.year - 1,
+            title='Бенчмарк', content={'employees': [{'id': employee.id} for employee in employees]}
+        )
+
+        start_date = timezone.make_aware(timezone.datetime.combine(start, timezone.datetime.min.time()))
+        with CaptureQueriesContext(connection) as queries:
+            began = time.perf_counter()
+            plans, summary = DocumentService.generate_split_calendar_plans(
+                employer, start.year - 1, start_date, objective='cost'
+            )
+            elapsed = time.perf_counter() - began
+
+        self.stdout.write(
+            f"С БД: {len(plans)} планов, {elapsed:.2f} с, {len(queries)} запросов, "
+            f"стоимость {summary['total_cost']}, завершение {summary['completion_date']}"
+        )
@@ -0,0 +1,65 @@
+"""
+Выгрузка Приложения 3 в файл
+Использование: python manage.py export_appendix_3 --employer ID [--year 2025] [--format xlsx|csv] [--output путь]
+
+Файл пишется потоково (пачками сотрудников). Если Приложение 3 за этот год
+уже сформировано, в документ записывается путь к выгруженному файлу.
+"""
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.organizations.models import Organization
+from apps.documents.eligibility import EligibilityService
+from apps.documents.exports import EXPORT_CONTENT_TYPES, iter_export
+from apps.documents.models import Document, DocumentType
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка Приложения 3 в XLSX или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employer', type=int, required=True, help='ID работодателя')
+        parser.add_argument('--year', type=int, default=timezone.now().year)
+        parser.add_argument('--format', dest='file_format', choices=sorted(EXPORT_CONTENT_TYPES), default='xlsx')
+        parser.add_argument('--output', help='Путь к файлу (по умолчанию MEDIA_ROOT/documents/...)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Сотрудников в одной пачке')
+
+    def handle(self, *args, **options):
+        try:
+            employer = Organization.objects.get(id=options['employer'], org_type='employer')
+        except Organization.DoesNotExist:
+            raise CommandError(f"Работодатель {options['employer']} не найден")
+
+        year = options['year']
+        file_format = options['file_format']
+        output = options['output'] or os.path.join(
+            settings.MEDIA_ROOT, 'documents', f'appendix_3_{employer.id}_{year}.{file_format}'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        start = time.perf_counter()
+        rows_written = 0
+
+        def counted(rows):
+            nonlocal rows_written
+            for row in rows:
+                rows_written += 1
+                yield row
+
+        rows = EligibilityService.iter_appendix_3_rows(employer, year, chunk_size=options['chunk_size'])
+        with open(output, 'wb') as f:
+            for chunk in iter_export(counted(rows), file_format):
+                f.write(chunk)
+
+        Document.objects.filter(
+            document_type=DocumentType.APPENDIX_3,
+            organization=employer,
+            year=year
+        ).update(file_path=output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {output}: {rows_written} чел., {time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,75 @@
+"""
+Формирование документов сезона для всех работодателей
+Использование:
+    python manage.py generate_season_documents --type appendix_3 [--year 2025] [--clinic ID] [--workers 8]
+    python manage.py generate_season_documents --resume JOB_ID [--workers 8]
+
+appendix_3 - Приложение 3 для каждого работодателя (или партнеров клиники),
+final_act - заключительный акт для каждого активного партнерства.
+Прерванное задание продолжается с --resume: уже сформированные документы пропускаются.
+"""
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.documents.jobs import DocumentJobService
+from apps.documents.models import DocumentJob, DocumentJobType
+
+JOB_TYPES = {
+    'appendix_3': DocumentJobType.SEASON_APPENDIX_3,
+    'final_act': DocumentJobType.SEASON_FINAL_ACT,
+}
+
+
+class Command(BaseCommand):
+    help = 'Параллельное формирование Приложения 3 / заключительных актов за сезон'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=sorted(JOB_TYPES), help='Тип документов')
+        parser.add_argument('--year', type=int, default=timezone.now().year)
+        parser.add_argument('--clinic', type=int, help='Только партнеры указанной клиники')
+        parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                            help='Число процессов (1 - без пула)')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='Продолжить задание')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = DocumentJob.objects.get(id=options['resume'])
+            except DocumentJob.DoesNotExist:
+                raise CommandError(f"Задание {options['resume']} не найдено")
+        elif options['type']:
+            job = DocumentJobService.create_season_job(
+                JOB_TYPES[options['type']], options['year'], clinic_id=options['clinic']
+            )
+        else:
+            raise CommandError('Укажите --type или --resume')
+
+        self.stdout.write(f"Задание #{job.id}: {job}")
+
+        def progress(job):
+            done = job.processed + job.failed
+            if done % 50 == 0 or done == job.total:
+                self.stdout.write(f"  {job.processed}/{job.total} (ошибок: {job.failed})")
+
+        summary = DocumentJobService.run(job, workers_count=options['workers'], progress=progress)
+        self.print_summary(job, summary)
+
+    def print_summary(self, job, summary):
+        self.stdout.write('')
+        self.stdout.write(f"Всего документов:      {summary['total']}")
+        self.stdout.write(f"Пропущено (готовы):    {summary['skipped']}")
+        self.stdout.write(f"Сформировано сейчас:   {summary['processed']}")
+        self.stdout.write(f"Ошибок:                {summary['failed']}")
+        self.stdout.write(
+            f"Время:                 {summary['elapsed']:.1f} с ({summary['per_second']:.1f} док/с)"
+        )
+        for error in job.errors[:20]:
+            self.stdout.write(self.style.ERROR(f"  {error['key']}: {error['error']}"))
+
+        if job.failed:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Есть ошибки. Повтор: python manage.py generate_season_documents --resume {job.id}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Все документы сформированы'))
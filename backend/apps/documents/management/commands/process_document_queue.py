@@ -0,0 +1,62 @@
+"""
+Воркер очереди переформирования документов
+Использование: python manage.py process_document_queue [--loop] [--interval 5] [--retry-failed]
+
+Повторные отметки одного (документ, организация, год) объединяются:
+документ переформируется один раз после периода тишины. Ошибки повторяются
+с экспоненциальной задержкой, не больше --max-attempts раз.
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.documents.services import DocumentQueueService
+
+
+class Command(BaseCommand):
+    help = 'Обработка очереди отложенного переформирования документов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiet-period', type=int,
+            default=getattr(settings, 'DOCUMENT_QUEUE_QUIET_SECONDS', 30),
+            help='Секунд без новых отметок перед переформированием'
+        )
+        parser.add_argument(
+            '--max-delay', type=int,
+            default=getattr(settings, 'DOCUMENT_QUEUE_MAX_DELAY_SECONDS', 600),
+            help='Максимальная задержка переформирования при непрерывных изменениях'
+        )
+        parser.add_argument(
+            '--retry-delay', type=int,
+            default=getattr(settings, 'DOCUMENT_QUEUE_RETRY_SECONDS', 60),
+            help='Задержка перед первым повтором после ошибки (дальше - вдвое больше)'
+        )
+        parser.add_argument(
+            '--max-attempts', type=int,
+            default=getattr(settings, 'DOCUMENT_QUEUE_MAX_ATTEMPTS', 5),
+            help='Неудачных попыток, после которых запрос больше не обрабатывается'
+        )
+        parser.add_argument('--retry-failed', action='store_true', help='Сбросить счетчик неудач и повторить запросы')
+        parser.add_argument('--limit', type=int, default=100, help='Запросов за один проход')
+        parser.add_argument('--loop', action='store_true', help='Работать непрерывно')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проходами (секунды)')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f"Возвращено в очередь: {DocumentQueueService.retry_failed()}")
+        while True:
+            stats = DocumentQueueService.process_due(
+                quiet_seconds=options['quiet_period'],
+                max_delay_seconds=options['max_delay'],
+                limit=options['limit'],
+                retry_seconds=options['retry_delay'],
+                max_attempts=options['max_attempts']
+            )
+            if stats['processed'] or stats['failed']:
+                self.stdout.write(
+                    f"Переформировано: {stats['processed']}, ошибок: {stats['failed']}"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
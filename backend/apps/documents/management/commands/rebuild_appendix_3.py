@@ -0,0 +1,32 @@
+"""
+Полная пересборка Приложения 3
+Использование: python manage.py rebuild_appendix_3 [--employer ID] [--year 2025]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.organizations.models import Organization
+from apps.documents.services import DocumentService
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка Приложения 3 для работодателя (или всех работодателей)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employer', type=int, help='ID работодателя (по умолчанию - все)')
+        parser.add_argument('--year', type=int, default=timezone.now().year)
+
+    def handle(self, *args, **options):
+        employers = Organization.objects.filter(org_type='employer')
+        if options['employer']:
+            employers = employers.filter(id=options['employer'])
+            if not employers.exists():
+                raise CommandError(f"Работодатель {options['employer']} не найден")
+
+        for employer in employers:
+            document = DocumentService.generate_appendix_3(employer, options['year'])
+            self.stdout.write(
+                f"  ✓ {employer.name}: {document.content.get('total_count', 0)} чел."
+            )
+
+        self.stdout.write(self.style.SUCCESS('✅ Пересборка завершена'))
@@ -0,0 +1,36 @@
+"""
+Запуск ожидающих заданий пакетного формирования документов
+(создаются действием в админке организаций и асинхронным формированием календарного плана)
+Использование: python manage.py run_document_jobs [--workers 8] [--loop] [--interval 5]
+"""
+import os
+import time
+from django.core.management.base import BaseCommand
+
+from apps.documents.jobs import DocumentJobService
+from apps.documents.models import DocumentJob, DocumentJobStatus
+
+
+class Command(BaseCommand):
+    help = 'Выполнение ожидающих заданий формирования документов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1))
+        parser.add_argument('--loop', action='store_true', help='Работать непрерывно')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками (секунды)')
+
+    def handle(self, *args, **options):
+        while True:
+            pending = DocumentJob.objects.filter(status=DocumentJobStatus.PENDING).order_by('created_at')
+            for job in pending:
+                if not DocumentJobService.claim(job):
+                    continue
+                job.refresh_from_db()
+                summary = DocumentJobService.run(job, workers_count=options['workers'])
+                self.stdout.write(
+                    f"Задание #{job.id}: сформировано {summary['processed']}/{summary['total']}, "
+                    f"ошибок {summary['failed']}, {summary['elapsed']:.1f} с"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0006_add_employee_form3_fields'),
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRegenerationRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(choices=[('appendix_3', 'Приложение 3 (Список лиц)'), ('calendar_plan', 'Календарный план'), ('final_act', 'Заключительный акт'), ('medical_certificate', 'Справка 075/у'), ('health_passport', 'Паспорт здоровья'), ('sanitary_book', 'Санитарная книжка')], max_length=50, verbose_name='Тип документа')),
+                ('year', models.IntegerField(verbose_name='Год')),
+                ('first_requested_at', models.DateTimeField(auto_now_add=True, verbose_name='Первый запрос')),
+                ('requested_at', models.DateTimeField(verbose_name='Последний запрос')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Неудачных попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_regeneration_requests', to='organizations.organization', verbose_name='Организация')),
+            ],
+            options={
+                'verbose_name': 'Запрос на переформирование документа',
+                'verbose_name_plural': 'Очередь переформирования документов',
+                'indexes': [models.Index(fields=['requested_at'], name='documents_d_request_555f62_idx')],
+                'unique_together': {('document_type', 'organization', 'year')},
+            },
+        ),
+    ]
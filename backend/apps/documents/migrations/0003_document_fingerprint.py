@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_documentregenerationrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Отпечаток исходных данных'),
+        ),
+    ]
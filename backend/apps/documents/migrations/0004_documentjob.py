@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('documents', '0003_document_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('season_appendix_3', 'Приложение 3 для всех работодателей'), ('season_final_act', 'Заключительные акты по всем партнерствам')], max_length=50, verbose_name='Тип задания')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает запуска'), ('running', 'Выполняется'), ('completed', 'Завершено'), ('failed', 'Завершено с ошибками')], default='pending', max_length=20, verbose_name='Статус')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('total', models.IntegerField(default=0, verbose_name='Всего документов')),
+                ('processed', models.IntegerField(default=0, verbose_name='Сформировано')),
+                ('failed', models.IntegerField(default=0, verbose_name='С ошибками')),
+                ('completed_keys', models.JSONField(default=list, verbose_name='Сформированные ключи')),
+                ('errors', models.JSONField(default=list, verbose_name='Ошибки')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Запущено')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='document_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Задание формирования документов',
+                'verbose_name_plural': 'Задания формирования документов',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='documents_d_status_22d152_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:22
+
+from django.db import migrations, models
+
+
+def remove_duplicate_appendix_3(apps, schema_editor):
+    """Оставляем последнее обновленное Приложение 3 для каждого (работодатель, год)"""
+    Document = apps.get_model('documents', 'Document')
+    seen = set()
+    duplicate_ids = []
+    documents = Document.objects.filter(document_type='appendix_3').order_by(
+        'organization_id', 'year', '-updated_at', '-id'
+    ).values_list('id', 'organization_id', 'year')
+    for document_id, organization_id, year in documents.iterator():
+        if (organization_id, year) in seen:
+            duplicate_ids.append(document_id)
+        else:
+            seen.add((organization_id, year))
+    Document.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_documentjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_appendix_3, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='document',
+            constraint=models.UniqueConstraint(condition=models.Q(('document_type', 'appendix_3')), fields=('document_type', 'organization', 'year'), name='unique_appendix_3_per_organization_year'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_calendar_slots(apps, schema_editor):
+    """Записи из plan_data существующих планов (повтор сотрудника - по первой дате)"""
+    CalendarPlan = apps.get_model('documents', 'CalendarPlan')
+    CalendarSlot = apps.get_model('documents', 'CalendarSlot')
+    Employee = apps.get_model('organizations', 'Employee')
+    for plan in CalendarPlan.objects.iterator():
+        dates = {}
+        for date_str in sorted(plan.plan_data or {}):
+            for emp_data in plan.plan_data[date_str] or []:
+                if isinstance(emp_data, dict) and emp_data.get('employee_id') is not None:
+                    dates.setdefault(int(emp_data['employee_id']), date_str)
+        valid_ids = set(Employee.objects.filter(
+            id__in=dates, employer_id=plan.employer_id
+        ).values_list('id', flat=True))
+        CalendarSlot.objects.bulk_create([
+            CalendarSlot(plan_id=plan.id, employee_id=employee_id, clinic_id=plan.clinic_id, date=date_str)
+            for employee_id, date_str in dates.items()
+            if employee_id in valid_ids
+        ], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0007_employee_demographics_indexes'),
+        ('documents', '0005_unique_appendix_3'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата осмотра')),
+                ('clinic', models.ForeignKey(limit_choices_to={'org_type': 'clinic'}, on_delete=django.db.models.deletion.CASCADE, related_name='calendar_slots', to='organizations.organization', verbose_name='Клиника')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_slots', to='organizations.employee', verbose_name='Сотрудник')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='documents.calendarplan', verbose_name='Календарный план')),
+            ],
+            options={
+                'verbose_name': 'Запись календарного плана',
+                'verbose_name_plural': 'Записи календарных планов',
+                'ordering': ['date', 'id'],
+                'indexes': [models.Index(fields=['clinic', 'date'], name='documents_c_clinic__e9f617_idx'), models.Index(fields=['employee', 'date'], name='documents_c_employe_d53200_idx')],
+                'unique_together': {('plan', 'employee')},
+            },
+        ),
+        migrations.RunPython(fill_calendar_slots, migrations.RunPython.noop),
+    ]
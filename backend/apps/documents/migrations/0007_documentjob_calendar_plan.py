@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_calendarslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentjob',
+            name='phase',
+            field=models.CharField(blank=True, max_length=30, verbose_name='Этап'),
+        ),
+        migrations.AddField(
+            model_name='documentjob',
+            name='result',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Результат'),
+        ),
+        migrations.AlterField(
+            model_name='documentjob',
+            name='job_type',
+            field=models.CharField(choices=[('season_appendix_3', 'Приложение 3 для всех работодателей'), ('season_final_act', 'Заключительные акты по всем партнерствам'), ('calendar_plan', 'Календарный план работодателя')], max_length=50, verbose_name='Тип задания'),
+        ),
+    ]
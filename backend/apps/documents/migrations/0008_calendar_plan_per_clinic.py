@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0007_employee_demographics_indexes'),
+        ('documents', '0007_documentjob_calendar_plan'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='calendarplan',
+            unique_together={('employer', 'clinic', 'year')},
+        ),
+    ]
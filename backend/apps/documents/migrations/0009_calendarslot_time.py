@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_calendar_plan_per_clinic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarslot',
+            name='time',
+            field=models.TimeField(blank=True, null=True, verbose_name='Время (начало слота)'),
+        ),
+    ]
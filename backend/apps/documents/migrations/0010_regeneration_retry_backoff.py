@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_calendarslot_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentregenerationrequest',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка'),
+        ),
+        migrations.AddIndex(
+            model_name='documentregenerationrequest',
+            index=models.Index(fields=['next_attempt_at'], name='documents_d_next_at_5af8c9_idx'),
+        ),
+    ]
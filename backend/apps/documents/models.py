@@ -56,6 +56,8 @@ class Document(models.Model):
         verbose_name='Осмотр'
     )
     year = models.IntegerField(verbose_name='Год')
+    # Отпечаток исходных данных, по которым сформирован документ (для проверки актуальности)
+    fingerprint = models.CharField(max_length=64, blank=True, verbose_name='Отпечаток исходных данных')
     created_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -74,6 +76,14 @@ class Document(models.Model):
             models.Index(fields=['document_type', 'status']),
             models.Index(fields=['organization', 'year']),
         ]
+        constraints = [
+            # Одно Приложение 3 на работодателя и год
+            models.UniqueConstraint(
+                fields=['document_type', 'organization', 'year'],
+                condition=models.Q(document_type='appendix_3'),
+                name='unique_appendix_3_per_organization_year',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_document_type_display()} - {self.organization.name} ({self.year})"
@@ -151,7 +161,8 @@ class CalendarPlan(models.Model):
     class Meta:
         verbose_name = 'Календарный план'
         verbose_name_plural = 'Календарные планы'
-        unique_together = ['employer', 'year']
+        # Один план на клинику: сотрудники работодателя могут распределяться по нескольким клиникам
+        unique_together = ['employer', 'clinic', 'year']
 
     def __str__(self):
         return f"План {self.employer.name} на {self.year} год"
@@ -162,3 +173,142 @@ class CalendarPlan(models.Model):
             self.document.delete()
         super().delete(*args, **kwargs)
 
+
+class CalendarSlot(models.Model):
+    """
+    Запись сотрудника в календарном плане (нормализованное представление plan_data)
+    
+    Одна строка на сотрудника плана. plan_data плана строится из этих строк
+    (CalendarPlanService.plan_data_from_slots) и хранится для совместимости.
+    """
+    plan = models.ForeignKey(
+        CalendarPlan,
+        on_delete=models.CASCADE,
+        related_name='slots',
+        verbose_name='Календарный план'
+    )
+    employee = models.ForeignKey(
+        'organizations.Employee',
+        on_delete=models.CASCADE,
+        related_name='calendar_slots',
+        verbose_name='Сотрудник'
+    )
+    clinic = models.ForeignKey(
+        'organizations.Organization',
+        on_delete=models.CASCADE,
+        related_name='calendar_slots',
+        limit_choices_to={'org_type': 'clinic'},
+        verbose_name='Клиника'
+    )
+    date = models.DateField(verbose_name='Дата осмотра')
+    time = models.TimeField(null=True, blank=True, verbose_name='Время (начало слота)')
+    
+    class Meta:
+        verbose_name = 'Запись календарного плана'
+        verbose_name_plural = 'Записи календарных планов'
+        ordering = ['date', 'id']
+        unique_together = ['plan', 'employee']
+        indexes = [
+            models.Index(fields=['clinic', 'date']),
+            models.Index(fields=['employee', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.date}"
+
+
+
+class DocumentRegenerationRequest(models.Model):
+    """Отложенное переформирование документа (очередь с объединением повторных запросов)"""
+    document_type = models.CharField(
+        max_length=50,
+        choices=DocumentType.choices,
+        verbose_name='Тип документа'
+    )
+    organization = models.ForeignKey(
+        'organizations.Organization',
+        on_delete=models.CASCADE,
+        related_name='document_regeneration_requests',
+        verbose_name='Организация'
+    )
+    year = models.IntegerField(verbose_name='Год')
+    first_requested_at = models.DateTimeField(auto_now_add=True, verbose_name='Первый запрос')
+    requested_at = models.DateTimeField(verbose_name='Последний запрос')
+    attempts = models.IntegerField(default=0, verbose_name='Неудачных попыток')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    # После ошибки - не раньше этого времени (экспоненциальная задержка по attempts)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name='Следующая попытка')
+    
+    class Meta:
+        verbose_name = 'Запрос на переформирование документа'
+        verbose_name_plural = 'Очередь переформирования документов'
+        unique_together = ['document_type', 'organization', 'year']
+        indexes = [
+            models.Index(fields=['requested_at']),
+            models.Index(fields=['next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_document_type_display()} - {self.organization_id} ({self.year})"
+
+
+class DocumentJobType(models.TextChoices):
+    SEASON_APPENDIX_3 = 'season_appendix_3', 'Приложение 3 для всех работодателей'
+    SEASON_FINAL_ACT = 'season_final_act', 'Заключительные акты по всем партнерствам'
+    CALENDAR_PLAN = 'calendar_plan', 'Календарный план работодателя'
+
+
+class DocumentJobStatus(models.TextChoices):
+    PENDING = 'pending', 'Ожидает запуска'
+    RUNNING = 'running', 'Выполняется'
+    COMPLETED = 'completed', 'Завершено'
+    FAILED = 'failed', 'Завершено с ошибками'
+
+
+class DocumentJob(models.Model):
+    """Пакетное формирование документов (сезон: все работодатели / партнерства)"""
+    job_type = models.CharField(
+        max_length=50,
+        choices=DocumentJobType.choices,
+        verbose_name='Тип задания'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=DocumentJobStatus.choices,
+        default=DocumentJobStatus.PENDING,
+        verbose_name='Статус'
+    )
+    # Параметры: {"year": 2025, "clinic_id": 1 | null}; для календарного плана
+    # дополнительно employer_id, start_date, end_date, mode
+    params = models.JSONField(default=dict, verbose_name='Параметры')
+    phase = models.CharField(max_length=30, blank=True, verbose_name='Этап')
+    total = models.IntegerField(default=0, verbose_name='Всего документов')
+    processed = models.IntegerField(default=0, verbose_name='Сформировано')
+    failed = models.IntegerField(default=0, verbose_name='С ошибками')
+    # Ключи уже сформированных документов - для продолжения прерванного задания
+    completed_keys = models.JSONField(default=list, verbose_name='Сформированные ключи')
+    errors = models.JSONField(default=list, verbose_name='Ошибки')
+    # Итог задания (для календарного плана: plan_id, изменения перепланирования)
+    result = models.JSONField(default=dict, blank=True, verbose_name='Результат')
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='document_jobs',
+        verbose_name='Создал'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Запущено')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершено')
+    
+    class Meta:
+        verbose_name = 'Задание формирования документов'
+        verbose_name_plural = 'Задания формирования документов'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_job_type_display()} ({self.params.get('year')}) - {self.get_status_display()}"
@@ -0,0 +1,277 @@
+"""
+Календарный план в нормализованном виде (CalendarSlot)
+
+Запись на осмотр хранится строкой (план, сотрудник, клиника, дата) с индексами
+по (клиника, дата) и (сотрудник, дата), поэтому вопросы "кто придет в клинику
+в этот день" и "на какой день записан сотрудник" решаются одним запросом по
+индексу, без разбора plan_data всех планов. plan_data остается производным
+представлением для совместимости: пересобирается из записей после изменений.
+"""
+import heapq
+from datetime import date, time
+from django.db import transaction
+
+from apps.organizations.models import Employee
+from .models import CalendarPlan, CalendarSlot
+
+
+class CalendarPlanService:
+    """Сервис записей календарного плана"""
+
+    @staticmethod
+    def day_entries(clinic, day: date, employees: list, occupancy: dict = None) -> list:
+        """
+        Записи plan_data на день со временем прихода (по слотам клиники)
+
+        Время подбирается CapacityService.slot_times с учетом уже назначенных
+        осмотров клиники, записи упорядочены по времени. occupancy - занятость
+        слотов дня, прочитанная заранее для всего плана (slot_occupancy_by_day).
+        """
+        from apps.medical_examinations.services import CapacityService
+
+        times = CapacityService.slot_times(clinic, day, len(employees), occupancy=occupancy)
+        return [
+            {
+                'employee_id': employee.id,
+                'full_name': employee.full_name,
+                'position': employee.position.name if employee.position else 'Не указана',
+                'time': slot_time.strftime('%H:%M'),
+            }
+            for employee, slot_time in zip(employees, times)
+        ]
+
+    @staticmethod
+    def entry_time(emp_data: dict):
+        """Время записи из plan_data ("HH:MM") или None"""
+        value = emp_data.get('time') if isinstance(emp_data, dict) else None
+        try:
+            return time.fromisoformat(value) if value else None
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def slots_from_plan_data(plan_data: dict) -> dict:
+        """{employee_id: (дата, время или None)} из plan_data; повторная запись - по первой дате"""
+        dates = {}
+        for date_str in sorted(plan_data):
+            try:
+                day = date.fromisoformat(date_str)
+            except ValueError:
+                # Служебные ключи (не даты) пропускаются
+                continue
+            for emp_data in plan_data[date_str] or []:
+                employee_id = emp_data.get('employee_id') if isinstance(emp_data, dict) else None
+                if employee_id is not None:
+                    dates.setdefault(int(employee_id), (day, CalendarPlanService.entry_time(emp_data)))
+        return dates
+
+    @staticmethod
+    def split_allocation(sources, count: int, objective: str = 'cost', deadline: date = None) -> dict:
+        """
+        Распределить count осмотров между клиниками (жадно, через очередь с приоритетом)
+
+        Все осмотры одинаковы, а цена в клинике не зависит от дня, поэтому жадный
+        выбор лучшего свободного дня оптимален (вырожденный случай транспортной
+        задачи / потока минимальной стоимости):
+        - 'cost': сначала самые дешевые места до deadline (без deadline - любые),
+          после deadline - самые ранние дни, при равенстве - дешевле;
+        - 'date': самые ранние дни (минимальная дата завершения), при равенстве - дешевле.
+
+        Args:
+            sources: [(clinic_id, цена осмотра, итератор (день, свободно)), ...]
+                (см. CapacityService.free_days)
+
+        Returns:
+            {clinic_id: [(день, количество), ...]} - дни по возрастанию
+        """
+        if objective not in ('cost', 'date'):
+            raise ValueError(f'Неизвестная цель планирования: {objective}')
+
+        def priority(day, price):
+            if objective == 'date':
+                return (day, price)
+            late = deadline is not None and day > deadline
+            return (late, day, price) if late else (late, price, day)
+
+        heap = []
+        for clinic_id, price, days in sources:
+            day, free = next(days)
+            heapq.heappush(heap, (priority(day, price), clinic_id, day, free, price, days))
+
+        allocation = {}
+        remaining = count
+        while remaining > 0 and heap:
+            _, clinic_id, day, free, price, days = heapq.heappop(heap)
+            taken = min(free, remaining)
+            allocation.setdefault(clinic_id, []).append((day, taken))
+            remaining -= taken
+            next_day = next(days, None)
+            if next_day is not None:
+                day, free = next_day
+                heapq.heappush(heap, (priority(day, price), clinic_id, day, free, price, days))
+        return allocation
+
+    @staticmethod
+    def past_deadline(days, deadline: date) -> dict:
+        """
+        Осмотры, назначенные позже deadline (мест до него не хватило)
+
+        Args:
+            days: [(день, количество), ...] - распределение по дням
+
+        Returns:
+            {'deadline': 'YYYY-MM-DD', 'count': ..., 'days': ['YYYY-MM-DD', ...]}
+        """
+        late = [(day, count) for day, count in days if day > deadline]
+        return {
+            'deadline': deadline.isoformat(),
+            'count': sum(count for _, count in late),
+            'days': [day.isoformat() for day, _ in late],
+        }
+
+    @staticmethod
+    def sync_slots(calendar_plan: CalendarPlan) -> dict:
+        """
+        Привести записи плана в соответствие с plan_data (по разнице, а не пересозданием)
+
+        Returns:
+            {'created': ..., 'updated': ..., 'deleted': ...}
+        """
+        desired = CalendarPlanService.slots_from_plan_data(calendar_plan.plan_data or {})
+        # Сотрудники из plan_data, которых уже нет (или другого работодателя), не записываются
+        valid_ids = set(Employee.objects.filter(
+            id__in=desired, employer_id=calendar_plan.employer_id
+        ).values_list('id', flat=True))
+        desired = {employee_id: day for employee_id, day in desired.items() if employee_id in valid_ids}
+
+        with transaction.atomic():
+            existing = {slot.employee_id: slot for slot in calendar_plan.slots.all()}
+
+            removed = [slot.id for employee_id, slot in existing.items() if employee_id not in desired]
+            changed = []
+            for employee_id, (day, slot_time) in desired.items():
+                slot = existing.get(employee_id)
+                if slot is not None and (
+                    slot.date != day or slot.time != slot_time or slot.clinic_id != calendar_plan.clinic_id
+                ):
+                    slot.date = day
+                    slot.time = slot_time
+                    slot.clinic_id = calendar_plan.clinic_id
+                    changed.append(slot)
+            # Порядок plan_data сохраняется порядком id записей
+            added = [
+                CalendarSlot(
+                    plan=calendar_plan,
+                    employee_id=employee_id,
+                    clinic_id=calendar_plan.clinic_id,
+                    date=day,
+                    time=slot_time,
+                )
+                for employee_id, (day, slot_time) in desired.items()
+                if employee_id not in existing
+            ]
+
+            if removed:
+                CalendarSlot.objects.filter(id__in=removed).delete()
+            if changed:
+                CalendarSlot.objects.bulk_update(changed, ['date', 'time', 'clinic'], batch_size=1000)
+            if added:
+                CalendarSlot.objects.bulk_create(added, batch_size=1000)
+
+        return {'created': len(added), 'updated': len(changed), 'deleted': len(removed)}
+
+    @staticmethod
+    def add_slots(calendar_plan: CalendarPlan, assignments) -> list:
+        """Записать сотрудников: assignments - [(employee_id, дата, время), ...]"""
+        return CalendarSlot.objects.bulk_create([
+            CalendarSlot(
+                plan=calendar_plan,
+                employee_id=employee_id,
+                clinic_id=calendar_plan.clinic_id,
+                date=day,
+                time=slot_time,
+            )
+            for employee_id, day, slot_time in assignments
+        ], batch_size=1000)
+
+    @staticmethod
+    def plan_data_from_slots(calendar_plan: CalendarPlan) -> dict:
+        """plan_data (дата -> список сотрудников) из записей плана"""
+        plan_data = {}
+        slots = calendar_plan.slots.select_related('employee__position').order_by('date', 'time', 'id')
+        for slot in slots:
+            employee = slot.employee
+            entry = {
+                'employee_id': employee.id,
+                'full_name': employee.full_name,
+                'position': employee.position.name if employee.position else 'Не указана',
+            }
+            if slot.time:
+                entry['time'] = slot.time.strftime('%H:%M')
+            plan_data.setdefault(str(slot.date), []).append(entry)
+        return plan_data
+
+    @staticmethod
+    def patch_plan_data(calendar_plan: CalendarPlan, changes: dict) -> dict:
+        """
+        Точечно изменить plan_data плана и его документа (без чтения всех записей)
+
+        Args:
+            changes: {employee_id: запись CalendarSlot (с загруженным сотрудником) или None - исключен}
+        """
+        plan_data = {
+            date_str: [
+                emp_data for emp_data in entries
+                if not (isinstance(emp_data, dict) and emp_data.get('employee_id') in changes)
+            ]
+            for date_str, entries in (calendar_plan.plan_data or {}).items()
+        }
+        for slot in changes.values():
+            if slot is None:
+                continue
+            employee = slot.employee
+            entry = {
+                'employee_id': employee.id,
+                'full_name': employee.full_name,
+                'position': employee.position.name if employee.position else 'Не указана',
+            }
+            if slot.time:
+                entry['time'] = slot.time.strftime('%H:%M')
+            plan_data.setdefault(str(slot.date), []).append(entry)
+            plan_data[str(slot.date)].sort(key=lambda emp_data: emp_data.get('time') or '')
+        plan_data = {date_str: entries for date_str, entries in sorted(plan_data.items()) if entries}
+
+        calendar_plan.plan_data = plan_data
+        calendar_plan.save(update_fields=['plan_data', 'updated_at'])
+        document = calendar_plan.document
+        if document is not None:
+            document.content = {**document.content, 'plan_data': plan_data}
+            document.save(update_fields=['content', 'updated_at'])
+        return plan_data
+
+    @staticmethod
+    def refresh_plan_data(calendar_plan: CalendarPlan) -> dict:
+        """Пересобрать plan_data плана и его документа из записей (если изменились)"""
+        plan_data = CalendarPlanService.plan_data_from_slots(calendar_plan)
+        if plan_data != calendar_plan.plan_data:
+            calendar_plan.plan_data = plan_data
+            calendar_plan.save(update_fields=['plan_data', 'updated_at'])
+
+        document = calendar_plan.document
+        if document is not None and document.content.get('plan_data') != plan_data:
+            document.content = {**document.content, 'plan_data': plan_data}
+            document.save(update_fields=['content', 'updated_at'])
+        return plan_data
+
+    @staticmethod
+    def day_slots(date_value: date, clinic_id: int = None, slots=None):
+        """Записи на день (по клинике - индекс (clinic, date)); slots - базовая выборка"""
+        slots = (slots if slots is not None else CalendarSlot.objects.all()).filter(date=date_value)
+        if clinic_id:
+            slots = slots.filter(clinic_id=clinic_id)
+        return slots
+
+    @staticmethod
+    def employee_slots(employee_id: int, slots=None):
+        """Записи сотрудника во всех планах (индекс (employee, date)); slots - базовая выборка"""
+        return (slots if slots is not None else CalendarSlot.objects.all()).filter(employee_id=employee_id)
@@ -2,7 +2,7 @@
 Document serializers
 """
 from rest_framework import serializers
-from .models import Document, DocumentSignature, CalendarPlan
+from .models import Document, DocumentSignature, CalendarPlan, CalendarSlot
 
 
 class DocumentSignatureSerializer(serializers.ModelSerializer):
@@ -37,12 +37,32 @@ class CalendarPlanSerializer(serializers.ModelSerializer):
     employer_name = serializers.CharField(source='employer.name', read_only=True)
     clinic_name = serializers.CharField(source='clinic.name', read_only=True)
     document_id = serializers.IntegerField(source='document.id', read_only=True)
+    past_deadline = serializers.SerializerMethodField()
     
     class Meta:
         model = CalendarPlan
         fields = [
             'id', 'employer', 'employer_name', 'clinic', 'clinic_name',
-            'year', 'plan_data', 'document', 'document_id', 'created_at', 'updated_at'
+            'year', 'plan_data', 'document', 'document_id', 'past_deadline', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    def get_past_deadline(self, obj):
+        """Осмотры позже запрошенного end_date (None - граница не задавалась)"""
+        return obj.document.content.get('past_deadline') if obj.document else None
+
 
+class CalendarSlotSerializer(serializers.ModelSerializer):
+    employee_name = serializers.CharField(source='employee.full_name', read_only=True)
+    position_name = serializers.CharField(source='employee.position.name', read_only=True, default=None)
+    employer = serializers.IntegerField(source='plan.employer_id', read_only=True)
+    employer_name = serializers.CharField(source='plan.employer.name', read_only=True)
+    clinic_name = serializers.CharField(source='clinic.name', read_only=True)
+    
+    class Meta:
+        model = CalendarSlot
+        fields = [
+            'id', 'plan', 'date', 'time', 'employee', 'employee_name', 'position_name',
+            'employer', 'employer_name', 'clinic', 'clinic_name'
+        ]
+        read_only_fields = fields
@@ -1,20 +1,97 @@
 """
 Document services - Генерация документов согласно Приказу 131
 """
-from datetime import datetime, timedelta
+import hashlib
+from datetime import date, datetime, time, timedelta
 from django.utils import timezone
-from django.db.models import Q, Count
-from .models import Document, DocumentType, DocumentSignature, CalendarPlan
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Count, F, Max
+from .models import Document, DocumentType, DocumentSignature, CalendarPlan, CalendarSlot, DocumentRegenerationRequest
 from apps.organizations.models import Organization, Employee
 from apps.medical_examinations.models import MedicalExamination, ExaminationResult
 from apps.authentication.services import OTPService
+from .eligibility import EligibilityService
+from .planning import CalendarPlanService
+from .singleflight import single_flight, flight_key
 
 
 class DocumentService:
     """Сервис для генерации документов"""
     
     @staticmethod
-    def generate_appendix_3(employer: Organization, year: int) -> Document:
+    def appendix_3_fingerprint(employer: Organization, year: int) -> str:
+        """
+        Дешевый отпечаток исходных данных Приложения 3
+        
+        Учитывает: сотрудников и осмотры работодателя (количество и max updated_at),
+        партнерства, версию набора вредных факторов и текущую дату
+        (от нее зависят сроки периодичности и стаж).
+        """
+        from apps.organizations.models import ClinicEmployerPartnership
+        from apps.compliance.models import HarmfulFactor, Profession
+        
+        employees = Employee.objects.filter(employer=employer).aggregate(
+            count=Count('id'), last=Max('updated_at')
+        )
+        examinations = MedicalExamination.objects.filter(employee__employer=employer).aggregate(
+            count=Count('id'), last=Max('updated_at')
+        )
+        partnerships = ClinicEmployerPartnership.objects.filter(employer=employer).aggregate(
+            count=Count('id'), last=Max('updated_at')
+        )
+        
+        # Версия набора факторов: справочники небольшие, хешируем их целиком
+        factors = hashlib.sha1()
+        factors.update(repr(list(
+            HarmfulFactor.objects.order_by('id').values_list('id', 'name', 'periodicity_months', 'is_active')
+        )).encode())
+        factors.update(repr(list(
+            Profession.harmful_factors.through.objects.order_by('id').values_list('profession_id', 'harmfulfactor_id')
+        )).encode())
+        
+        source = '|'.join(str(part) for part in [
+            year,
+            timezone.now().date().isoformat(),
+            employees['count'], employees['last'],
+            examinations['count'], examinations['last'],
+            partnerships['count'], partnerships['last'],
+            factors.hexdigest(),
+        ])
+        return hashlib.sha256(source.encode()).hexdigest()
+    
+    @staticmethod
+    def get_appendix_3(employer: Organization, year: int) -> Document:
+        """
+        Получить Приложение 3 без пересчета, если исходные данные не менялись
+        
+        Документ переформируется только при изменении отпечатка исходных данных.
+        """
+        fingerprint = DocumentService.appendix_3_fingerprint(employer, year)
+        document = Document.objects.filter(
+            document_type=DocumentType.APPENDIX_3,
+            organization=employer,
+            year=year
+        ).first()
+        
+        if document and document.fingerprint == fingerprint:
+            return document
+        
+        return DocumentService.generate_appendix_3(employer, year, fingerprint=fingerprint)
+    
+    @staticmethod
+    def generate_appendix_3(employer: Organization, year: int, fingerprint: str = None) -> Document:
+        """
+        Генерация Приложения 3 (одновременные вызовы для одного работодателя и года
+        объединяются: формирование выполняется один раз, остальные получают его результат)
+        """
+        return single_flight(
+            flight_key(DocumentType.APPENDIX_3, employer.id, year),
+            lambda: DocumentService._generate_appendix_3(employer, year, fingerprint),
+            lambda document_id: Document.objects.filter(id=document_id).first(),
+        )
+    
+    @staticmethod
+    def _generate_appendix_3(employer: Organization, year: int, fingerprint: str = None) -> Document:
         """
         Генерация Приложения 3 - Список лиц, подлежащих осмотру
         
@@ -28,122 +105,14 @@ class DocumentService:
         Примечание: Сотрудники должны быть заранее добавлены в систему
         (вручную или через импорт Excel - Форма 3 для массового импорта)
         """
-        # Получаем всех активных сотрудников работодателя
-        employees = Employee.objects.filter(
-            employer=employer,
-            is_active=True
-        )
+        # Отпечаток снимается до чтения данных: изменения во время формирования
+        # приведут к повторному формированию при следующем запросе
+        if fingerprint is None:
+            fingerprint = DocumentService.appendix_3_fingerprint(employer, year)
         
         # АВТОМАТИЧЕСКИ формируем список сотрудников, которым нужен осмотр
-        employees_list = []
-        for employee in employees:
-            if not employee.position:
-                # Если нет должности, не включаем (нужна должность для определения факторов)
-                continue
-            
-            # Проверяем, нужен ли осмотр (по периодичности факторов)
-            factors = employee.position.harmful_factors.filter(is_active=True)
-            needs_examination = False
-            
-            # Если нет факторов - не включаем (или можно включить для общего осмотра)
-            if factors.count() == 0:
-                continue
-            
-            for factor in factors:
-                # Проверяем последний осмотр через DoctorExamination
-                from apps.medical_examinations.models import DoctorExamination
-                
-                last_doctor_exam = DoctorExamination.objects.filter(
-                    examination__employee=employee,
-                    examination__status='completed',
-                    harmful_factor=factor
-                ).select_related('examination').order_by('-examination__completed_date').first()
-                
-                if not last_doctor_exam or not last_doctor_exam.examination.completed_date:
-                    needs_examination = True
-                    break
-                else:
-                    # Проверяем периодичность
-                    months_passed = (timezone.now().date() - last_doctor_exam.examination.completed_date.date()).days // 30
-                    if months_passed >= factor.periodicity_months:
-                        needs_examination = True
-                        break
-            
-            # Также проверяем: если нет ни одного завершенного периодического осмотра за этот год
-            if not needs_examination:
-                from datetime import datetime as dt
-                year_start = timezone.make_aware(dt(year, 1, 1))
-                year_exams = MedicalExamination.objects.filter(
-                    employee=employee,
-                    examination_type='periodic',
-                    status='completed',
-                    completed_date__gte=year_start
-                ).count()
-                if year_exams == 0:
-                        needs_examination = True
-            
-            if needs_examination:
-                # Получаем полную информацию о сотруднике для таблицы (как в Excel форме)
-                # Получаем дату рождения из User (если есть) или вычисляем из ИИН
-                date_of_birth = None
-                if employee.iin and len(employee.iin) >= 6:
-                    # ИИН содержит дату рождения в формате YYMMDD
-                    try:
-                        year_prefix = '19' if int(employee.iin[0]) >= 5 else '20'
-                        birth_year = int(year_prefix + employee.iin[0:2])
-                        birth_month = int(employee.iin[2:4])
-                        birth_day = int(employee.iin[4:6])
-                        from datetime import date
-                        date_of_birth = date(birth_year, birth_month, birth_day).isoformat()
-                    except:
-                        pass
-                
-                # Получаем пол из ИИН (7-я цифра: четная = женский, нечетная = мужской)
-                gender = None
-                if employee.iin and len(employee.iin) >= 7:
-                    gender_digit = int(employee.iin[6])
-                    gender = 'Женский' if gender_digit % 2 == 0 else 'Мужской'
-                
-                # Получаем вредные факторы
-                harmful_factors_list = [f.name for f in factors]
-                harmful_factors = ', '.join(harmful_factors_list) if harmful_factors_list else '-'
-                
-                # Получаем дату последнего осмотра
-                last_exam = MedicalExamination.objects.filter(
-                    employee=employee,
-                    status='completed'
-                ).order_by('-completed_date').first()
-                last_examination_date = last_exam.completed_date.isoformat() if last_exam and last_exam.completed_date else None
-                
-                # Вычисляем стаж
-                from datetime import date
-                total_experience = None
-                position_experience = None
-                if employee.hire_date:
-                    today = date.today()
-                    total_days = (today - employee.hire_date).days
-                    total_years = total_days // 365
-                    total_months = (total_days % 365) // 30
-                    total_experience = f"{total_years} л. {total_months} м." if total_years > 0 else f"{total_months} м."
-                    
-                    # Стаж по должности (пока используем общий стаж)
-                    # TODO: можно добавить поле position_start_date в модель Employee
-                    position_experience = total_experience
-                
-                employees_list.append({
-                    'id': employee.id,
-                    'full_name': employee.full_name,
-                    'date_of_birth': date_of_birth,
-                    'gender': gender,
-                    'department': employee.department or '-',
-                    'position': employee.position.name if employee.position else 'Не указана',
-                    'total_experience': total_experience or '-',
-                    'position_experience': position_experience or '-',
-                    'last_examination_date': last_examination_date,
-                    'harmful_factors': harmful_factors,
-                    'notes': employee.notes or '',  # Примечание из модели Employee
-                    'iin': employee.iin,
-                })
+        # (множественными запросами, без обхода сотрудников по одному)
+        employees_list = EligibilityService.build_appendix_3_rows(employer, year)
         
         # Проверяем, существует ли уже Приложение 3 на этот год
         # Если существует - обновляем, если нет - создаем
@@ -153,6 +122,7 @@ class DocumentService:
             year=year,
             defaults={
                 'title': f"Список лиц, подлежащих обязательному медицинскому осмотру на {year} год",
+                'fingerprint': fingerprint,
                 'content': {
                     'employees': employees_list,
                     'total_count': len(employees_list),
@@ -164,6 +134,7 @@ class DocumentService:
         # Если документ уже существовал, обновляем его
         if not created:
             document.title = f"Список лиц, подлежащих обязательному медицинскому осмотру на {year} год"
+            document.fingerprint = fingerprint
             document.content = {
                 'employees': employees_list,
                 'total_count': len(employees_list),
@@ -197,13 +168,88 @@ class DocumentService:
         
         return document
     
+    @staticmethod
+    def update_appendix_3_row(employer: Organization, employee_id: int, year: int) -> Document:
+        """
+        Инкрементальное обновление строки сотрудника в Приложении 3
+        
+        Пересчитывает только одного сотрудника и вставляет/удаляет его строку,
+        сохраняя total_count. Если документа еще нет - формирует его полностью.
+        
+        Args:
+            employer: Работодатель
+            employee_id: ID измененного сотрудника
+            year: Год
+            
+        Returns:
+            Document объект
+        """
+        with transaction.atomic():
+            document = Document.objects.select_for_update().filter(
+                document_type=DocumentType.APPENDIX_3,
+                organization=employer,
+                year=year
+            ).first()
+            
+            if not document:
+                return DocumentService.generate_appendix_3(employer, year)
+            
+            rows = EligibilityService.build_appendix_3_rows(employer, year, employee_ids=[employee_id])
+            DocumentService._patch_appendix_3_rows(document, employee_id, rows[0] if rows else None)
+        
+        return document
+    
+    @staticmethod
+    def remove_appendix_3_row(employer_id: int, employee_id: int, year: int):
+        """
+        Удалить строку сотрудника из Приложения 3 (без пересчета остальных)
+        
+        Args:
+            employer_id: ID работодателя
+            employee_id: ID сотрудника
+            year: Год
+        """
+        with transaction.atomic():
+            document = Document.objects.select_for_update().filter(
+                document_type=DocumentType.APPENDIX_3,
+                organization_id=employer_id,
+                year=year
+            ).first()
+            
+            if document:
+                DocumentService._patch_appendix_3_rows(document, employee_id, None)
+    
+    @staticmethod
+    def _patch_appendix_3_rows(document: Document, employee_id: int, row: dict = None):
+        """Заменить строку сотрудника в содержимом документа (None - удалить)"""
+        content = document.content
+        employees = content.get('employees', [])
+        patched = [r for r in employees if r['id'] != employee_id]
+        
+        if row:
+            # Сохраняем порядок сортировки сотрудников (фамилия, имя)
+            index = next(
+                (i for i, r in enumerate(patched) if r['full_name'] > row['full_name']),
+                len(patched)
+            )
+            patched.insert(index, row)
+        elif len(patched) == len(employees):
+            # Сотрудника не было в списке - нечего менять
+            return
+        
+        content['employees'] = patched
+        content['total_count'] = len(patched)
+        document.content = content
+        document.save(update_fields=['content', 'updated_at'])
+    
     @staticmethod
     def generate_calendar_plan(
         employer: Organization,
         clinic: Organization,
         year: int,
         start_date: datetime,
-        end_date: datetime = None
+        end_date: datetime = None,
+        progress=None
     ) -> CalendarPlan:
         """
         Генерация Календарного плана проведения осмотров
@@ -214,6 +260,10 @@ class DocumentService:
         - Берет список сотрудников из уже созданного Приложения 3
         - Автоматически распределяет их по датам с учетом пропускной способности клиники
         - Создает график осмотров (календарь)
+        
+        end_date: желаемая граница - осмотры, не поместившиеся до нее, попадают
+        в past_deadline документа плана
+        progress: необязательный callback(phase, processed, total) - для фоновых заданий
         """
         # Получаем список сотрудников из Приложения 3 (уже сформированного автоматически)
         appendix_3 = Document.objects.filter(
@@ -228,93 +278,504 @@ class DocumentService:
         employees_ids = [e['id'] for e in appendix_3.content.get('employees', [])]
         employees = Employee.objects.filter(id__in=employees_ids)
         
-        # Распределяем по датам с учетом пропускной способности клиники и диапазона дат
-        capacity = clinic.capacity_per_day or 50  # По умолчанию 50 человек в день
-        plan_data = {}
-        current_date = start_date.date()
-        end_date_obj = end_date.date() if end_date else None
-        
-        employees_list = list(employees)
-        employee_index = 0
-        
-        # Распределяем сотрудников по датам в указанном диапазоне
-        while employee_index < len(employees_list):
-            # Проверяем, не вышли ли за пределы диапазона
-            if end_date_obj and current_date > end_date_obj:
-                # Если вышли за пределы диапазона, распределяем оставшихся в последний день
-                if employee_index < len(employees_list):
-                    last_date = end_date_obj
-                    if str(last_date) not in plan_data:
-                        plan_data[str(last_date)] = []
-                    # Добавляем всех оставшихся сотрудников в последний день
-                    while employee_index < len(employees_list):
-                        employee = employees_list[employee_index]
-                        plan_data[str(last_date)].append({
-                            'employee_id': employee.id,
-                            'full_name': employee.full_name,
-                            'position': employee.position.name if employee.position else 'Не указана',
-                        })
-                        employee_index += 1
-                break
+        # Распределяем по ближайшим рабочим дням со свободными местами с учетом
+        # осмотров, уже назначенных в клинику другими работодателями (ClinicDailyLoad).
+        # Строка клиники блокируется до создания осмотров, чтобы параллельно
+        # формируемые планы не заняли одни и те же места.
+        from apps.medical_examinations.services import CapacityService
+        
+        with transaction.atomic():
+            Organization.objects.select_for_update().filter(pk=clinic.pk).first()
             
-            # Инициализируем список сотрудников для текущего дня
-            if str(current_date) not in plan_data:
-                plan_data[str(current_date)] = []
+            employees_list = list(employees.select_related('position'))
+            if progress:
+                progress('scheduling', 0, len(employees_list))
+            # end_date - желаемая граница: если мест до нее не хватает, осмотры
+            # назначаются на следующие свободные дни, а не сверх capacity;
+            # такие дни сохраняются в документе плана (past_deadline)
+            allocation = CapacityService.allocate(clinic, len(employees_list), start_date.date())
+            past_deadline = CalendarPlanService.past_deadline(allocation, end_date.date()) if end_date else None
             
-            # Заполняем текущий день до capacity
-            while (len(plan_data[str(current_date)]) < capacity and 
-                   employee_index < len(employees_list)):
-                employee = employees_list[employee_index]
-                plan_data[str(current_date)].append({
-                    'employee_id': employee.id,
-                    'full_name': employee.full_name,
-                    'position': employee.position.name if employee.position else 'Не указана',
-                })
-                employee_index += 1
+            # Внутри дня - время по слотам клиники (приход распределяется по дню)
+            # (занятость слотов всех дней плана - одним запросом)
+            occupancy = CapacityService.slot_occupancy_by_day(clinic, [day for day, _ in allocation])
+            plan_data = {}
+            employee_index = 0
+            for day, count in allocation:
+                plan_data[str(day)] = CalendarPlanService.day_entries(
+                    clinic, day, employees_list[employee_index:employee_index + count], occupancy=occupancy[day]
+                )
+                employee_index += count
+            
+            calendar_plan = DocumentService._save_calendar_plan(
+                employer, clinic, year, plan_data, past_deadline=past_deadline
+            )
             
-            # Если день заполнен или все сотрудники распределены, переходим к следующему дню
-            if len(plan_data[str(current_date)]) >= capacity:
-                current_date += timedelta(days=1)
-            elif employee_index >= len(employees_list):
-                # Все сотрудники распределены, выходим из цикла
-                break
-        
-        # Если не указан end_date и остались нераспределенные сотрудники, продолжаем
-        if employee_index < len(employees_list) and not end_date_obj:
-            while employee_index < len(employees_list):
-                if str(current_date) not in plan_data:
-                    plan_data[str(current_date)] = []
+            # Автоматически создаем осмотры из календарного плана
+            DocumentService.create_examinations_from_calendar_plan(calendar_plan, progress=progress)
+        
+        return calendar_plan
+    
+    @staticmethod
+    def generate_split_calendar_plans(
+        employer: Organization,
+        year: int,
+        start_date: datetime,
+        end_date: datetime = None,
+        objective: str = 'cost',
+        progress=None
+    ) -> tuple:
+        """
+        Распределение Приложения 3 по всем активным клиникам-партнерам
+        
+        Места берутся из свободной загрузки каждой клиники (ClinicDailyLoad,
+        capacity_per_day), цена - из партнерства (pricing["periodic_exam"] или
+        default_price). Цель 'cost' - минимальная стоимость с завершением до
+        end_date (по умолчанию - до конца года start_date), 'date' - самое
+        раннее завершение. По каждой клинике создается свой план и осмотры.
+        Осмотры позже deadline считаются в past_deadline сводки и документов планов.
+        
+        Returns:
+            ([calendar_plan, ...], {'total_cost', 'completion_date', 'past_deadline', 'clinics': [...]})
+        """
+        from apps.organizations.models import ClinicEmployerPartnership
+        from apps.medical_examinations.services import CapacityService
+        
+        appendix_3 = Document.objects.filter(
+            document_type=DocumentType.APPENDIX_3,
+            organization=employer,
+            year=year
+        ).first()
+        if not appendix_3:
+            raise ValueError("Сначала нужно сформировать Приложение 3")
+        if CalendarPlan.objects.filter(employer=employer, year=year).exists():
+            raise ValueError("Календарный план на этот год уже есть: используйте перепланирование по клиникам")
+        
+        partnerships = [
+            partnership for partnership in ClinicEmployerPartnership.objects.filter(
+                employer=employer,
+                status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+            ).select_related('clinic').order_by('clinic_id')
+            if partnership.is_active()
+        ]
+        if not partnerships:
+            raise ValueError("Нет активных партнерств с клиниками")
+        
+        employees_ids = [e['id'] for e in appendix_3.content.get('employees', [])]
+        start_day = start_date.date()
+        if end_date:
+            deadline = end_date.date()
+        else:
+            deadline = start_day.replace(month=12, day=31) if objective == 'cost' else None
+        
+        with transaction.atomic():
+            # Блокировка клиник в порядке id - параллельные планы не займут одни места и не заблокируют друг друга
+            list(Organization.objects.select_for_update().filter(
+                id__in=[p.clinic_id for p in partnerships]
+            ).order_by('id'))
+            
+            employees = Employee.objects.filter(id__in=employees_ids).select_related('position').in_bulk()
+            employees_list = [employees[employee_id] for employee_id in employees_ids if employee_id in employees]
+            if progress:
+                progress('scheduling', 0, len(employees_list))
+            
+            prices = {p.clinic_id: p.price_for('periodic_exam') for p in partnerships}
+            allocation = CalendarPlanService.split_allocation(
+                [(p.clinic_id, prices[p.clinic_id], CapacityService.free_days(p.clinic, start_day)) for p in partnerships],
+                len(employees_list),
+                objective=objective,
+                deadline=deadline,
+            )
+            
+            plans = []
+            clinics_summary = []
+            index = 0
+            for partnership in partnerships:
+                days = allocation.get(partnership.clinic_id)
+                if not days:
+                    continue
+                occupancy = CapacityService.slot_occupancy_by_day(partnership.clinic, [day for day, _ in days])
+                plan_data = {}
+                for day, count in days:
+                    plan_data[str(day)] = CalendarPlanService.day_entries(
+                        partnership.clinic, day, employees_list[index:index + count], occupancy=occupancy[day]
+                    )
+                    index += count
                 
-                while (len(plan_data[str(current_date)]) < capacity and 
-                       employee_index < len(employees_list)):
-                    employee = employees_list[employee_index]
-                    plan_data[str(current_date)].append({
-                        'employee_id': employee.id,
-                        'full_name': employee.full_name,
-                        'position': employee.position.name if employee.position else 'Не указана',
-                    })
-                    employee_index += 1
+                past_deadline = CalendarPlanService.past_deadline(days, deadline) if deadline else None
+                calendar_plan = DocumentService._save_calendar_plan(
+                    employer, partnership.clinic, year, plan_data, past_deadline=past_deadline
+                )
+                DocumentService.create_examinations_from_calendar_plan(calendar_plan, progress=progress)
+                plans.append(calendar_plan)
                 
-                if len(plan_data[str(current_date)]) >= capacity:
-                    current_date += timedelta(days=1)
+                assigned = sum(count for _, count in days)
+                clinics_summary.append({
+                    'clinic_id': partnership.clinic_id,
+                    'clinic_name': partnership.clinic.name,
+                    'plan_id': calendar_plan.id,
+                    'count': assigned,
+                    'price': str(prices[partnership.clinic_id]),
+                    'cost': str(prices[partnership.clinic_id] * assigned),
+                    'first_date': days[0][0].isoformat(),
+                    'last_date': days[-1][0].isoformat(),
+                    'past_deadline': past_deadline['count'] if past_deadline else 0,
+                })
+        
+        return plans, {
+            'objective': objective,
+            'total_cost': str(sum(prices[c['clinic_id']] * c['count'] for c in clinics_summary)),
+            'completion_date': max(c['last_date'] for c in clinics_summary) if clinics_summary else None,
+            'deadline': deadline.isoformat() if deadline else None,
+            'past_deadline': sum(c['past_deadline'] for c in clinics_summary),
+            'clinics': clinics_summary,
+        }
+    
+    @staticmethod
+    def replan_calendar_plan(
+        employer: Organization,
+        clinic: Organization,
+        year: int,
+        start_date: datetime = None,
+        progress=None
+    ) -> tuple:
+        """
+        Перепланирование существующего календарного плана по разнице с Приложением 3
+        
+        Новые сотрудники Приложения 3 записываются на ближайшие свободные дни
+        (начиная со start_date), у выбывших отменяются еще не начатые осмотры плана.
+        Остальные записи, осмотры и уведомления не затрагиваются, поэтому объем
+        работы пропорционален изменению, а не размеру плана.
+        
+        progress: необязательный callback(phase, processed, total)
+        
+        Returns:
+            (calendar_plan, {'added': ..., 'removed': ..., 'cancelled': ..., 'kept': ...})
+        """
+        from apps.medical_examinations.services import CapacityService
         
-        # Удаляем пустые дни из плана
-        plan_data = {date: employees for date, employees in plan_data.items() if employees}
+        calendar_plan = CalendarPlan.objects.filter(employer=employer, clinic=clinic, year=year).select_related(
+            'employer', 'clinic', 'document'
+        ).first()
+        if not calendar_plan:
+            raise ValueError("Календарный план этой клиники не найден: сначала сформируйте его")
+        
+        appendix_3 = Document.objects.filter(
+            document_type=DocumentType.APPENDIX_3,
+            organization=employer,
+            year=year
+        ).first()
+        if not appendix_3:
+            raise ValueError("Сначала нужно сформировать Приложение 3")
+        
+        appendix_ids = [e['id'] for e in appendix_3.content.get('employees', [])]
+        # При распределении по нескольким клиникам сотрудники других планов не считаются новыми
+        other_plans = set(CalendarSlot.objects.filter(
+            plan__employer=employer, plan__year=year
+        ).exclude(plan=calendar_plan).values_list('employee_id', flat=True))
+        appendix_ids = [employee_id for employee_id in appendix_ids if employee_id not in other_plans]
+        today = timezone.localdate()
+        start_day = max(start_date.date(), today) if start_date else today
+        
+        with transaction.atomic():
+            Organization.objects.select_for_update().filter(pk=clinic.pk).first()
+            
+            planned = dict(calendar_plan.slots.values_list('employee_id', 'date'))
+            appendix_set = set(appendix_ids)
+            added_ids = [employee_id for employee_id in dict.fromkeys(appendix_ids) if employee_id not in planned]
+            removed = {employee_id: day for employee_id, day in planned.items() if employee_id not in appendix_set}
+            if progress:
+                progress('scheduling', 0, len(added_ids) + len(removed))
+            
+            # Выбывшие: отменяем не начатые осмотры на дату их записи (место в клинике освобождается сигналом)
+            cancelled = 0
+            if removed:
+                examinations = MedicalExamination.objects.filter(
+                    employer=employer,
+                    clinic=clinic,
+                    employee_id__in=removed,
+                    examination_type='periodic',
+                    status='scheduled',
+                )
+                for examination in examinations:
+                    if timezone.localtime(examination.scheduled_date).date() == removed[examination.employee_id]:
+                        examination.status = 'cancelled'
+                        examination.save(update_fields=['status', 'updated_at'])
+                        cancelled += 1
+                calendar_plan.slots.filter(employee_id__in=removed).delete()
+            
+            # Новые: только в свободные места, начиная с start_day
+            entries = []
+            if added_ids:
+                employees = Employee.objects.select_related('user', 'position').in_bulk(added_ids)
+                added = [employees[employee_id] for employee_id in added_ids if employee_id in employees]
+                allocation = CapacityService.allocate(clinic, len(added), start_day)
+                occupancy = CapacityService.slot_occupancy_by_day(clinic, [day for day, _ in allocation])
+                assignments = []
+                index = 0
+                for day, count in allocation:
+                    times = CapacityService.slot_times(clinic, day, count, occupancy=occupancy[day])
+                    for employee, slot_time in zip(added[index:index + count], times):
+                        assignments.append((employee.id, day, slot_time))
+                        entries.append((employee, DocumentService._plan_datetime(day, slot_time)))
+                    index += count
+                CalendarPlanService.add_slots(calendar_plan, assignments)
+            
+            CalendarPlanService.refresh_plan_data(calendar_plan)
+            if entries:
+                DocumentService._schedule_plan_examinations(calendar_plan, entries, progress=progress)
         
-        # Проверяем, существует ли уже календарный план на этот год для этого работодателя
+        return calendar_plan, {
+            'added': len(entries),
+            'removed': len(removed),
+            'cancelled': cancelled,
+            'kept': len(planned) - len(removed),
+        }
+    
+    # Операции точечной правки календарного плана
+    PLAN_OPERATIONS = ('move', 'swap', 'remove')
+    
+    @staticmethod
+    def _parse_plan_operation(operation) -> dict:
+        """Проверить операцию правки плана, вернуть с приведенными типами"""
+        if not isinstance(operation, dict) or operation.get('op') not in DocumentService.PLAN_OPERATIONS:
+            raise ValueError(f"Неизвестная операция: {operation}. Допустимо: move, swap, remove")
+        try:
+            parsed = {'op': operation['op'], 'employee_id': int(operation['employee_id'])}
+            if operation['op'] == 'move':
+                parsed['date'] = date.fromisoformat(str(operation['date']))
+                parsed['time'] = time.fromisoformat(str(operation['time'])) if operation.get('time') else None
+            elif operation['op'] == 'swap':
+                parsed['with_employee_id'] = int(operation['with_employee_id'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                f"Неверная операция {operation}: move - employee_id, date (YYYY-MM-DD), time (HH:MM, необязательно); "
+                f"swap - employee_id, with_employee_id; remove - employee_id"
+            )
+        return parsed
+    
+    @staticmethod
+    def apply_calendar_plan_operations(calendar_plan: CalendarPlan, operations: list) -> dict:
+        """
+        Точечная правка календарного плана (без пересылки всего plan_data)
+        
+        Операции выполняются по порядку, все или ни одной:
+        - move: {"op": "move", "employee_id": ID, "date": "YYYY-MM-DD", "time": "HH:MM"} -
+          перенос (без time - в наименее занятый слот дня);
+        - swap: {"op": "swap", "employee_id": ID, "with_employee_id": ID} - обмен днем и временем;
+        - remove: {"op": "remove", "employee_id": ID} - исключение из плана (осмотр отменяется).
+        
+        Проверяются рабочие дни и свободные места в днях и слотах клиники (под
+        блокировкой строки клиники, как у других планировщиков). Записи,
+        осмотры и plan_data меняются только у затронутых сотрудников, в одной
+        транзакции; уведомления ставятся в очередь только им.
+        
+        Returns:
+            {'moved': ..., 'removed': ..., 'examinations_updated': ..., 'notified': ...}
+        
+        Raises:
+            ValueError: неверная операция, сотрудник не в плане, осмотр уже начат, нет мест
+        """
+        from apps.medical_examinations.models import ClinicDailyLoad
+        from apps.medical_examinations.services import CapacityService
+        
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("Укажите непустой список операций operations")
+        parsed = [DocumentService._parse_plan_operation(operation) for operation in operations]
+        employee_ids = {op['employee_id'] for op in parsed} | {
+            op['with_employee_id'] for op in parsed if op['op'] == 'swap'
+        }
+        today = timezone.localdate()
+        
+        with transaction.atomic():
+            # Блокировка клиники (как при формировании и перепланировании), затем плана:
+            # правки разных планов клиники и формирование планов не займут одни и те же места
+            Organization.objects.select_for_update().filter(pk=calendar_plan.clinic_id).first()
+            calendar_plan = CalendarPlan.objects.select_for_update().select_related(
+                'employer', 'clinic', 'document'
+            ).get(id=calendar_plan.id)
+            clinic = calendar_plan.clinic
+            slots = {
+                slot.employee_id: slot
+                for slot in calendar_plan.slots.filter(employee_id__in=employee_ids).select_related(
+                    'employee__user', 'employee__position'
+                )
+            }
+            missing = sorted(employee_ids - set(slots))
+            if missing:
+                raise ValueError(f"Сотрудники не записаны в план: {', '.join(map(str, missing))}")
+            
+            # Состояние записи: (день, время) или None - исключен; время None - подобрать слот
+            slot_starts = CapacityService.slot_starts(clinic)
+            original = {employee_id: (slot.date, slot.time) for employee_id, slot in slots.items()}
+            state = dict(original)
+            for op in parsed:
+                involved = [op['employee_id']] + ([op['with_employee_id']] if op['op'] == 'swap' else [])
+                for employee_id in involved:
+                    if state[employee_id] is None:
+                        raise ValueError(f"Сотрудник {employee_id} уже исключен из плана предыдущей операцией")
+                if op['op'] == 'move':
+                    if op['date'] < today or not CapacityService.is_working_day(op['date']):
+                        raise ValueError(f"{op['date'].isoformat()}: перенос возможен только на будущий рабочий день")
+                    if op['time'] is not None and op['time'] not in slot_starts:
+                        raise ValueError(f"{op['time'].strftime('%H:%M')}: время не совпадает с началом слота клиники")
+                    state[op['employee_id']] = (op['date'], op['time'])
+                elif op['op'] == 'swap':
+                    first, second = involved
+                    state[first], state[second] = state[second], state[first]
+                else:
+                    state[op['employee_id']] = None
+            changed = [employee_id for employee_id in sorted(state) if state[employee_id] != original[employee_id]]
+            if not changed:
+                return {'moved': 0, 'removed': 0, 'examinations_updated': 0, 'notified': 0}
+            
+            # Осмотры плана затронутых сотрудников - на дату их записи
+            examinations = {}
+            for examination in MedicalExamination.objects.filter(
+                employer=calendar_plan.employer,
+                clinic=clinic,
+                employee_id__in=changed,
+                examination_type='periodic',
+            ).exclude(status='cancelled'):
+                if timezone.localtime(examination.scheduled_date).date() == original[examination.employee_id][0]:
+                    examinations[examination.employee_id] = examination
+            started = sorted(
+                employee_id for employee_id, examination in examinations.items() if examination.status != 'scheduled'
+            )
+            if started:
+                raise ValueError(f"Осмотр уже начат или завершен: {', '.join(map(str, started))}")
+            
+            # Места в днях: учитывается только разница (ушедшие освобождают места)
+            leaving = {}
+            for employee_id, examination in examinations.items():
+                leaving.setdefault(original[employee_id][0], []).append(
+                    CapacityService.slot_start(slot_starts, timezone.localtime(examination.scheduled_date).time())
+                )
+            arriving = {}
+            for employee_id in changed:
+                if state[employee_id] is not None:
+                    arriving.setdefault(state[employee_id][0], []).append(employee_id)
+            capacity = CapacityService.daily_capacity(clinic)
+            booked = dict(ClinicDailyLoad.objects.filter(clinic=clinic, date__in=arriving).values_list('date', 'booked'))
+            for day in sorted(arriving):
+                if booked.get(day, 0) - len(leaving.get(day, [])) + len(arriving[day]) > capacity:
+                    raise ValueError(f"{day.isoformat()}: нет свободных мест (занято {booked.get(day, 0)} из {capacity})")
+            
+            # Места в слотах: сначала заданное время, затем наименее занятые слоты
+            slot_capacity = CapacityService.slot_capacity(clinic)
+            occupancy_by_day = CapacityService.slot_occupancy_by_day(clinic, arriving)
+            for day in sorted(arriving):
+                occupancy = occupancy_by_day[day]
+                for start in leaving.get(day, []):
+                    occupancy[start] -= 1
+                ordered = sorted(arriving[day], key=lambda employee_id: state[employee_id][1] is None)
+                for employee_id in ordered:
+                    slot_time = state[employee_id][1]
+                    if slot_time is None:
+                        slot_time = min(occupancy, key=lambda start: (occupancy[start], start))
+                    elif occupancy.get(slot_time, 0) >= slot_capacity:
+                        raise ValueError(
+                            f"{day.isoformat()} {slot_time.strftime('%H:%M')}: в слоте нет свободных мест"
+                        )
+                    occupancy[slot_time] = occupancy.get(slot_time, 0) + 1
+                    state[employee_id] = (day, slot_time)
+            
+            # Записи плана
+            removed = [employee_id for employee_id in changed if state[employee_id] is None]
+            moved = [employee_id for employee_id in changed if state[employee_id] is not None]
+            for employee_id in moved:
+                slots[employee_id].date, slots[employee_id].time = state[employee_id]
+            if removed:
+                CalendarSlot.objects.filter(plan=calendar_plan, employee_id__in=removed).delete()
+            if moved:
+                CalendarSlot.objects.bulk_update([slots[employee_id] for employee_id in moved], ['date', 'time'])
+            CalendarPlanService.patch_plan_data(
+                calendar_plan, {employee_id: None if employee_id in removed else slots[employee_id] for employee_id in changed}
+            )
+            
+            # Осмотры: сохранение по одному - загрузка клиники переносится сигналом
+            for employee_id, examination in examinations.items():
+                if state[employee_id] is None:
+                    examination.status = 'cancelled'
+                    examination.save(update_fields=['status', 'updated_at'])
+                else:
+                    examination.scheduled_date = DocumentService._plan_datetime(*state[employee_id])
+                    examination.save(update_fields=['scheduled_date', 'updated_at'])
+            
+            notified = DocumentService._notify_plan_changes(
+                clinic, [(slots[employee_id], state[employee_id], examinations.get(employee_id)) for employee_id in changed]
+            )
+        
+        return {
+            'moved': len(moved),
+            'removed': len(removed),
+            'examinations_updated': len(examinations),
+            'notified': notified,
+        }
+    
+    @staticmethod
+    def _notify_plan_changes(clinic: Organization, changes: list) -> int:
+        """
+        Уведомить сотрудников о переносе или отмене записи (через очередь)
+        
+        Args:
+            changes: [(запись плана, (день, время) или None - исключен, осмотр или None), ...]
+        """
+        from apps.authentication.services import NotificationService
+        
+        notifications = []
+        for slot, new_state, examination in changes:
+            employee = slot.employee
+            if not employee.user.phone_number:
+                continue
+            if new_state is None:
+                message = (
+                    f"Ваша запись на медицинский осмотр в клинике {clinic.name} отменена.\n"
+                    f"Работодатель сообщит о новой дате."
+                )
+            else:
+                day, slot_time = new_state
+                message = (
+                    f"Дата вашего медицинского осмотра изменена.\n"
+                    f"📅 Дата: {day.strftime('%d.%m.%Y')}\n"
+                    f"⏰ Время: {slot_time.strftime('%H:%M')}\n"
+                    f"🏥 Клиника: {clinic.name}\n"
+                    f"📍 Адрес: {clinic.address or 'Уточните в клинике'}"
+                )
+                if examination is not None:
+                    message += f"\n🔐 Ваш QR-код для доступа:\n{examination.qr_code}"
+            # Без ключа: каждая правка - отдельное уведомление
+            notifications.append((employee.user.phone_number, message, None))
+        NotificationService.enqueue_many(notifications)
+        return len(notifications)
+    
+    @staticmethod
+    def _save_calendar_plan(
+        employer: Organization,
+        clinic: Organization,
+        year: int,
+        plan_data: dict,
+        past_deadline: dict = None
+    ) -> CalendarPlan:
+        """
+        Сохранить календарный план и его документ
+        
+        past_deadline: осмотры позже запрошенной границы (CalendarPlanService.past_deadline) -
+        сохраняются в документе, чтобы клиент видел, что план вышел за end_date
+        """
+        # Проверяем, существует ли уже календарный план клиники на этот год для этого работодателя
         # Если существует - обновляем его, если нет - создаем новый
         calendar_plan, created = CalendarPlan.objects.get_or_create(
             employer=employer,
+            clinic=clinic,
             year=year,
             defaults={
-                'clinic': clinic,
                 'plan_data': plan_data
             }
         )
         
         # Если план уже существовал, обновляем его данные
         if not created:
-            calendar_plan.clinic = clinic
             calendar_plan.plan_data = plan_data
             calendar_plan.save()
         
@@ -327,6 +788,7 @@ class DocumentService:
                 'plan_data': plan_data,
                 'clinic_name': clinic.name,
                 'generated_at': timezone.now().isoformat(),
+                'past_deadline': past_deadline,
             }
             document.save()
         else:
@@ -340,79 +802,109 @@ class DocumentService:
                     'plan_data': plan_data,
                     'clinic_name': clinic.name,
                     'generated_at': timezone.now().isoformat(),
+                    'past_deadline': past_deadline,
                 }
             )
             calendar_plan.document = document
             calendar_plan.save()
         
-        # Автоматически создаем осмотры из календарного плана
-        DocumentService.create_examinations_from_calendar_plan(calendar_plan)
+        # Нормализованные записи плана (CalendarSlot) - по разнице с текущими
+        CalendarPlanService.sync_slots(calendar_plan)
         
         return calendar_plan
     
     @staticmethod
-    def create_examinations_from_calendar_plan(calendar_plan: CalendarPlan):
+    def create_examinations_from_calendar_plan(calendar_plan: CalendarPlan, progress=None):
         """
         Автоматически создает осмотры из календарного плана и отправляет уведомления
         
         Args:
             calendar_plan: Календарный план
+            progress: Необязательный callback(phase, processed, total)
+        """
+        plan_data = calendar_plan.plan_data
+        
+        # Все сотрудники плана загружаются одним запросом
+        employee_ids = [
+            emp_data['employee_id']
+            for employees_list in plan_data.values()
+            for emp_data in employees_list
+        ]
+        employees = Employee.objects.select_related('user', 'position').in_bulk(employee_ids)
+        
+        entries = []
+        for date_str, employees_list in plan_data.items():
+            # Парсим дату
+            scheduled_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            for emp_data in employees_list:
+                employee = employees.get(emp_data['employee_id'])
+                if employee is not None:
+                    # Время слота из плана; в старых планах его нет - начало приема клиники
+                    slot_time = CalendarPlanService.entry_time(emp_data) or calendar_plan.clinic.exam_day_start
+                    entries.append((employee, DocumentService._plan_datetime(scheduled_date, slot_time)))
+        
+        return DocumentService._schedule_plan_examinations(calendar_plan, entries, progress=progress)
+    
+    @staticmethod
+    def _plan_datetime(scheduled_date, slot_time):
+        """Дата и время осмотра по плану (начало слота записи)"""
+        return timezone.make_aware(datetime.combine(scheduled_date, slot_time))
+    
+    @staticmethod
+    def _schedule_plan_examinations(
+        calendar_plan: CalendarPlan,
+        entries: list,
+        progress=None,
+        chunk_size: int = 1000
+    ) -> list:
+        """
+        Создать осмотры плана и поставить уведомления в очередь
+        
+        Args:
+            entries: [(сотрудник с загруженными user и position, дата и время осмотра), ...]
+            progress: Необязательный callback(phase, processed, total) - после каждой пачки
         """
         from apps.medical_examinations.services import ExaminationService
-        from apps.authentication.services import GreenAPIService
+        from apps.authentication.services import NotificationService
         
-        plan_data = calendar_plan.plan_data
         employer = calendar_plan.employer
         clinic = calendar_plan.clinic
         
+        # Осмотры, маршрутные листы и врачи маршрутов создаются пакетно
         examinations_created = []
+        for index in range(0, len(entries), chunk_size):
+            examinations_created += ExaminationService.bulk_create_examinations(
+                clinic, employer, entries[index:index + chunk_size], examination_type='periodic'
+            )
+            if progress:
+                progress('examinations', len(examinations_created), len(entries))
         
-        for date_str, employees_list in plan_data.items():
-            # Парсим дату
-            from datetime import datetime as dt
-            scheduled_date = dt.strptime(date_str, '%Y-%m-%d').date()
-            # Устанавливаем время на 9:00
-            scheduled_datetime = timezone.make_aware(
-                dt.combine(scheduled_date, dt.min.time().replace(hour=9))
+        # Уведомления сотрудникам с QR-кодом - через очередь (уходят после фиксации транзакции).
+        # Ключ по (сотрудник, клиника, дата): повторное формирование плана не дублирует уведомления
+        notifications = []
+        for examination in examinations_created:
+            employee = examination.employee
+            if not employee.user.phone_number:
+                continue
+            scheduled_at = timezone.localtime(examination.scheduled_date)
+            scheduled_date = scheduled_at.date()
+            message = (
+                f"Вам назначен обязательный медицинский осмотр.\n"
+                f"📅 Дата: {scheduled_date.strftime('%d.%m.%Y')}\n"
+                f"⏰ Время: {scheduled_at.strftime('%H:%M')}\n"
+                f"🏥 Клиника: {clinic.name}\n"
+                f"📍 Адрес: {clinic.address or 'Уточните в клинике'}\n"
+                f"🔐 Ваш QR-код для доступа:\n{examination.qr_code}\n\n"
+                f"Приходите в клинику и покажите QR-код регистратору."
             )
-            
-            for emp_data in employees_list:
-                try:
-                    employee = Employee.objects.get(id=emp_data['employee_id'])
-                    
-                    # Создаем осмотр
-                    examination = ExaminationService.create_examination(
-                        employee=employee,
-                        examination_type='periodic',
-                        clinic=clinic,
-                        scheduled_date=scheduled_datetime,
-                        employer=employer
-                    )
-                    examinations_created.append(examination)
-                    
-                    # Отправляем уведомление сотруднику с QR-кодом
-                    if employee.user.phone_number:
-                        message = (
-                            f"Вам назначен обязательный медицинский осмотр.\n"
-                            f"📅 Дата: {scheduled_date.strftime('%d.%m.%Y')}\n"
-                            f"🏥 Клиника: {clinic.name}\n"
-                            f"📍 Адрес: {clinic.address or 'Уточните в клинике'}\n"
-                            f"🔐 Ваш QR-код для доступа:\n{examination.qr_code}\n\n"
-                            f"Приходите в клинику и покажите QR-код регистратору."
-                        )
-                        try:
-                            GreenAPIService.send_whatsapp_message(
-                                employee.user.phone_number,
-                                message
-                            )
-                        except Exception as e:
-                            # Логируем ошибку, но не прерываем процесс
-                            import logging
-                            logger = logging.getLogger(__name__)
-                            logger.error(f"Ошибка отправки уведомления: {e}")
-                
-                except Employee.DoesNotExist:
-                    continue
+            notifications.append((
+                employee.user.phone_number,
+                message,
+                f"exam-scheduled:{employee.id}:{clinic.id}:{scheduled_date.isoformat()}"
+            ))
+        NotificationService.enqueue_many(notifications)
+        if progress:
+            progress('notifications', len(notifications), len(notifications))
         
         return examinations_created
     
@@ -421,6 +913,21 @@ class DocumentService:
         employer: Organization,
         clinic: Organization,
         year: int
+    ) -> Document:
+        """
+        Генерация Заключительного акта (одновременные вызовы объединяются)
+        """
+        return single_flight(
+            flight_key(DocumentType.FINAL_ACT, employer.id, clinic.id, year),
+            lambda: DocumentService._generate_final_act(employer, clinic, year),
+            lambda document_id: Document.objects.filter(id=document_id).first(),
+        )
+    
+    @staticmethod
+    def _generate_final_act(
+        employer: Organization,
+        clinic: Organization,
+        year: int
     ) -> Document:
         """
         Генерация Заключительного акта по результатам осмотров
@@ -646,3 +1153,113 @@ class DocumentService:
         
         return certificate
 
+
+class DocumentQueueService:
+    """
+    Очередь отложенного переформирования документов
+    
+    Сигналы только помечают (тип документа, организация, год) как устаревшие.
+    Воркер (process_document_queue) объединяет повторные отметки и
+    переформирует документ один раз после периода тишины. Неудачные попытки
+    повторяются с экспоненциальной задержкой, после max_attempts запрос
+    остается в очереди с last_error до новой отметки (mark_dirty) или ручного
+    повтора (--retry-failed).
+    """
+    
+    @staticmethod
+    def mark_dirty(document_type: str, organization_id: int, year: int):
+        """
+        Пометить документ как требующий переформирования
+        
+        Новая отметка снимает задержку повтора и счетчик неудач: после новых
+        изменений данных запрос снова обрабатывается, даже если попытки исчерпаны.
+        """
+        now = timezone.now()
+        lookup = {
+            'document_type': document_type,
+            'organization_id': organization_id,
+            'year': year,
+        }
+        rearm = {'requested_at': now, 'attempts': 0, 'next_attempt_at': None}
+        
+        if DocumentRegenerationRequest.objects.filter(**lookup).update(**rearm):
+            return
+        
+        try:
+            with transaction.atomic():
+                DocumentRegenerationRequest.objects.create(requested_at=now, **lookup)
+        except IntegrityError:
+            # Параллельный запрос уже создал отметку (или организация уже удалена)
+            DocumentRegenerationRequest.objects.filter(**lookup).update(**rearm)
+    
+    @staticmethod
+    def regenerate(request: DocumentRegenerationRequest) -> Document:
+        """Переформировать документ по запросу из очереди"""
+        if request.document_type == DocumentType.APPENDIX_3:
+            return DocumentService.generate_appendix_3(request.organization, request.year)
+        raise ValueError(f"Неподдерживаемый тип документа: {request.document_type}")
+    
+    @staticmethod
+    def process_due(
+        quiet_seconds: int = 30,
+        max_delay_seconds: int = 600,
+        limit: int = 100,
+        retry_seconds: int = 60,
+        max_attempts: int = 5
+    ) -> dict:
+        """
+        Обработать запросы, по которым не было новых отметок quiet_seconds секунд
+        (или которые ждут дольше max_delay_seconds)
+        
+        После ошибки запрос откладывается на retry_seconds * 2^(попытка - 1) и не
+        занимает место в проходе до next_attempt_at; после max_attempts неудач
+        больше не выбирается.
+        
+        Returns:
+            {'processed': int, 'failed': int}
+        """
+        now = timezone.now()
+        due = DocumentRegenerationRequest.objects.filter(
+            Q(requested_at__lte=now - timedelta(seconds=quiet_seconds)) |
+            Q(first_requested_at__lte=now - timedelta(seconds=max_delay_seconds)),
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+            attempts__lt=max_attempts,
+        ).select_related('organization').order_by('first_requested_at')[:limit]
+        
+        stats = {'processed': 0, 'failed': 0}
+        for request in due:
+            started_at = timezone.now()
+            try:
+                DocumentQueueService.regenerate(request)
+            except Exception as e:
+                # Повтор - с экспоненциальной задержкой по числу неудач
+                DocumentRegenerationRequest.objects.filter(pk=request.pk).update(
+                    attempts=F('attempts') + 1,
+                    last_error=str(e),
+                    next_attempt_at=timezone.now() + timedelta(seconds=retry_seconds * 2 ** request.attempts)
+                )
+                stats['failed'] += 1
+                continue
+            
+            # Удаляем запрос, только если за время генерации не пришло новых отметок
+            deleted, _ = DocumentRegenerationRequest.objects.filter(
+                pk=request.pk,
+                requested_at=request.requested_at
+            ).delete()
+            if not deleted:
+                DocumentRegenerationRequest.objects.filter(pk=request.pk).update(
+                    first_requested_at=started_at,
+                    attempts=0,
+                    next_attempt_at=None
+                )
+            stats['processed'] += 1
+        
+        return stats
+    
+    @staticmethod
+    def retry_failed() -> int:
+        """Вернуть в очередь запросы, исчерпавшие попытки (после исправления причины ошибки)"""
+        return DocumentRegenerationRequest.objects.filter(attempts__gt=0).update(
+            attempts=0,
+            next_attempt_at=None
+        )
@@ -0,0 +1,129 @@
+"""
+Single-flight: объединение одновременных одинаковых запросов формирования документа
+
+Первый вызов по ключу (тип документа, организация, год) захватывает
+блокировку в кэше (cache.add - атомарно и в Redis, и в locmem) и формирует
+документ. Остальные вызовы ждут снятия блокировки и получают тот же документ
+по ID, сохраненному ведущим вызовом. Если ведущий упал или ожидание истекло,
+ожидающий формирует документ сам.
+
+Если ведущий выполняется внутри транзакции, ID публикуется и блокировка
+снимается только после ее фиксации (transaction.on_commit): иначе ожидающие
+загрузили бы еще не видимый им документ и сформировали бы дубликат.
+"""
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_LOCK_PREFIX = 'singleflight:lock:'
+_RESULT_PREFIX = 'singleflight:result:'
+# Сколько хранить ID результата для ожидающих
+_RESULT_TTL_SECONDS = 60
+# Блокировки этого потока, ждущие фиксации транзакции: {lock_key: token}
+_pending = threading.local()
+
+
+def _pending_locks() -> dict:
+    if not hasattr(_pending, 'locks'):
+        _pending.locks = {}
+    return _pending.locks
+
+
+def flight_key(document_type: str, *parts) -> str:
+    return ':'.join(str(part) for part in (document_type, *parts))
+
+
+def single_flight(key: str, compute, load, poll_interval: float = 0.05):
+    """
+    Выполнить compute() один раз для всех одновременных вызовов с этим ключом
+
+    Args:
+        key: Ключ (см. flight_key)
+        compute: Функция формирования, возвращает модель с полем id
+        load: Функция загрузки результата по ID (для ожидающих вызовов)
+
+    Returns:
+        Результат compute() ведущего вызова
+    """
+    lock_seconds = getattr(settings, 'DOCUMENT_SINGLE_FLIGHT_LOCK_SECONDS', 120)
+    wait_seconds = getattr(settings, 'DOCUMENT_SINGLE_FLIGHT_WAIT_SECONDS', 60)
+    lock_key = _LOCK_PREFIX + key
+    deadline = time.monotonic() + wait_seconds
+
+    while True:
+        token = uuid.uuid4().hex
+        try:
+            acquired = cache.add(lock_key, token, timeout=lock_seconds)
+        except Exception as e:
+            # Кэш недоступен - формируем без объединения
+            logger.warning(f"Single-flight недоступен ({key}): {e}")
+            return compute()
+
+        if acquired:
+            return _lead(lock_key, token, compute)
+
+        leader_token = cache.get(lock_key)
+        own_token = _pending_locks().get(lock_key)
+        if own_token is not None and leader_token == own_token:
+            # Блокировка наша и ждет фиксации текущей транзакции - ждать себя нельзя
+            return _lead(lock_key, own_token, compute)
+        while leader_token is not None and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 0.5)
+            current = cache.get(lock_key)
+            if current != leader_token:
+                break
+
+        if leader_token is not None:
+            result_id = cache.get(_RESULT_PREFIX + leader_token)
+            if result_id is not None:
+                result = load(result_id)
+                if result is not None:
+                    return result
+
+        if time.monotonic() >= deadline:
+            logger.warning(f"Single-flight: истекло ожидание ({key}), формируем самостоятельно")
+            return compute()
+        # Ведущий завершился без результата - пробуем стать ведущим
+
+
+def _lead(lock_key: str, token: str, compute):
+    try:
+        result = compute()
+    except Exception:
+        _release(lock_key, token)
+        raise
+
+    result_id = result.id
+    if connection.in_atomic_block:
+        # Документ станет виден ожидающим только после фиксации транзакции
+        _pending_locks()[lock_key] = token
+        transaction.on_commit(lambda: _publish(lock_key, token, result_id))
+    else:
+        _publish(lock_key, token, result_id)
+    return result
+
+
+def _publish(lock_key: str, token: str, result_id):
+    try:
+        cache.set(_RESULT_PREFIX + token, result_id, timeout=_RESULT_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Single-flight: не удалось сохранить результат {lock_key}: {e}")
+    _release(lock_key, token)
+
+
+def _release(lock_key: str, token: str):
+    if _pending_locks().get(lock_key) == token:
+        del _pending_locks()[lock_key]
+    try:
+        # Снимаем только свою блокировку (чужую могли захватить после истечения TTL)
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    except Exception as e:
+        logger.warning(f"Single-flight: не удалось снять блокировку {lock_key}: {e}")
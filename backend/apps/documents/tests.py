@@ -1,15 +1,15 @@
 """
 Tests for documents app - Проверка логики Приказа 131
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import datetime, timedelta
 from apps.organizations.models import Organization, Employee, ClinicEmployerPartnership
 from apps.compliance.models import Profession, HarmfulFactor
 from apps.medical_examinations.models import MedicalExamination
-from .models import Document, DocumentType, CalendarPlan
-from .services import DocumentService
+from .models import Document, DocumentType, CalendarPlan, DocumentRegenerationRequest
+from .services import DocumentService, DocumentQueueService
 
 User = get_user_model()
 
@@ -153,3 +153,899 @@ class DocumentGenerationTestCase(TestCase):
         self.assertEqual(act.organization, self.employer)
         self.assertIn('statistics', act.content)
 
+    
+    def test_appendix_3_periodicity_rules(self):
+        """Тест: в Приложение 3 попадают только сотрудники с истекшей периодичностью"""
+        from apps.organizations.models import OrganizationMember
+        from apps.medical_examinations.models import DoctorExamination
+        
+        year = timezone.now().year
+        doctor = OrganizationMember.objects.create(
+            organization=self.clinic,
+            user=self.clinic_user,
+            role='doctor',
+            specialization='ЛОР'
+        )
+        
+        # Второй сотрудник - осмотр пройден недавно
+        examined_user = User.objects.create_user(phone_number='77000000001', username='77000000001')
+        examined = Employee.objects.create(
+            user=examined_user,
+            employer=self.employer,
+            first_name='Петр',
+            last_name='Петров',
+            iin='900215400123',
+            position=self.profession,
+            hire_date=timezone.now().date() - timedelta(days=800)
+        )
+        recent = MedicalExamination.objects.create(
+            examination_type='periodic',
+            employee=examined,
+            employer=self.employer,
+            clinic=self.clinic,
+            scheduled_date=timezone.now(),
+            completed_date=timezone.now(),
+            status='completed',
+            result='fit'
+        )
+        DoctorExamination.objects.create(
+            examination=recent,
+            doctor=doctor,
+            harmful_factor=self.harmful_factor,
+            result='fit'
+        )
+        
+        # Сотрудник без должности не попадает в список
+        no_position_user = User.objects.create_user(phone_number='77000000002', username='77000000002')
+        Employee.objects.create(
+            user=no_position_user,
+            employer=self.employer,
+            first_name='Без',
+            last_name='Должности',
+            hire_date=timezone.now().date()
+        )
+        
+        doc = DocumentService.generate_appendix_3(self.employer, year)
+        rows = doc.content['employees']
+        
+        self.assertEqual([row['id'] for row in rows], [self.employee.id])
+        self.assertEqual(doc.content['total_count'], 1)
+        self.assertEqual(rows[0]['harmful_factors'], 'Шум')
+        self.assertEqual(rows[0]['department'], 'Цех №1')
+        self.assertIsNone(rows[0]['last_examination_date'])
+        
+        # Осмотр по фактору устарел - сотрудник снова подлежит осмотру
+        MedicalExamination.objects.filter(id=recent.id).update(
+            completed_date=timezone.now() - timedelta(days=400)
+        )
+        doc = DocumentService.generate_appendix_3(self.employer, year)
+        row = next(r for r in doc.content['employees'] if r['id'] == examined.id)
+        self.assertEqual(row['gender'], 'Женский')
+        self.assertEqual(row['date_of_birth'], '1990-02-15')
+        self.assertIsNotNone(row['last_examination_date'])
+    
+    def test_appendix_3_query_count_is_flat(self):
+        """Тест: количество запросов не зависит от числа сотрудников"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        def add_employees(count, offset):
+            for i in range(count):
+                user = User.objects.create_user(
+                    phone_number=f'7701{offset + i:07d}',
+                    username=f'7701{offset + i:07d}'
+                )
+                Employee.objects.create(
+                    user=user,
+                    employer=self.employer,
+                    first_name=f'Имя{i}',
+                    last_name=f'Фамилия{offset + i}',
+                    position=self.profession,
+                    hire_date=timezone.now().date() - timedelta(days=100)
+                )
+        
+        year = timezone.now().year
+        add_employees(2, 0)
+        DocumentService.generate_appendix_3(self.employer, year)
+        with CaptureQueriesContext(connection) as small:
+            DocumentService.generate_appendix_3(self.employer, year)
+        
+        add_employees(30, 100)
+        with CaptureQueriesContext(connection) as large:
+            doc = DocumentService.generate_appendix_3(self.employer, year)
+        
+        self.assertEqual(doc.content['total_count'], 33)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+    
+    @override_settings(APPENDIX_3_AUTO_UPDATE='incremental')
+    def test_employee_changes_patch_appendix_3_rows(self):
+        """Тест: изменение сотрудника обновляет только его строку в Приложении 3"""
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        
+        user = User.objects.create_user(phone_number='77000000003', username='77000000003')
+        newcomer = Employee.objects.create(
+            user=user,
+            employer=self.employer,
+            first_name='Алексей',
+            last_name='Абаев',
+            position=self.profession,
+            hire_date=timezone.now().date()
+        )
+        
+        doc = Document.objects.get(document_type=DocumentType.APPENDIX_3, organization=self.employer, year=year)
+        self.assertEqual([r['id'] for r in doc.content['employees']], [newcomer.id, self.employee.id])
+        self.assertEqual(doc.content['total_count'], 2)
+        
+        newcomer.is_active = False
+        newcomer.save()
+        doc.refresh_from_db()
+        self.assertEqual([r['id'] for r in doc.content['employees']], [self.employee.id])
+        self.assertEqual(doc.content['total_count'], 1)
+        
+        self.employee.delete()
+        doc.refresh_from_db()
+        self.assertEqual(doc.content['employees'], [])
+        self.assertEqual(doc.content['total_count'], 0)
+    
+    def test_employee_writes_are_queued_and_coalesced(self):
+        """Тест: массовое добавление сотрудников дает одно переформирование Приложения 3"""
+        year = timezone.now().year
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                user = User.objects.create_user(phone_number=f'7702{i:07d}', username=f'7702{i:07d}')
+                Employee.objects.create(
+                    user=user,
+                    employer=self.employer,
+                    first_name=f'Имя{i}',
+                    last_name=f'Фамилия{i}',
+                    position=self.profession,
+                    hire_date=timezone.now().date()
+                )
+        
+        self.assertFalse(Document.objects.filter(document_type=DocumentType.APPENDIX_3).exists())
+        self.assertEqual(DocumentRegenerationRequest.objects.count(), 1)
+        
+        # Период тишины еще не прошел
+        self.assertEqual(DocumentQueueService.process_due(quiet_seconds=60)['processed'], 0)
+        
+        stats = DocumentQueueService.process_due(quiet_seconds=0)
+        self.assertEqual(stats, {'processed': 1, 'failed': 0})
+        self.assertFalse(DocumentRegenerationRequest.objects.exists())
+        
+        doc = Document.objects.get(document_type=DocumentType.APPENDIX_3, organization=self.employer, year=year)
+        self.assertEqual(doc.content['total_count'], 6)
+    
+    def test_failing_regeneration_backs_off_and_stops(self):
+        """Тест: ошибка переформирования - повтор с задержкой, лимит попыток, новые запросы не ждут"""
+        from unittest import mock
+        year = timezone.now().year
+        other_employer = Organization.objects.create(name='Другая Организация', org_type='employer', owner=self.employer_user)
+        DocumentQueueService.mark_dirty(DocumentType.APPENDIX_3, self.employer.id, year)
+        
+        def regenerate(request):
+            if request.organization_id == self.employer.id:
+                raise ValueError('Ошибка формирования')
+            return None
+        
+        with mock.patch.object(DocumentQueueService, 'regenerate', side_effect=regenerate):
+            self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, retry_seconds=60), {'processed': 0, 'failed': 1})
+            stuck = DocumentRegenerationRequest.objects.get(organization=self.employer)
+            self.assertEqual(stuck.attempts, 1)
+            self.assertGreater(stuck.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            
+            # Застрявший запрос не занимает место в проходе, даже после max_delay
+            DocumentRegenerationRequest.objects.filter(pk=stuck.pk).update(
+                first_requested_at=timezone.now() - timedelta(days=1)
+            )
+            DocumentQueueService.mark_dirty(DocumentType.APPENDIX_3, other_employer.id, year)
+            self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, limit=1), {'processed': 1, 'failed': 0})
+            
+            # Задержка удваивается; после max_attempts запрос больше не выбирается
+            for attempt in range(2, 4):
+                DocumentRegenerationRequest.objects.filter(pk=stuck.pk).update(next_attempt_at=timezone.now())
+                began = timezone.now()
+                self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3)['failed'], 1)
+                stuck.refresh_from_db()
+                self.assertEqual(stuck.attempts, attempt)
+                self.assertGreaterEqual(stuck.next_attempt_at, began + timedelta(seconds=60 * 2 ** (attempt - 1)))
+            DocumentRegenerationRequest.objects.filter(pk=stuck.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3), {'processed': 0, 'failed': 0})
+            
+            self.assertEqual(DocumentQueueService.retry_failed(), 1)
+            self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3)['failed'], 1)
+            
+            # Новое изменение данных снова ставит исчерпавший попытки запрос в работу
+            for _ in range(2):
+                DocumentRegenerationRequest.objects.filter(pk=stuck.pk).update(next_attempt_at=timezone.now())
+                DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3)
+            self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3)['failed'], 0)
+            DocumentQueueService.mark_dirty(DocumentType.APPENDIX_3, self.employer.id, year)
+            stuck.refresh_from_db()
+            self.assertEqual((stuck.attempts, stuck.next_attempt_at), (0, None))
+        self.assertEqual(DocumentQueueService.process_due(quiet_seconds=0, max_attempts=3), {'processed': 1, 'failed': 0})
+        self.assertFalse(DocumentRegenerationRequest.objects.exists())
+    
+    def test_get_appendix_3_is_read_only_with_etag(self):
+        """Тест: GET не переформирует актуальный документ и отвечает 304 по ETag"""
+        from rest_framework.test import APIClient
+        
+        client = APIClient()
+        client.force_authenticate(self.employer_user)
+        url = f'/api/documents/documents/get_or_generate_appendix_3/?employer_id={self.employer.id}&year={timezone.now().year}'
+        
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        generated_at = response.data['content']['generated_at']
+        
+        # Повторный запрос: документ не пересчитывается
+        response = client.get(url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.data['content']['generated_at'], generated_at)
+        
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        
+        # Изменение исходных данных - документ формируется заново
+        self.employee.department = 'Цех №2'
+        self.employee.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['content']['employees'][0]['department'], 'Цех №2')
+    
+    def test_export_appendix_3_streams_xlsx_and_csv(self):
+        """Тест: потоковая выгрузка совпадает со строками Приложения 3"""
+        import io
+        import zipfile
+        from rest_framework.test import APIClient
+        from .eligibility import EligibilityService
+        
+        year = timezone.now().year
+        streamed = list(EligibilityService.iter_appendix_3_rows(self.employer, year, chunk_size=1))
+        self.assertEqual(streamed, EligibilityService.build_appendix_3_rows(self.employer, year))
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        url = f'/api/documents/documents/export_appendix_3/?employer_id={self.employer.id}&year={year}'
+        
+        response = client.get(url + '&file_format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('1;Иванов Иван Иванович;'))
+        
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('Иванов Иван Иванович', sheet)
+        self.assertIn('Цех №1', sheet)
+        
+        # Посторонний пользователь не получает выгрузку
+        client.force_authenticate(self.employee_user)
+        self.assertEqual(client.get(url).status_code, 403)
+    
+    def test_season_job_generates_and_resumes(self):
+        """Тест: пакетное задание формирует документы по партнерствам и продолжается без повторов"""
+        from .jobs import DocumentJobService
+        from .models import DocumentJobType, DocumentJobStatus
+        
+        year = timezone.now().year
+        job = DocumentJobService.create_season_job(
+            DocumentJobType.SEASON_APPENDIX_3, year, clinic_id=self.clinic.id
+        )
+        self.assertTrue(DocumentJobService.claim(job))
+        self.assertFalse(DocumentJobService.claim(job))
+        
+        summary = DocumentJobService.run(job, workers_count=1)
+        self.assertEqual((summary['total'], summary['processed'], summary['failed']), (1, 1, 0))
+        self.assertEqual(job.status, DocumentJobStatus.COMPLETED)
+        self.assertEqual(job.completed_keys, [f'{self.employer.id}:0'])
+        self.assertTrue(Document.objects.filter(
+            document_type=DocumentType.APPENDIX_3, organization=self.employer, year=year
+        ).exists())
+        
+        # Повторный запуск пропускает уже сформированное
+        summary = DocumentJobService.run(job, workers_count=1)
+        self.assertEqual((summary['skipped'], summary['processed']), (1, 0))
+        
+        final_acts = DocumentJobService.create_season_job(DocumentJobType.SEASON_FINAL_ACT, year)
+        summary = DocumentJobService.run(final_acts, workers_count=1)
+        self.assertEqual(summary['processed'], 1)
+        self.assertEqual(final_acts.completed_keys, [f'{self.employer.id}:{self.clinic.id}'])
+    
+    def test_concurrent_generation_is_coalesced(self):
+        """Тест: одновременный вызов ждет текущее формирование и получает его результат"""
+        import threading
+        import time
+        from unittest import mock
+        from django.core.cache import cache
+        from django.db import IntegrityError, transaction
+        from .singleflight import flight_key, _LOCK_PREFIX, _RESULT_PREFIX
+        
+        year = timezone.now().year
+        with self.captureOnCommitCallbacks(execute=True):
+            document = DocumentService.generate_appendix_3(self.employer, year)
+        lock_key = _LOCK_PREFIX + flight_key(DocumentType.APPENDIX_3, self.employer.id, year)
+        
+        # Другой запрос уже формирует документ
+        self.assertTrue(cache.add(lock_key, 'leader', timeout=30))
+        
+        def finish_leader():
+            cache.set(_RESULT_PREFIX + 'leader', document.id)
+            cache.delete(lock_key)
+        
+        timer = threading.Timer(0.2, finish_leader)
+        timer.start()
+        with mock.patch.object(DocumentService, '_generate_appendix_3') as generate:
+            shared = DocumentService.generate_appendix_3(self.employer, year)
+        timer.join()
+        
+        generate.assert_not_called()
+        self.assertEqual(shared.id, document.id)
+        self.assertIsNone(cache.get(lock_key))
+        
+        # Внутри транзакции результат публикуется и блокировка снимается только после фиксации,
+        # повторный вызов в той же транзакции не ждет собственную блокировку
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            document = DocumentService.generate_appendix_3(self.employer, year)
+            token = cache.get(lock_key)
+            self.assertIsNotNone(token)
+            self.assertIsNone(cache.get(_RESULT_PREFIX + token))
+            started = time.monotonic()
+            self.assertEqual(DocumentService.generate_appendix_3(self.employer, year).id, document.id)
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len(callbacks), 2)
+        self.assertIsNone(cache.get(lock_key))
+        self.assertEqual(cache.get(_RESULT_PREFIX + token), document.id)
+        
+        # Дубликат Приложения 3 на тот же год запрещен на уровне БД
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Document.objects.create(
+                document_type=DocumentType.APPENDIX_3, organization=self.employer,
+                year=year, title='Дубликат'
+            )
+    
+    @override_settings(GREEN_API_URL='http://127.0.0.1:9', NOTIFICATION_RETRY_BASE_SECONDS=60)
+    def test_calendar_plan_notifications_go_through_outbox(self):
+        """Тест: уведомления о плане ставятся в очередь один раз, ошибка отправки - повтор позже"""
+        from apps.authentication.models import OutboundMessage, OutboundMessageStatus
+        from apps.authentication.services import NotificationService
+        
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        
+        # Повторное формирование плана на ту же дату не дублирует уведомление
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.phone_number, self.employee_phone)
+        self.assertEqual(message.status, OutboundMessageStatus.PENDING)
+        
+        stats = NotificationService.send_due(limit=10)
+        self.assertEqual(stats, {'sent': 0, 'failed': 1})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboundMessageStatus.PENDING, 1))
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertTrue(message.last_error)
+        
+        # До наступления срока повтора сообщение не берется
+        self.assertEqual(NotificationService.send_due(limit=10), {'sent': 0, 'failed': 0})
+    
+    def test_calendar_slots_follow_plan_and_edits(self):
+        """Тест: записи плана (CalendarSlot) синхронны с plan_data, запросы по дню и сотруднику"""
+        from rest_framework.test import APIClient
+        from .models import CalendarSlot
+        
+        second_user = User.objects.create_user(username='77010000001', phone_number='77010000001')
+        second = Employee.objects.create(
+            user=second_user, employer=self.employer, first_name='Петр', last_name='Алексеев',
+            position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+        )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        plan = DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        
+        day = start_date.date()
+        self.assertEqual(
+            set(CalendarSlot.objects.filter(plan=plan).values_list('employee_id', 'date')),
+            {(self.employee.id, day), (second.id, day)}
+        )
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.get(
+            '/api/documents/calendar-plans/by_day/',
+            {'date': day.isoformat(), 'clinic_id': self.clinic.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['booked'], response.data['capacity']), (2, 2, 30))
+        self.assertEqual([s['employee_name'] for s in response.data['slots']], [second.full_name, self.employee.full_name])
+        
+        # Правка plan_data: сотрудник переносится на другой день, неизвестный ID отбрасывается
+        next_day = (day + timedelta(days=1)).isoformat()
+        plan_data = {
+            day.isoformat(): [{'employee_id': self.employee.id}],
+            next_day: [{'employee_id': second.id}, {'employee_id': 999999}],
+        }
+        response = client.patch(f'/api/documents/calendar-plans/{plan.id}/', {'plan_data': plan_data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        
+        plan.refresh_from_db()
+        self.assertEqual(plan.plan_data[next_day], [
+            {'employee_id': second.id, 'full_name': second.full_name, 'position': self.profession.name}
+        ])
+        self.assertEqual(plan.document.content['plan_data'], plan.plan_data)
+        response = client.get('/api/documents/calendar-plans/by_employee/', {'employee_id': second.id})
+        self.assertEqual([s['date'] for s in response.data], [next_day])
+        
+        # Чужой пользователь записи не видит
+        client.force_authenticate(self.employee_user)
+        response = client.get('/api/documents/calendar-plans/by_day/', {'date': day.isoformat()})
+        self.assertEqual(response.data['count'], 0)
+    
+    def test_replan_schedules_only_the_difference(self):
+        """Тест: перепланирование записывает новых, отменяет выбывших и не трогает остальных"""
+        from rest_framework.test import APIClient
+        from apps.authentication.models import OutboundMessage
+        from apps.medical_examinations.models import ClinicDailyLoad
+        
+        def make_employee(phone, last_name):
+            user = User.objects.create_user(username=phone, phone_number=phone)
+            return Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=last_name,
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        
+        leaving = make_employee('77010000002', 'Уходящий')
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        plan = DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        kept_exam = MedicalExamination.objects.get(employee=self.employee)
+        
+        newcomer = make_employee('77010000003', 'Новый')
+        leaving.is_active = False
+        leaving.save()
+        DocumentService.generate_appendix_3(self.employer, year)
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.post(
+            f'/api/documents/calendar-plans/{plan.id}/replan/',
+            {'start_date': (start_date + timedelta(days=1)).date().isoformat()},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['replan'], {'added': 1, 'removed': 1, 'cancelled': 1, 'kept': 1})
+        
+        next_day = (start_date + timedelta(days=1)).date()
+        self.assertEqual(
+            {day: [e['employee_id'] for e in employees] for day, employees in response.data['plan_data'].items()},
+            {str(start_date.date()): [self.employee.id], str(next_day): [newcomer.id]}
+        )
+        self.assertEqual(MedicalExamination.objects.get(employee=leaving).status, 'cancelled')
+        self.assertEqual(MedicalExamination.objects.get(employee=self.employee), kept_exam)
+        self.assertEqual(MedicalExamination.objects.filter(employee=newcomer, status='scheduled').count(), 1)
+        self.assertEqual(
+            dict(ClinicDailyLoad.objects.filter(clinic=self.clinic).values_list('date', 'booked')),
+            {start_date.date(): 1, next_day: 1}
+        )
+        self.assertEqual(OutboundMessage.objects.filter(dedupe_key__startswith='exam-scheduled').count(), 3)
+        
+        # Без изменений Приложения 3 повторное перепланирование ничего не делает
+        response = client.post(f'/api/documents/calendar-plans/{plan.id}/replan/', {}, format='json')
+        self.assertEqual(response.data['replan'], {'added': 0, 'removed': 0, 'cancelled': 0, 'kept': 2})
+        self.assertEqual(MedicalExamination.objects.filter(employer=self.employer).count(), 3)
+    
+    def test_async_calendar_plan_job_reports_progress(self):
+        """Тест: асинхронное формирование плана - 202 с job_id, выполнение исполнителем, статус с этапами"""
+        from django.core.management import call_command
+        from io import StringIO
+        from rest_framework.test import APIClient
+        from .jobs import DocumentJobService
+        from apps.subscriptions.models import Subscription, SubscriptionPlan
+        from .models import DocumentJob, DocumentJobStatus
+        
+        Subscription.objects.create(
+            organization=self.clinic,
+            plan=SubscriptionPlan.objects.create(name='Базовый', plan_type='basic', max_employees=100, price_monthly=0),
+            status='active',
+            expires_at=timezone.now() + timedelta(days=30)
+        )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.post('/api/documents/documents/generate_calendar_plan/', {
+            'employer_id': self.employer.id,
+            'year': year,
+            'start_date': f'{year + 1}-03-03T09:00:00+05:00',
+            'async': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        self.assertFalse(CalendarPlan.objects.exists())
+        
+        phases = []
+        job = DocumentJob.objects.get(id=job_id)
+        self.assertTrue(DocumentJobService.claim(job))
+        job.refresh_from_db()
+        DocumentJobService.run(job, progress=lambda job: phases.append(
+            (DocumentJobService.status(job)['phase'], job.processed, job.total)
+        ))
+        self.assertEqual(phases, [('scheduling', 0, 1), ('examinations', 1, 1), ('notifications', 1, 1)])
+        
+        response = client.get(response.data['status_url'])
+        self.assertEqual(response.status_code, 200)
+        plan = CalendarPlan.objects.get(employer=self.employer)
+        self.assertEqual(
+            (response.data['status'], response.data['phase'], response.data['result']),
+            (DocumentJobStatus.COMPLETED, 'completed', {'plan_id': plan.id, 'past_deadline': None})
+        )
+        self.assertEqual(plan.document.created_by, self.clinic_user)
+        self.assertEqual(MedicalExamination.objects.filter(employee=self.employee).count(), 1)
+        
+        # Ошибка формирования фиксируется в задании; исполнитель запускается командой
+        job = DocumentJobService.create_calendar_plan_job(self.employer, self.clinic, year + 5, created_by=self.clinic_user)
+        call_command('run_document_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.phase, job.failed), (DocumentJobStatus.FAILED, 'failed', 1))
+        self.assertIn('Приложение 3', job.errors[0]['error'])
+        
+        client.force_authenticate(self.employee_user)
+        self.assertEqual(client.get(f'/api/documents/documents/job_status/?job_id={job.id}').status_code, 403)
+    
+    def test_split_calendar_plan_across_partner_clinics(self):
+        """Тест: распределение по клиникам-партнерам - дешевые места до срока, затем по дате"""
+        from decimal import Decimal
+        from rest_framework.test import APIClient
+        from .planning import CalendarPlanService
+        
+        cheap_clinic = Organization.objects.create(
+            name='Дешевая Клиника', org_type='clinic', owner=self.clinic_user, capacity_per_day=1
+        )
+        ClinicEmployerPartnership.objects.create(
+            clinic=cheap_clinic, employer=self.employer, pricing={'periodic_exam': 3000},
+            status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+        )
+        for i in range(2):
+            user = User.objects.create_user(username=f'7701000001{i}', phone_number=f'7701000001{i}')
+            Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Сотрудник{i}',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        
+        client = APIClient()
+        client.force_authenticate(self.employer_user)
+        response = client.post('/api/documents/documents/generate_split_calendar_plan/', {
+            'employer_id': self.employer.id,
+            'year': year,
+            'start_date': f'{year + 1}-03-03T09:00:00',
+            'end_date': f'{year + 1}-03-04T18:00:00',
+            'objective': 'cost',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        summary = response.data['summary']
+        self.assertEqual(Decimal(summary['total_cost']), Decimal('11000'))
+        self.assertEqual(summary['past_deadline'], 0)
+        self.assertEqual(
+            {c['clinic_id']: (c['count'], c['first_date'], c['last_date']) for c in summary['clinics']},
+            {
+                self.clinic.id: (1, f'{year + 1}-03-03', f'{year + 1}-03-03'),
+                cheap_clinic.id: (2, f'{year + 1}-03-03', f'{year + 1}-03-04'),
+            }
+        )
+        self.assertEqual(CalendarPlan.objects.filter(employer=self.employer).count(), 2)
+        self.assertEqual(MedicalExamination.objects.filter(clinic=cheap_clinic).count(), 2)
+        self.assertEqual(MedicalExamination.objects.filter(employer=self.employer).values('employee').distinct().count(), 3)
+        
+        # Повторное распределение отклоняется, перепланирование клиники не трогает сотрудников другой клиники
+        response = client.post('/api/documents/documents/generate_split_calendar_plan/', {
+            'employer_id': self.employer.id, 'year': year
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        _, changes = DocumentService.replan_calendar_plan(self.employer, self.clinic, year)
+        self.assertEqual(changes, {'added': 0, 'removed': 0, 'cancelled': 0, 'kept': 1})
+        
+        # Цель "дата": самые ранние дни, при равенстве - дешевле
+        def days(capacity):
+            day = datetime(year + 1, 3, 2).date()
+            while True:
+                yield day, capacity
+                day += timedelta(days=1)
+        allocation = CalendarPlanService.split_allocation(
+            [(1, Decimal('5000'), days(2)), (2, Decimal('3000'), days(1))], 5, objective='date'
+        )
+        self.assertEqual(allocation, {
+            2: [(datetime(year + 1, 3, 2).date(), 1), (datetime(year + 1, 3, 3).date(), 1)],
+            1: [(datetime(year + 1, 3, 2).date(), 2), (datetime(year + 1, 3, 3).date(), 1)],
+        })
+    
+    def test_generate_calendar_plan_returns_own_plan_after_split(self):
+        """Тест: после распределения каждая клиника получает и перепланирует только свой план"""
+        from rest_framework.test import APIClient
+        from apps.subscriptions.models import Subscription, SubscriptionPlan
+        
+        other_user = User.objects.create_user(username='77010000030', phone_number='77010000030')
+        other_clinic = Organization.objects.create(
+            name='Вторая Клиника', org_type='clinic', owner=other_user, capacity_per_day=1
+        )
+        ClinicEmployerPartnership.objects.create(
+            clinic=other_clinic, employer=self.employer, pricing={'periodic_exam': 3000},
+            status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+        )
+        subscription_plan = SubscriptionPlan.objects.create(
+            name='Базовый', plan_type='basic', max_employees=100, price_monthly=0
+        )
+        for clinic in (self.clinic, other_clinic):
+            Subscription.objects.create(
+                organization=clinic, plan=subscription_plan, status='active',
+                expires_at=timezone.now() + timedelta(days=30)
+            )
+        user = User.objects.create_user(username='77010000031', phone_number='77010000031')
+        Employee.objects.create(
+            user=user, employer=self.employer, first_name='Тест', last_name='Сотрудник',
+            position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+        )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        
+        client = APIClient()
+        client.force_authenticate(self.employer_user)
+        response = client.post('/api/documents/documents/generate_split_calendar_plan/', {
+            'employer_id': self.employer.id,
+            'year': year,
+            'start_date': f'{year + 1}-03-03T09:00:00',
+            'end_date': f'{year + 1}-03-03T18:00:00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        
+        for owner, clinic in ((self.clinic_user, self.clinic), (other_user, other_clinic)):
+            own_plan = CalendarPlan.objects.get(employer=self.employer, clinic=clinic, year=year)
+            client.force_authenticate(owner)
+            response = client.post('/api/documents/documents/generate_calendar_plan/', {
+                'employer_id': self.employer.id, 'year': year
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.data['id'], response.data['plan']['clinic']), (own_plan.id, clinic.id))
+            
+            response = client.post('/api/documents/documents/generate_calendar_plan/', {
+                'employer_id': self.employer.id, 'year': year, 'mode': 'replan'
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['id'], own_plan.id)
+            self.assertEqual(response.data['replan']['kept'], 1)
+        self.assertEqual(CalendarPlan.objects.filter(employer=self.employer).count(), 2)
+    
+    def test_calendar_plan_reports_days_past_end_date(self):
+        """Тест: осмотры, не поместившиеся до end_date, видны в ответе и документе плана"""
+        from rest_framework.test import APIClient
+        from apps.subscriptions.models import Subscription, SubscriptionPlan
+        
+        Subscription.objects.create(
+            organization=self.clinic,
+            plan=SubscriptionPlan.objects.create(name='Базовый', plan_type='basic', max_employees=100, price_monthly=0),
+            status='active', expires_at=timezone.now() + timedelta(days=30)
+        )
+        for i in range(2):
+            user = User.objects.create_user(username=f'7701000005{i}', phone_number=f'7701000005{i}')
+            Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Граница{i}',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        self.clinic.capacity_per_day = 1
+        self.clinic.save()
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.post('/api/documents/documents/generate_calendar_plan/', {
+            'employer_id': self.employer.id,
+            'clinic_id': self.clinic.id,
+            'year': year,
+            'start_date': f'{year + 1}-03-03T09:00:00',
+            'end_date': f'{year + 1}-03-04T18:00:00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['past_deadline'], {
+            'deadline': f'{year + 1}-03-04', 'count': 1, 'days': [f'{year + 1}-03-05'],
+        })
+        plan = CalendarPlan.objects.get(pk=response.data['id'])
+        self.assertEqual(plan.document.content['past_deadline']['count'], 1)
+        
+        # Без end_date граница не задана
+        plan.delete()
+        MedicalExamination.objects.all().delete()
+        response = client.post('/api/documents/documents/generate_calendar_plan/', {
+            'employer_id': self.employer.id,
+            'clinic_id': self.clinic.id,
+            'year': year,
+            'start_date': f'{year + 1}-03-03T09:00:00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['past_deadline'])
+    
+    def test_calendar_plan_slot_occupancy_query_is_flat(self):
+        """Тест: занятость слотов читается одним запросом на план, а не на каждый день"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        for i in range(5):
+            user = User.objects.create_user(username=f'7701000004{i}', phone_number=f'7701000004{i}')
+            Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Занятость{i}',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        
+        def plan_queries(capacity):
+            CalendarPlan.objects.all().delete()
+            MedicalExamination.objects.all().delete()
+            self.clinic.capacity_per_day = capacity
+            self.clinic.save()
+            with CaptureQueriesContext(connection) as queries:
+                plan = DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+            self.assertEqual(len(plan.plan_data), 6 // capacity)
+            return [
+                query['sql'] for query in queries
+                if query['sql'].startswith('SELECT') and '"medical_examinations_medicalexamination"."scheduled_date" >=' in query['sql']
+            ]
+        
+        one_day = plan_queries(6)
+        six_days = plan_queries(1)
+        self.assertEqual(len(six_days), len(one_day))
+        self.assertEqual(len(six_days), 1)
+    
+    def test_calendar_plan_books_time_slots(self):
+        """Тест: приход распределяется по слотам дня, загрузка слотов доступна по API"""
+        from datetime import time
+        from rest_framework.test import APIClient
+        from .models import CalendarSlot
+        
+        # 3 слота по часу, по 1 месту: 3 сотрудника в первый день, четвертый - на следующий
+        self.clinic.exam_day_start = time(9, 0)
+        self.clinic.exam_day_end = time(12, 0)
+        self.clinic.slot_minutes = 60
+        self.clinic.slot_capacity = 1
+        self.clinic.save()
+        for i in range(3):
+            user = User.objects.create_user(username=f'7701000002{i}', phone_number=f'7701000002{i}')
+            Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Слот{i}',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        plan = DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        
+        day, next_day = start_date.date(), start_date.date() + timedelta(days=1)
+        self.assertEqual(
+            [entry['time'] for entry in plan.plan_data[day.isoformat()]], ['09:00', '10:00', '11:00']
+        )
+        self.assertEqual([entry['time'] for entry in plan.plan_data[next_day.isoformat()]], ['09:00'])
+        self.assertEqual(
+            sorted(CalendarSlot.objects.filter(plan=plan, date=day).values_list('time', flat=True)),
+            [time(9, 0), time(10, 0), time(11, 0)]
+        )
+        self.assertEqual(
+            sorted(
+                timezone.localtime(scheduled).strftime('%d %H:%M')
+                for scheduled in MedicalExamination.objects.filter(clinic=self.clinic).values_list('scheduled_date', flat=True)
+            ),
+            ['03 09:00', '03 10:00', '03 11:00', '04 09:00']
+        )
+        
+        client = APIClient()
+        client.force_authenticate(self.employer_user)
+        response = client.get(
+            '/api/documents/calendar-plans/slot_occupancy/',
+            {'date': next_day.isoformat(), 'clinic_id': self.clinic.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['booked'], 1)
+        self.assertEqual(
+            [(s['time'], s['booked'], s['free']) for s in response.data['slots']],
+            [('09:00', 1, 0), ('10:00', 0, 1), ('11:00', 0, 1)]
+        )
+        
+        # Без доступа к клинике загрузка не отдается
+        client.force_authenticate(self.employee_user)
+        response = client.get(
+            '/api/documents/calendar-plans/slot_occupancy/',
+            {'date': day.isoformat(), 'clinic_id': self.clinic.id}
+        )
+        self.assertEqual(response.status_code, 404)
+    
+    def test_calendar_plan_operations_touch_only_affected_employees(self):
+        """Тест: перенос, обмен и исключение меняют только затронутые записи, осмотры и уведомления"""
+        from datetime import time
+        from rest_framework.test import APIClient
+        from apps.authentication.models import OutboundMessage
+        from apps.medical_examinations.models import ClinicDailyLoad
+        
+        # 3 слота по 1 месту: трое в первый день, четвертый - на следующий
+        self.clinic.exam_day_start, self.clinic.exam_day_end = time(9, 0), time(12, 0)
+        self.clinic.slot_minutes, self.clinic.slot_capacity = 60, 1
+        self.clinic.save()
+        for i in range(3):
+            user = User.objects.create_user(username=f'7701000003{i}', phone_number=f'7701000003{i}')
+            Employee.objects.create(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Перенос{i}',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+        year = timezone.now().year
+        DocumentService.generate_appendix_3(self.employer, year)
+        start_date = timezone.make_aware(datetime(year + 1, 3, 3, 9))
+        plan = DocumentService.generate_calendar_plan(self.employer, self.clinic, year, start_date)
+        day, next_day = start_date.date(), start_date.date() + timedelta(days=1)
+        first_day = [entry['employee_id'] for entry in plan.plan_data[day.isoformat()]]
+        last = plan.plan_data[next_day.isoformat()][0]['employee_id']
+        notified = OutboundMessage.objects.count()
+        url = f'/api/documents/calendar-plans/{plan.id}/operations/'
+        
+        def scheduled(employee_id):
+            examination = MedicalExamination.objects.get(employee_id=employee_id, clinic=self.clinic)
+            return examination.status, timezone.localtime(examination.scheduled_date).strftime('%d %H:%M')
+        
+        client = APIClient()
+        client.force_authenticate(self.employer_user)
+        response = client.patch(url, {'operations': [{'op': 'remove', 'employee_id': last}]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        
+        # Первый день заполнен: перенос отклоняется целиком, ничего не меняется
+        client.force_authenticate(self.clinic_user)
+        response = client.patch(url, {'operations': [
+            {'op': 'move', 'employee_id': first_day[0], 'date': next_day.isoformat(), 'time': '11:00'},
+            {'op': 'move', 'employee_id': last, 'date': day.isoformat()},
+            {'op': 'move', 'employee_id': first_day[1], 'date': day.isoformat(), 'time': '11:00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(scheduled(first_day[0]), ('scheduled', '03 09:00'))
+        
+        # Перенос на свободный день в свободный слот
+        response = client.patch(url, {'operations': [
+            {'op': 'move', 'employee_id': first_day[0], 'date': next_day.isoformat(), 'time': '11:00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['moved'], response.data['examinations_updated'], response.data['notified']), (1, 1, 1))
+        self.assertEqual(scheduled(first_day[0]), ('scheduled', '04 11:00'))
+        self.assertEqual(ClinicDailyLoad.objects.get(clinic=self.clinic, date=next_day).booked, 2)
+        self.assertEqual(ClinicDailyLoad.objects.get(clinic=self.clinic, date=day).booked, 2)
+        
+        # Обмен днем и временем, исключение из плана
+        response = client.patch(url, {'operations': [
+            {'op': 'swap', 'employee_id': last, 'with_employee_id': first_day[1]},
+            {'op': 'remove', 'employee_id': first_day[2]},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['moved'], response.data['removed'], response.data['notified']), (2, 1, 3))
+        self.assertEqual(scheduled(last), ('scheduled', '03 10:00'))
+        self.assertEqual(scheduled(first_day[1]), ('scheduled', '04 09:00'))
+        self.assertEqual(scheduled(first_day[2])[0], 'cancelled')
+        self.assertEqual(OutboundMessage.objects.count(), notified + 4)
+        
+        plan.refresh_from_db()
+        self.assertEqual(
+            {date_str: [(e['employee_id'], e['time']) for e in entries] for date_str, entries in plan.plan_data.items()},
+            {
+                day.isoformat(): [(last, '10:00')],
+                next_day.isoformat(): [(first_day[1], '09:00'), (first_day[0], '11:00')],
+            }
+        )
+        self.assertEqual(plan.document.content['plan_data'], plan.plan_data)
+        self.assertFalse(plan.slots.filter(employee_id=first_day[2]).exists())
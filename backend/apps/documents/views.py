@@ -1,20 +1,26 @@
 """
 Document views
 """
+import hashlib
 from django.db import models
+from django.db.models import Q
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Document, DocumentSignature, CalendarPlan
+from .models import Document, DocumentSignature, CalendarPlan, CalendarSlot
 from .serializers import (
     DocumentSerializer,
     DocumentSignatureSerializer,
-    CalendarPlanSerializer
+    CalendarPlanSerializer,
+    CalendarSlotSerializer
 )
 from .services import DocumentService
+from .planning import CalendarPlanService
+from apps.organizations.models import Organization
 
 
 class DocumentViewSet(viewsets.ModelViewSet):
@@ -146,7 +152,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """
         Получить или автоматически сформировать Приложение 3
         
-        GET: Получить существующее Приложение 3 (если есть) или автоматически сформировать
+        GET: Получить сохраненное Приложение 3; формируется заново только если
+             изменились исходные данные (отпечаток). Поддерживает ETag/Last-Modified
+             и возвращает 304 на повторные запросы без изменений.
         POST: Принудительно обновить/сформировать Приложение 3
         
         АВТОМАТИЧЕСКИ формируется на основе уже добавленных сотрудников
@@ -168,35 +176,138 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Автоматически формируем или получаем Приложение 3
-        document = DocumentService.generate_appendix_3(employer, int(year))
-        
-        serializer = self.get_serializer(document)
-        response_data = serializer.data
+        # GET - сохраненный документ (пересчет только при изменении исходных данных)
+        # POST - принудительное формирование
+        if request.method == 'GET':
+            document = DocumentService.get_appendix_3(employer, int(year))
+        else:
+            document = DocumentService.generate_appendix_3(employer, int(year))
         
         # Добавляем информацию о возможности создания календарного плана
         from apps.organizations.models import ClinicEmployerPartnership
+        calendar_plan_info = {'can_create_calendar_plan': False}
         user_clinic = Organization.objects.filter(
             owner=request.user,
             org_type='clinic'
         ).first()
         
         if user_clinic:
-            active_partnerships = ClinicEmployerPartnership.objects.filter(
+            active_partnership = ClinicEmployerPartnership.objects.filter(
                 employer=employer,
                 clinic=user_clinic,
                 status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
-            )
-            if active_partnerships.exists() and active_partnerships.first().is_active():
-                response_data['can_create_calendar_plan'] = True
-                response_data['suggested_clinic_id'] = user_clinic.id
-            else:
-                response_data['can_create_calendar_plan'] = False
-        else:
-            response_data['can_create_calendar_plan'] = False
+            ).first()
+            if active_partnership and active_partnership.is_active():
+                calendar_plan_info = {
+                    'can_create_calendar_plan': True,
+                    'suggested_clinic_id': user_clinic.id,
+                }
+        
+        etag = quote_etag(hashlib.md5(
+            f"{document.id}|{document.updated_at.isoformat()}|{document.fingerprint}|"
+            f"{sorted(calendar_plan_info.items())}".encode()
+        ).hexdigest())
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(document.updated_at.timestamp()),
+            'Cache-Control': 'private, no-cache',
+        }
+        
+        if request.method == 'GET' and self._is_not_modified(request, etag, document.updated_at):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
         
-        return Response(response_data)
+        serializer = self.get_serializer(document)
+        response_data = serializer.data
+        response_data.update(calendar_plan_info)
+        
+        return Response(response_data, headers=headers)
     
+    @staticmethod
+    def _is_not_modified(request, etag: str, last_modified) -> bool:
+        """Условный GET: If-None-Match имеет приоритет над If-Modified-Since"""
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since is not None:
+            return int(last_modified.timestamp()) <= if_modified_since
+        
+        return False
+
+    @action(detail=False, methods=['get'])
+    def export_appendix_3(self, request):
+        """
+        Выгрузка Приложения 3 файлом (потоково)
+
+        GET ?employer_id=&year=&file_format=xlsx|csv
+        Строки формируются пачками и сразу отдаются клиенту, поэтому время до
+        первого байта и память не зависят от числа сотрудников.
+        """
+        from django.http import StreamingHttpResponse
+        from .eligibility import EligibilityService
+        from .exports import EXPORT_CONTENT_TYPES, iter_export
+
+        employer_id = request.query_params.get('employer_id')
+        year = request.query_params.get('year', timezone.now().year)
+        file_format = request.query_params.get('file_format', 'xlsx')
+
+        if not employer_id:
+            return Response(
+                {'error': 'Укажите employer_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if file_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {'error': 'Неподдерживаемый формат. Доступно: xlsx, csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            year = int(year)
+            employer = Organization.objects.get(id=employer_id, org_type='employer')
+        except (ValueError, Organization.DoesNotExist):
+            return Response(
+                {'error': 'Работодатель не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if not self._can_access_employer(request.user, employer):
+            return Response(
+                {'error': 'Нет доступа к документам этого работодателя'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        rows = EligibilityService.iter_appendix_3_rows(employer, year)
+        response = StreamingHttpResponse(
+            iter_export(rows, file_format),
+            content_type=EXPORT_CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="appendix_3_{employer.id}_{year}.{file_format}"'
+        )
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+    @staticmethod
+    def _can_access_employer(user, employer) -> bool:
+        """Сотрудник работодателя (владелец, HR, админ, ОТ) или клиника с активным партнерством"""
+        from apps.organizations.models import ClinicEmployerPartnership
+
+        if employer.owner_id == user.id or employer.members.filter(
+            user=user, role__in=['hr', 'admin', 'safety']
+        ).exists():
+            return True
+
+        partnerships = ClinicEmployerPartnership.objects.filter(
+            employer=employer,
+            clinic__owner=user,
+            status=ClinicEmployerPartnership.PartnershipStatus.ACTIVE
+        )
+        return any(partnership.is_active() for partnership in partnerships)
+
     @action(detail=False, methods=['post'])
     def generate_appendix_3(self, request):
         """Генерация/обновление Приложения 3 (Список лиц) - только клиника
@@ -344,24 +455,48 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Проверяем, существует ли уже план для этого работодателя и года
+        # Проверяем, существует ли уже план этой клиники для работодателя и года
         existing_plan = CalendarPlan.objects.filter(
             employer=employer,
+            clinic=clinic,
             year=year
         ).first()
         
+        # async=true: задание для фонового исполнителя (run_document_jobs), ответ сразу с job_id
+        run_async = str(request.data.get('async', '')).lower() in ('1', 'true', 'yes')
+        
+        if existing_plan and request.data.get('mode') == 'replan':
+            # Перепланирование: только новые и выбывшие сотрудники Приложения 3
+            if run_async:
+                return self._calendar_plan_job_response(
+                    employer, clinic, year, start_date if start_date_str else None, None, 'replan'
+                )
+            try:
+                calendar_plan, changes = DocumentService.replan_calendar_plan(
+                    employer, clinic, year, start_date if start_date_str else None
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                {**CalendarPlanSerializer(calendar_plan).data, 'replan': changes},
+                status=status.HTTP_200_OK
+            )
+        
         if existing_plan:
             # Если план уже существует, возвращаем его с сообщением
             serializer = CalendarPlanSerializer(existing_plan)
             return Response(
                 {
                     'id': existing_plan.id,
-                    'message': 'Календарный план уже существует для этого работодателя и года. Используйте редактирование для изменения.',
+                    'message': 'Календарный план этой клиники уже существует для этого работодателя и года. Используйте редактирование или mode=replan для изменения.',
                     'plan': serializer.data
                 },
                 status=status.HTTP_200_OK
             )
         
+        if run_async:
+            return self._calendar_plan_job_response(employer, clinic, year, start_date, end_date, 'full')
+        
         try:
             calendar_plan = DocumentService.generate_calendar_plan(
                 employer=employer,
@@ -382,6 +517,103 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=False, methods=['post'])
+    def generate_split_calendar_plan(self, request):
+        """
+        Распределение Приложения 3 по всем активным клиникам-партнерам - работодатель
+        
+        Body: employer_id, year, start_date, end_date (необязательно),
+        objective: "cost" (минимальная стоимость до end_date) | "date" (самое раннее завершение),
+        async: true - выполнить фоновым заданием (ответ 202 с job_id)
+        """
+        objective = request.data.get('objective', 'cost')
+        if objective not in ('cost', 'date'):
+            return Response({'error': 'objective: cost или date'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            employer = Organization.objects.get(id=request.data.get('employer_id'), org_type='employer')
+            year = int(request.data.get('year', timezone.now().year))
+            start_date_str = request.data.get('start_date')
+            end_date_str = request.data.get('end_date')
+            start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00')) if start_date_str else timezone.now()
+            end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')) if end_date_str else None
+        except (Organization.DoesNotExist, ValueError, TypeError):
+            return Response(
+                {'error': 'Укажите существующего работодателя, год и даты в формате ISO'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        is_employer_staff = employer.owner_id == request.user.id or employer.members.filter(
+            user=request.user, role__in=['hr', 'admin']
+        ).exists()
+        if not is_employer_staff:
+            return Response(
+                {'error': 'Распределять план по клиникам может только работодатель'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        if str(request.data.get('async', '')).lower() in ('1', 'true', 'yes'):
+            return self._calendar_plan_job_response(employer, None, year, start_date, end_date, 'split', objective)
+        
+        try:
+            plans, summary = DocumentService.generate_split_calendar_plans(
+                employer, year, start_date, end_date, objective=objective
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        for calendar_plan in plans:
+            if calendar_plan.document:
+                calendar_plan.document.created_by = request.user
+                calendar_plan.document.save(update_fields=['created_by'])
+        return Response(
+            {'plans': CalendarPlanSerializer(plans, many=True).data, 'summary': summary},
+            status=status.HTTP_201_CREATED
+        )
+    
+    def _calendar_plan_job_response(self, employer, clinic, year, start_date, end_date, mode, objective=None):
+        """Поставить формирование плана в очередь заданий и вернуть 202 с job_id"""
+        from .jobs import DocumentJobService
+        
+        job = DocumentJobService.create_calendar_plan_job(
+            employer, clinic, int(year), start_date, end_date, mode,
+            created_by=self.request.user, objective=objective
+        )
+        return Response(
+            {
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/documents/documents/job_status/?job_id={job.id}',
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @action(detail=False, methods=['get'])
+    def job_status(self, request):
+        """
+        Состояние задания формирования документов: ?job_id=ID
+        
+        Возвращает status, phase, processed/total, errors и result (plan_id) - для опроса из UI.
+        """
+        from .jobs import DocumentJobService
+        from .models import DocumentJob
+        
+        job_id = request.query_params.get('job_id', '')
+        job = DocumentJob.objects.filter(id=int(job_id)).first() if job_id.isdigit() else None
+        if not job:
+            return Response({'error': 'Задание не найдено'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Доступ: автор задания или сотрудник клиники задания
+        clinic_id = job.params.get('clinic_id')
+        has_access = job.created_by_id == request.user.id or (clinic_id and Organization.objects.filter(
+            Q(owner=request.user) | Q(members__user=request.user),
+            id=clinic_id,
+            org_type='clinic'
+        ).exists())
+        if not has_access:
+            return Response({'error': 'Нет доступа к заданию'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response(DocumentJobService.status(job))
+    
     @action(detail=False, methods=['post'])
     def generate_final_act(self, request):
         """Генерация Заключительного акта - только клиника"""
@@ -563,5 +795,174 @@ class CalendarPlanViewSet(viewsets.ModelViewSet):
     
     def partial_update(self, request, *args, **kwargs):
         """Частичное обновление календарного плана"""
+        kwargs['partial'] = True
         return self.update(request, *args, **kwargs)
+    
+    @action(detail=True, methods=['post'])
+    def replan(self, request, pk=None):
+        """
+        Перепланирование по текущему Приложению 3 - только клиника плана
+        
+        Body: {"start_date": "YYYY-MM-DD"} (необязательно) - с какого дня записывать новых сотрудников
+        """
+        instance = self.get_object()
+        is_clinic_member = Organization.objects.filter(
+            Q(owner=request.user) | Q(members__user=request.user),
+            org_type='clinic',
+            id=instance.clinic_id
+        ).exists()
+        if not is_clinic_member:
+            return Response(
+                {'error': 'Только клиника, создавшая план, может его перепланировать'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        start_date = None
+        if request.data.get('start_date'):
+            try:
+                start_date = datetime.fromisoformat(str(request.data['start_date']).replace('Z', '+00:00'))
+            except ValueError as e:
+                return Response({'error': f'Неверный формат даты: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            calendar_plan, changes = DocumentService.replan_calendar_plan(
+                instance.employer, instance.clinic, instance.year, start_date
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**CalendarPlanSerializer(calendar_plan).data, 'replan': changes})
+    
+    @action(detail=True, methods=['patch'])
+    def operations(self, request, pk=None):
+        """
+        Точечная правка плана - только клиника плана
+        
+        Body: {"operations": [
+            {"op": "move", "employee_id": ID, "date": "YYYY-MM-DD", "time": "HH:MM"},
+            {"op": "swap", "employee_id": ID, "with_employee_id": ID},
+            {"op": "remove", "employee_id": ID}
+        ]}
+        Меняются только записи и осмотры указанных сотрудников (все операции или ни одной).
+        """
+        instance = self.get_object()
+        is_clinic_member = Organization.objects.filter(
+            Q(owner=request.user) | Q(members__user=request.user),
+            org_type='clinic',
+            id=instance.clinic_id
+        ).exists()
+        if not is_clinic_member:
+            return Response(
+                {'error': 'Только клиника, создавшая план, может его редактировать'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            changes = DocumentService.apply_calendar_plan_operations(instance, request.data.get('operations'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Ответ без plan_data: клиент обновляет только затронутые записи
+        return Response({'plan_id': instance.id, **changes})
+    
+    def perform_update(self, serializer):
+        """После правки plan_data - синхронизация записей плана (CalendarSlot)"""
+        calendar_plan = serializer.save()
+        CalendarPlanService.sync_slots(calendar_plan)
+        CalendarPlanService.refresh_plan_data(calendar_plan)
+    
+    def _accessible_slots(self):
+        """Записи только из планов, доступных пользователю"""
+        plan_ids = self.get_queryset().order_by().values('id')
+        return CalendarSlot.objects.filter(plan_id__in=plan_ids).select_related(
+            'employee__position', 'plan__employer', 'clinic'
+        )
+    
+    @action(detail=False, methods=['get'])
+    def by_day(self, request):
+        """
+        Записи на день: ?date=YYYY-MM-DD[&clinic_id=ID]
+        
+        С clinic_id дополнительно возвращается загрузка клиники на этот день.
+        """
+        try:
+            day = datetime.strptime(request.query_params.get('date', ''), '%Y-%m-%d').date()
+            clinic_id = int(request.query_params['clinic_id']) if request.query_params.get('clinic_id') else None
+        except ValueError:
+            return Response(
+                {'error': 'Укажите date в формате YYYY-MM-DD и числовой clinic_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        slots = CalendarPlanService.day_slots(day, clinic_id, self._accessible_slots()).order_by(
+            'time', 'employee__last_name', 'employee__first_name', 'id'
+        )
+        data = {
+            'date': day.isoformat(),
+            'count': len(slots),
+            'slots': CalendarSlotSerializer(slots, many=True).data,
+        }
+        
+        if clinic_id:
+            from apps.medical_examinations.models import ClinicDailyLoad
+            clinic = Organization.objects.filter(id=clinic_id, org_type='clinic').first()
+            load = ClinicDailyLoad.objects.filter(clinic_id=clinic_id, date=day).first()
+            data['booked'] = load.booked if load else 0
+            data['capacity'] = (clinic.capacity_per_day or 50) if clinic else None
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def slot_occupancy(self, request):
+        """
+        Загрузка слотов клиники на день: ?clinic_id=ID&date=YYYY-MM-DD
+        
+        Доступно сотрудникам клиники и работодателям, у которых есть план в этой клинике.
+        """
+        from apps.medical_examinations.services import CapacityService
+        
+        try:
+            day = datetime.strptime(request.query_params.get('date', ''), '%Y-%m-%d').date()
+            clinic_id = int(request.query_params.get('clinic_id', ''))
+        except ValueError:
+            return Response(
+                {'error': 'Укажите date в формате YYYY-MM-DD и числовой clinic_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        user = request.user
+        clinic = Organization.objects.filter(
+            Q(owner=user) | Q(members__user=user) | Q(id__in=self.get_queryset().order_by().values('clinic_id')),
+            id=clinic_id,
+            org_type='clinic',
+        ).distinct().first()
+        if not clinic:
+            return Response({'error': 'Клиника не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        slot_capacity = CapacityService.slot_capacity(clinic)
+        occupancy = CapacityService.slot_occupancy(clinic, day)
+        return Response({
+            'date': day.isoformat(),
+            'clinic_id': clinic.id,
+            'slot_minutes': clinic.slot_minutes,
+            'slot_capacity': slot_capacity,
+            'daily_capacity': CapacityService.daily_capacity(clinic),
+            'booked': sum(occupancy.values()),
+            'slots': [
+                {
+                    'time': start.strftime('%H:%M'),
+                    'booked': booked,
+                    'free': max(slot_capacity - booked, 0),
+                }
+                for start, booked in occupancy.items()
+            ],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def by_employee(self, request):
+        """Записи сотрудника во всех доступных планах: ?employee_id=ID"""
+        try:
+            employee_id = int(request.query_params.get('employee_id', ''))
+        except ValueError:
+            return Response({'error': 'Укажите employee_id'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        slots = CalendarPlanService.employee_slots(employee_id, self._accessible_slots()).order_by('date', 'time', 'id')
+        return Response(CalendarSlotSerializer(slots, many=True).data)
 
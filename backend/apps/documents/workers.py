@@ -0,0 +1,44 @@
+"""
+Функции, выполняемые в дочерних процессах пакетного формирования документов
+
+Модуль импортируется дочерним процессом до инициализации Django, поэтому
+модели и сервисы импортируются внутри функций.
+"""
+import time
+
+
+def init_worker():
+    """Инициализация процесса: собственная настройка Django и собственные подключения к БД"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from django.db import connections
+    connections.close_all()
+
+
+def generate_document(job_type: str, employer_id: int, clinic_id: int, year: int) -> dict:
+    """
+    Сформировать один документ задания
+
+    Returns:
+        {'document_id': ..., 'elapsed': секунды}
+    """
+    from apps.organizations.models import Organization
+    from .models import DocumentJobType
+    from .services import DocumentService
+
+    start = time.perf_counter()
+    employer = Organization.objects.get(id=employer_id, org_type='employer')
+
+    if job_type == DocumentJobType.SEASON_APPENDIX_3:
+        document = DocumentService.generate_appendix_3(employer, year)
+    elif job_type == DocumentJobType.SEASON_FINAL_ACT:
+        clinic = Organization.objects.get(id=clinic_id, org_type='clinic')
+        document = DocumentService.generate_final_act(employer, clinic, year)
+    else:
+        raise ValueError(f'Неизвестный тип задания: {job_type}')
+
+    return {'document_id': document.id, 'elapsed': time.perf_counter() - start}
@@ -6,7 +6,9 @@ from .models import (
     MedicalExamination,
     ExaminationRoute,
     DoctorExamination,
-    LaboratoryResult
+    LaboratoryResult,
+    ExaminationDueDate,
+    ClinicDailyLoad
 )
 
 
@@ -20,11 +22,13 @@ class MedicalExaminationAdmin(admin.ModelAdmin):
 
 @admin.register(ExaminationRoute)
 class ExaminationRouteAdmin(admin.ModelAdmin):
-    list_display = ['examination', 'doctors_count']
+    list_display = ['examination', 'doctors_count', 'completed_count', 'is_complete']
+    list_filter = ['is_complete']
     filter_horizontal = ['doctors_required']
+    readonly_fields = ['required_count', 'completed_count', 'is_complete']
     
     def doctors_count(self, obj):
-        return obj.doctors_required.count()
+        return obj.required_count
     doctors_count.short_description = 'Количество врачей'
 
 
@@ -41,3 +45,18 @@ class LaboratoryResultAdmin(admin.ModelAdmin):
     list_filter = ['is_normal', 'performed_at']
     search_fields = ['test_name', 'test_code']
 
+
+
+@admin.register(ExaminationDueDate)
+class ExaminationDueDateAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'employer', 'harmful_factor', 'last_completed_date', 'next_due_date']
+    list_filter = ['employer', 'harmful_factor']
+    search_fields = ['employee__first_name', 'employee__last_name', 'employee__iin']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(ClinicDailyLoad)
+class ClinicDailyLoadAdmin(admin.ModelAdmin):
+    list_display = ['clinic', 'date', 'booked']
+    list_filter = ['clinic']
+    date_hierarchy = 'date'
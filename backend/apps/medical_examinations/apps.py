@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MedicalExaminationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.medical_examinations'
+
+    def ready(self):
+        import apps.medical_examinations.signals  # noqa
@@ -0,0 +1,24 @@
+"""
+Заполнение таблицы сроков осмотров по истории осмотров
+Использование: python manage.py backfill_due_dates [--employer ID] [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+
+from apps.organizations.models import Employee
+from apps.medical_examinations.services import DueDateService
+
+
+class Command(BaseCommand):
+    help = 'Пересчет сроков следующих осмотров (сотрудник × вредный фактор) по истории осмотров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employer', type=int, help='ID работодателя (по умолчанию - все)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.all()
+        if options['employer']:
+            employees = employees.filter(employer_id=options['employer'])
+
+        total = DueDateService.refresh_queryset(employees, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Актуальных сроков: {total}'))
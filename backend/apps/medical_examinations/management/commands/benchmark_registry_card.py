@@ -0,0 +1,132 @@
+"""
+Бенчмарк карточки регистратуры (сканер QR-кодов)
+Использование: python manage.py benchmark_registry_card [--examinations 500] [--scans 5000]
+
+На синтетических данных (в транзакции, которая откатывается в конце)
+замеряются: полная сериализация by_qr, карточка без кэша и карточка из кэша -
+как вызов сервиса и как HTTP-запрос к эндпоинту card. Используется кэш из
+настроек (в production - Redis). Выводятся p50/p99 в миллисекундах.
+"""
+import random
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.organizations.models import Organization, OrganizationMember, Employee
+from apps.compliance.models import HarmfulFactor, Profession
+from apps.medical_examinations.registry import RegistryCardService, _card_key
+from apps.medical_examinations.services import ExaminationService
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return (
+        ordered[len(ordered) // 2] * 1000,
+        ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк карточки регистратуры: p50/p99 с кэшем и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--examinations', type=int, default=500)
+        parser.add_argument('--scans', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            # Тестовый клиент обращается к хосту testserver
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+                self.run(options['examinations'], options['scans'], random.Random(options['seed']))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def run(self, count, scans, rng):
+        prefix = '97'
+        owner = User.objects.create(phone_number=f'{prefix}000000000', username=f'{prefix}000000000')
+        clinic = Organization.objects.create(name='Бенчмарк регистратуры', org_type='clinic', owner=owner)
+        employer = Organization.objects.create(name='Бенчмарк работодатель', org_type='employer', owner=owner)
+        factor = HarmfulFactor.objects.create(
+            code='bench-card', name='Шум', periodicity_months=12, required_doctors=['ЛОР', 'Терапевт']
+        )
+        profession = Profession.objects.create(name='Бенчмарк регистратуры')
+        profession.harmful_factors.add(factor)
+        for i, (role, specialization) in enumerate([('doctor', 'ЛОР'), ('doctor', 'Терапевт'), ('profpathologist', '')]):
+            user = User.objects.create(phone_number=f'{prefix}99999999{i}', username=f'{prefix}99999999{i}')
+            OrganizationMember.objects.create(organization=clinic, user=user, role=role, specialization=specialization)
+
+        users = User.objects.bulk_create([
+            User(phone_number=f'{prefix}{i:08d}2', username=f'{prefix}{i:08d}2') for i in range(count)
+        ], batch_size=5000)
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user, employer=employer, first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                position=profession, hire_date=timezone.now().date() - timedelta(days=400)
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        scheduled = timezone.now() + timedelta(days=1)
+        examinations = ExaminationService.bulk_create_examinations(
+            clinic, employer, [(employee, scheduled) for employee in employees]
+        )
+        qr_codes = [examination.qr_code for examination in examinations]
+        sample = [rng.choice(qr_codes) for _ in range(scans)]
+        cache.delete_many([_card_key(qr_code) for qr_code in qr_codes])
+
+        client = APIClient()
+        client.force_authenticate(owner)
+
+        misses = {}
+
+        def measure(call, codes, hits_only=False):
+            """hits_only: замер только попаданий в кэш (промахи - после вытеснения из кэша - считаются отдельно)"""
+            samples = []
+            for qr_code in codes:
+                if hits_only and cache.get(_card_key(qr_code)) is None:
+                    misses[call] = misses.get(call, 0) + 1
+                    call(qr_code)
+                    continue
+                began = time.perf_counter()
+                result = call(qr_code)
+                samples.append(time.perf_counter() - began)
+                if result is None or getattr(result, 'status_code', 200) != 200:
+                    raise RuntimeError(f'Неожиданный ответ для {qr_code}: {result}')
+            return _percentiles(samples)
+
+        full_codes = sample[:min(scans, 500)]
+        results = [
+            ('by_qr (HTTP)', measure(
+                lambda qr_code: client.get('/api/examinations/examinations/by_qr/', {'qr_code': qr_code}), full_codes
+            )),
+            ('Карточка без кэша', measure(RegistryCardService.get_card, qr_codes)),
+            ('Карточка из кэша', measure(RegistryCardService.get_card, sample, hits_only=True)),
+            ('card (HTTP, кэш)', measure(
+                lambda qr_code: client.get('/api/examinations/examinations/card/', {'qr_code': qr_code}),
+                sample,
+                hits_only=True,
+            )),
+        ]
+
+        self.stdout.write(
+            f"{count} осмотров, {scans} сканирований, кэш {settings.CACHES['default']['BACKEND']}, "
+            f"промахов в замерах с кэшем: {sum(misses.values())}"
+        )
+        self.stdout.write(f"{'Вариант':<20} {'p50, мс':>9} {'p99, мс':>9}")
+        for name, (p50, p99) in results:
+            self.stdout.write(f"{name:<20} {p50:>9.2f} {p99:>9.2f}")
+        cache.delete_many([_card_key(qr_code) for qr_code in qr_codes])
@@ -0,0 +1,22 @@
+"""
+Пересчет загрузки клиник по дням из назначенных осмотров
+Использование: python manage.py rebuild_clinic_load [--clinic ID]
+
+Нужен после развертывания и после массовых изменений осмотров в обход сигналов
+(queryset.update, загрузка данных).
+"""
+from django.core.management.base import BaseCommand
+
+from apps.medical_examinations.services import CapacityService
+
+
+class Command(BaseCommand):
+    help = 'Пересчет загрузки клиник (ClinicDailyLoad) по осмотрам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='ID клиники (по умолчанию - все)')
+
+    def handle(self, *args, **options):
+        clinic_ids = [options['clinic']] if options['clinic'] else None
+        total = CapacityService.rebuild(clinic_ids)
+        self.stdout.write(self.style.SUCCESS(f'✅ Дней с назначенными осмотрами: {total}'))
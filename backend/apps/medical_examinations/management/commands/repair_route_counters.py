@@ -0,0 +1,29 @@
+"""
+Проверка и исправление счетчиков прогресса маршрутных листов
+Использование: python manage.py repair_route_counters [--examination ID ...]
+
+Счетчики (required_count, completed_count, is_complete) поддерживаются при
+создании осмотров, добавлении результатов врачей и правке маршрутов. Команда
+нужна после изменений в обход этих путей: queryset.update/delete, загрузка
+данных, удаление сотрудника клиники.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.medical_examinations.models import ExaminationRoute
+from apps.medical_examinations.services import ExaminationService
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков прогресса маршрутных листов (только расхождения)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--examination', type=int, nargs='*', help='ID осмотров (по умолчанию - все)')
+
+    def handle(self, *args, **options):
+        route_ids = None
+        if options['examination']:
+            route_ids = ExaminationRoute.objects.filter(
+                examination_id__in=options['examination']
+            ).values_list('id', flat=True)
+        fixed = ExaminationService.refresh_route_counters(route_ids)
+        self.stdout.write(self.style.SUCCESS(f'✅ Исправлено маршрутов: {fixed}'))
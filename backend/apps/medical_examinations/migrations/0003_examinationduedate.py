@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0006_add_employee_form3_fields'),
+        ('compliance', '0002_harmfulfactor_required_doctors_and_more'),
+        ('medical_examinations', '0002_doctorexamination_examinationroute_laboratoryresult_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExaminationDueDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_completed_date', models.DateTimeField(blank=True, null=True, verbose_name='Последний завершенный осмотр')),
+                ('next_due_date', models.DateField(verbose_name='Срок следующего осмотра')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='due_dates', to='organizations.employee', verbose_name='Сотрудник')),
+                ('employer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='examination_due_dates', to='organizations.organization', verbose_name='Работодатель')),
+                ('harmful_factor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='due_dates', to='compliance.harmfulfactor', verbose_name='Вредный фактор')),
+            ],
+            options={
+                'verbose_name': 'Срок осмотра',
+                'verbose_name_plural': 'Сроки осмотров',
+                'indexes': [models.Index(fields=['employer', 'next_due_date'], name='medical_exa_employe_23eed6_idx')],
+                'unique_together': {('employee', 'harmful_factor')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0007_employee_demographics_indexes'),
+        ('medical_examinations', '0003_examinationduedate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicDailyLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('booked', models.IntegerField(default=0, verbose_name='Назначено осмотров')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_loads', to='organizations.organization', verbose_name='Клиника')),
+            ],
+            options={
+                'verbose_name': 'Загрузка клиники',
+                'verbose_name_plural': 'Загрузка клиник',
+                'ordering': ['clinic', 'date'],
+                'unique_together': {('clinic', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_examinations', '0004_clinicdailyload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalexamination',
+            index=models.Index(fields=['clinic', 'scheduled_date'], name='medical_exa_clinic__322142_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, IntegerField, F, Case, When, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_route_counters(apps, schema_editor):
+    """Счетчики существующих маршрутов по врачам маршрута и результатам врачей"""
+    ExaminationRoute = apps.get_model('medical_examinations', 'ExaminationRoute')
+    DoctorExamination = apps.get_model('medical_examinations', 'DoctorExamination')
+    through = ExaminationRoute.doctors_required.through
+
+    def count_of(queryset, field, outer):
+        counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+    ExaminationRoute.objects.update(
+        required_count=count_of(through.objects, 'examinationroute_id', 'pk'),
+        completed_count=count_of(DoctorExamination.objects, 'examination_id', 'examination_id'),
+    )
+    ExaminationRoute.objects.update(is_complete=Case(
+        When(completed_count__gte=F('required_count'), then=Value(True)),
+        default=Value(False),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_examinations', '0005_examination_clinic_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examinationroute',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Пройдено осмотров врачей'),
+        ),
+        migrations.AddField(
+            model_name='examinationroute',
+            name='is_complete',
+            field=models.BooleanField(default=False, verbose_name='Все врачи пройдены'),
+        ),
+        migrations.AddField(
+            model_name='examinationroute',
+            name='required_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Требуется врачей'),
+        ),
+        migrations.AddIndex(
+            model_name='examinationroute',
+            index=models.Index(fields=['is_complete', 'examination'], name='medical_exa_is_comp_3ae1a2_idx'),
+        ),
+        migrations.RunPython(fill_route_counters, migrations.RunPython.noop),
+    ]
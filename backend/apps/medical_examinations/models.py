@@ -85,10 +85,31 @@ class MedicalExamination(models.Model):
         indexes = [
             models.Index(fields=['status', 'scheduled_date']),
             models.Index(fields=['qr_code']),
+            # Занятость слотов записи клиники (CapacityService.slot_occupancy)
+            models.Index(fields=['clinic', 'scheduled_date']),
         ]
 
+    # Поля, изменения которых отслеживаются для учета загрузки клиники (ClinicDailyLoad)
+    TRACKED_FIELDS = ('clinic_id', 'scheduled_date', 'status')
+
     def __str__(self):
         return f"{self.employee.full_name} - {self.get_examination_type_display()}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_state()
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Сигналы post_save уже видели изменения - фиксируем новое состояние
+        self._snapshot_state()
+    
+    def _snapshot_state(self):
+        self._loaded_state = {
+            name: self.__dict__.get(name) for name in self.TRACKED_FIELDS
+        }
 
 
 class ExaminationRoute(models.Model):
@@ -104,11 +125,20 @@ class ExaminationRoute(models.Model):
         related_name='routes',
         verbose_name='Требуемые врачи'
     )
+    # Счетчики прогресса (денормализация): поддерживаются ExaminationService и сигналами,
+    # восстанавливаются командой repair_route_counters
+    required_count = models.PositiveIntegerField(default=0, verbose_name='Требуется врачей')
+    completed_count = models.PositiveIntegerField(default=0, verbose_name='Пройдено осмотров врачей')
+    is_complete = models.BooleanField(default=False, verbose_name='Все врачи пройдены')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = 'Маршрутный лист'
         verbose_name_plural = 'Маршрутные листы'
+        indexes = [
+            # "Осмотры, у которых пройдены все врачи" - без подсчета по DoctorExamination
+            models.Index(fields=['is_complete', 'examination']),
+        ]
 
     def __str__(self):
         return f"Маршрут для {self.examination}"
@@ -180,3 +210,67 @@ class LaboratoryResult(models.Model):
 
     def __str__(self):
         return f"{self.test_name} - {self.result_value}"
+
+
+class ExaminationDueDate(models.Model):
+    """Срок следующего осмотра сотрудника по вредному фактору (поддерживается автоматически)"""
+    employee = models.ForeignKey(
+        'organizations.Employee',
+        on_delete=models.CASCADE,
+        related_name='due_dates',
+        verbose_name='Сотрудник'
+    )
+    # Денормализовано для выборки "кому нужен осмотр до даты X у работодателя Y"
+    employer = models.ForeignKey(
+        'organizations.Organization',
+        on_delete=models.CASCADE,
+        related_name='examination_due_dates',
+        verbose_name='Работодатель'
+    )
+    harmful_factor = models.ForeignKey(
+        'compliance.HarmfulFactor',
+        on_delete=models.CASCADE,
+        related_name='due_dates',
+        verbose_name='Вредный фактор'
+    )
+    last_completed_date = models.DateTimeField(null=True, blank=True, verbose_name='Последний завершенный осмотр')
+    # Если осмотров не было - срок наступил с даты приема на работу
+    next_due_date = models.DateField(verbose_name='Срок следующего осмотра')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Срок осмотра'
+        verbose_name_plural = 'Сроки осмотров'
+        unique_together = ['employee', 'harmful_factor']
+        indexes = [
+            models.Index(fields=['employer', 'next_due_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.harmful_factor_id}: {self.next_due_date}"
+
+
+class ClinicDailyLoad(models.Model):
+    """
+    Загрузка клиники по дням: число назначенных осмотров (все работодатели)
+
+    Поддерживается сигналами MedicalExamination и массовыми операциями
+    ExaminationService; пересчитывается командой rebuild_clinic_load.
+    """
+    clinic = models.ForeignKey(
+        'organizations.Organization',
+        on_delete=models.CASCADE,
+        related_name='daily_loads',
+        verbose_name='Клиника'
+    )
+    date = models.DateField(verbose_name='Дата')
+    booked = models.IntegerField(default=0, verbose_name='Назначено осмотров')
+    
+    class Meta:
+        verbose_name = 'Загрузка клиники'
+        verbose_name_plural = 'Загрузка клиник'
+        unique_together = ['clinic', 'date']
+        ordering = ['clinic', 'date']
+
+    def __str__(self):
+        return f"{self.clinic_id} {self.date}: {self.booked}"
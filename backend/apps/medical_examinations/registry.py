@@ -0,0 +1,409 @@
+"""
+Карточка регистратуры: компактное представление осмотра для сканера QR-кодов
+
+Регистратура по QR-коду видит пациента, кабинеты маршрута (с отметкой
+пройденных) и статус осмотра - без полной сериализации осмотра с результатами
+и анализами. Карточка кэшируется по QR-коду; кэш сбрасывается сигналами при
+изменении осмотра, маршрута, результатов врачей или данных сотрудника.
+
+Манифест регистратуры - карточки всех осмотров клиники на день для планшета,
+который работает без сети: сканы разрешаются локально по хэшу QR-кода, а
+отметки прихода загружаются пачкой позже. Версия манифеста - метка времени
+последнего изменения осмотров дня (updated_at), по ней отдаются только изменения.
+
+Групповая отметка прихода начинает осмотры целой смены работодателя одним
+UPDATE и сразу возвращает их карточки.
+"""
+import hashlib
+import logging
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils import timezone
+
+from apps.organizations.models import OrganizationMember
+from .models import MedicalExamination, DoctorExamination
+
+logger = logging.getLogger(__name__)
+
+_CARD_PREFIX = 'exam-card:'
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _card_key(qr_code: str) -> str:
+    return _CARD_PREFIX + qr_code
+
+
+def _member_name(member) -> str:
+    user = member.user
+    # Отчество временно хранится в email (как в маршрутном листе)
+    parts = [part for part in (user.last_name, user.first_name, user.email) if part]
+    return ' '.join(parts) if parts else user.phone_number
+
+
+class RegistryCardService:
+    """Карточки регистратуры по QR-кодам осмотров"""
+
+    # Осмотры, изменения которых еще синхронизируются в манифест регистратуры
+    MANIFEST_ACTIVE_STATUSES = ('scheduled', 'in_progress')
+
+    @staticmethod
+    def card_queryset(queryset=None):
+        """Осмотры со всем, что нужно карточке (запросов не больше четырех на любую выборку)"""
+        queryset = queryset if queryset is not None else MedicalExamination.objects.all()
+        return queryset.select_related(
+            'employee__position', 'employer', 'clinic', 'route'
+        ).prefetch_related(
+            Prefetch('route__doctors_required', queryset=OrganizationMember.objects.select_related('user')),
+            Prefetch('doctor_examinations', queryset=DoctorExamination.objects.only('id', 'examination_id', 'doctor_id')),
+        )
+
+    @staticmethod
+    def build_card(examination: MedicalExamination) -> dict:
+        """
+        Карточка осмотра (только простые типы - хранится в кэше и отдается как есть)
+
+        Кабинеты маршрута - врачи по специализации, профпатолог последним.
+        """
+        employee = examination.employee
+        try:
+            route = examination.route
+        except MedicalExamination.route.RelatedObjectDoesNotExist:
+            route = None
+        done_ids = {doctor_exam.doctor_id for doctor_exam in examination.doctor_examinations.all()}
+        doctors = sorted(
+            route.doctors_required.all() if route else [],
+            key=lambda member: (member.role == 'profpathologist', member.specialization or '', member.id)
+        )
+        return {
+            'id': examination.id,
+            'qr_code': examination.qr_code,
+            'status': examination.status,
+            'examination_type': examination.examination_type,
+            'scheduled_date': timezone.localtime(examination.scheduled_date).isoformat(),
+            'clinic_id': examination.clinic_id,
+            'employer_id': examination.employer_id,
+            'employer_name': examination.employer.name if examination.employer else None,
+            'patient': {
+                'employee_id': employee.id,
+                'full_name': employee.full_name,
+                'iin': employee.iin,
+                'position': employee.position.name if employee.position else None,
+            },
+            'route': [
+                {
+                    'doctor_id': member.id,
+                    'specialization': 'Профпатолог' if member.role == 'profpathologist' else (member.specialization or 'Врач'),
+                    'name': _member_name(member),
+                    'done': member.id in done_ids,
+                }
+                for member in doctors
+            ],
+            'progress': {
+                'required': route.required_count if route else 0,
+                'completed': route.completed_count if route else 0,
+                'is_complete': route.is_complete if route else True,
+            },
+        }
+
+    @staticmethod
+    def get_card(qr_code: str):
+        """
+        Карточка по QR-коду: из кэша или из БД (с записью в кэш)
+
+        Returns:
+            dict или None, если осмотра с таким QR-кодом нет
+        """
+        key = _card_key(qr_code)
+        try:
+            card = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Кэш карточек недоступен: {e}")
+            card = None
+        if card is not None:
+            return card
+
+        examination = RegistryCardService.card_queryset().filter(qr_code=qr_code).first()
+        if examination is None:
+            return None
+        card = RegistryCardService.build_card(examination)
+        try:
+            cache.set(key, card, timeout=getattr(settings, 'EXAM_CARD_CACHE_SECONDS', 3600))
+        except Exception as e:
+            logger.warning(f"Кэш карточек недоступен: {e}")
+        return card
+
+    @staticmethod
+    def invalidate(qr_codes):
+        """
+        Сбросить карточки: сразу и после фиксации транзакции
+
+        Повторный сброс после фиксации не дает закэшировать данные, прочитанные
+        параллельным запросом до фиксации изменения.
+        """
+        keys = [_card_key(qr_code) for qr_code in qr_codes if qr_code]
+        if not keys:
+            return
+
+        def delete():
+            try:
+                cache.delete_many(keys)
+            except Exception as e:
+                logger.warning(f"Не удалось сбросить карточки регистратуры: {e}")
+
+        delete()
+        transaction.on_commit(delete)
+
+    @staticmethod
+    def get_cards(qr_codes: list) -> list:
+        """Карточки по списку QR-кодов (порядок сохраняется): из кэша одним запросом, недостающие - из БД"""
+        keys = [_card_key(qr_code) for qr_code in qr_codes]
+        try:
+            cached = cache.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Кэш карточек недоступен: {e}")
+            cached = {}
+
+        missing = [qr_code for qr_code, key in zip(qr_codes, keys) if key not in cached]
+        if missing:
+            built = {
+                _card_key(examination.qr_code): RegistryCardService.build_card(examination)
+                for examination in RegistryCardService.card_queryset().filter(qr_code__in=missing)
+            }
+            try:
+                cache.set_many(built, timeout=getattr(settings, 'EXAM_CARD_CACHE_SECONDS', 3600))
+            except Exception as e:
+                logger.warning(f"Кэш карточек недоступен: {e}")
+            cached.update(built)
+        return [cached[key] for key in keys if key in cached]
+
+    @staticmethod
+    def invalidate_examinations(examination_ids):
+        """
+        Сбросить карточки осмотров по ID
+
+        Изменения маршрута, результатов врачей и данных сотрудника не сохраняют
+        сам осмотр, поэтому осмотры, которые может включить манифест регистратуры
+        (запланированные и в процессе, с сегодняшнего дня), отмечаются измененными
+        (updated_at) для синхронизации. Завершенная история не перезаписывается.
+        """
+        examinations = MedicalExamination.objects.filter(id__in=list(examination_ids))
+        examinations.filter(
+            status__in=RegistryCardService.MANIFEST_ACTIVE_STATUSES,
+            scheduled_date__gte=timezone.make_aware(datetime.combine(timezone.localdate(), time.min)),
+        ).update(updated_at=timezone.now())
+        RegistryCardService.invalidate(examinations.values_list('qr_code', flat=True))
+
+
+class RegistryManifestService:
+    """Манифест регистратуры на день для работы планшета без сети"""
+
+    # Не больше отметок прихода в одной загрузке
+    MAX_CHECKINS = 1000
+
+    @staticmethod
+    def qr_hash(qr_code: str) -> str:
+        """Хэш QR-кода: в манифесте на планшете не хранятся сами коды доступа"""
+        return hashlib.sha256(qr_code.encode()).hexdigest()
+
+    @staticmethod
+    def version_token(moment: datetime) -> str:
+        """Версия манифеста - метка времени в микросекундах"""
+        return str((moment - _EPOCH) // timedelta(microseconds=1))
+
+    @staticmethod
+    def parse_version(token: str) -> datetime:
+        try:
+            return _EPOCH + timedelta(microseconds=int(token))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Неверная версия манифеста: {token}")
+
+    @staticmethod
+    def day_examinations(clinic_id: int, day: date):
+        """Осмотры клиники на день (индекс (clinic, scheduled_date))"""
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        return MedicalExamination.objects.filter(
+            clinic_id=clinic_id,
+            scheduled_date__gte=start,
+            scheduled_date__lt=start + timedelta(days=1),
+            qr_code__isnull=False,
+        )
+
+    @staticmethod
+    def manifest_entry(card: dict) -> dict:
+        """Запись манифеста из карточки регистратуры"""
+        return {
+            'id': card['id'],
+            'qr_hash': RegistryManifestService.qr_hash(card['qr_code']),
+            'full_name': card['patient']['full_name'],
+            'time': datetime.fromisoformat(card['scheduled_date']).strftime('%H:%M'),
+            'status': card['status'],
+            'route': [
+                {'specialization': item['specialization'], 'name': item['name'], 'done': item['done']}
+                for item in card['route']
+            ],
+            'progress': card['progress'],
+        }
+
+    @staticmethod
+    def build_manifest(clinic_id: int, day: date, since: str = None) -> dict:
+        """
+        Манифест осмотров клиники на день
+
+        Без since - полный манифест. С since (версия предыдущего манифеста) - только
+        осмотры, измененные после нее, и ids всех осмотров дня: осмотры, которых
+        нет в ids (перенесены на другой день), планшет удаляет. Изменения ищутся с
+        запасом REGISTRY_SYNC_OVERLAP_SECONDS - на транзакции, зафиксированные
+        позже своей метки времени; повторно присланные записи планшет просто
+        заменяет по id.
+
+        Raises:
+            ValueError: неверная версия since
+        """
+        examinations = RegistryManifestService.day_examinations(clinic_id, day)
+        # Версия читается до записей: изменения во время сборки попадут в следующую синхронизацию
+        latest = examinations.aggregate(latest=Max('updated_at'))['latest']
+
+        changed = examinations
+        if since is not None:
+            overlap = timedelta(seconds=getattr(settings, 'REGISTRY_SYNC_OVERLAP_SECONDS', 60))
+            changed = examinations.filter(updated_at__gt=RegistryManifestService.parse_version(since) - overlap)
+        qr_codes = list(changed.order_by('scheduled_date', 'id').values_list('qr_code', flat=True))
+
+        manifest = {
+            'clinic_id': clinic_id,
+            'date': day.isoformat(),
+            'version': RegistryManifestService.version_token(latest) if latest else (since or '0'),
+            'full': since is None,
+            'examinations': [
+                RegistryManifestService.manifest_entry(card) for card in RegistryCardService.get_cards(qr_codes)
+            ],
+        }
+        if since is not None:
+            manifest['ids'] = list(examinations.order_by('id').values_list('id', flat=True))
+        return manifest
+
+    @staticmethod
+    def apply_checkins(clinic_id: int, checkins: list) -> dict:
+        """
+        Отметки прихода, накопленные планшетом без сети: начать осмотры
+
+        Args:
+            checkins: [{'examination_id': ID, 'qr_hash': хэш из манифеста}, ...]
+
+        Returns:
+            {'started': ..., 'results': [{'examination_id': ..., 'result': ...}, ...]}
+            result: started, already_started (в процессе или завершен),
+            cancelled, not_found (не этой клиники или хэш не совпал)
+
+        Raises:
+            ValueError: неверный формат или слишком много отметок
+        """
+        if not isinstance(checkins, list) or not checkins:
+            raise ValueError("Укажите непустой список отметок checkins")
+        if len(checkins) > RegistryManifestService.MAX_CHECKINS:
+            raise ValueError(f"Не больше {RegistryManifestService.MAX_CHECKINS} отметок за одну загрузку")
+        try:
+            parsed = [(int(checkin['examination_id']), str(checkin['qr_hash'])) for checkin in checkins]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Каждая отметка - {'examination_id': ID, 'qr_hash': хэш QR-кода из манифеста}")
+
+        results = []
+        starting = []
+        with transaction.atomic():
+            examinations = MedicalExamination.objects.select_for_update().filter(
+                clinic_id=clinic_id, id__in={examination_id for examination_id, _ in parsed}
+            ).only('id', 'qr_code', 'status').in_bulk()
+            for examination_id, qr_hash in parsed:
+                examination = examinations.get(examination_id)
+                if examination is None or not examination.qr_code or (
+                    RegistryManifestService.qr_hash(examination.qr_code) != qr_hash
+                ):
+                    result = 'not_found'
+                elif examination.status == 'scheduled' and examination not in starting:
+                    starting.append(examination)
+                    result = 'started'
+                elif examination.status == 'cancelled':
+                    result = 'cancelled'
+                else:
+                    result = 'already_started'
+                results.append({'examination_id': examination_id, 'result': result})
+            RegistryCheckinService.start_scheduled(starting)
+        return {'started': len(starting), 'results': results}
+
+
+class RegistryCheckinService:
+    """Отметка прихода: начало осмотров при регистрации пациентов"""
+
+    @staticmethod
+    def start_scheduled(examinations: list) -> list:
+        """
+        Начать запланированные осмотры одним UPDATE (в транзакции, строки заблокированы)
+
+        queryset.update не вызывает сигналы: загрузку клиники переход
+        scheduled -> in_progress не меняет, карточки регистратуры сбрасываются
+        здесь, updated_at обновляется для синхронизации манифеста.
+
+        Returns:
+            ID начатых осмотров
+        """
+        started = [examination for examination in examinations if examination.status == 'scheduled']
+        if not started:
+            return []
+        MedicalExamination.objects.filter(
+            id__in=[examination.id for examination in started], status='scheduled'
+        ).update(status='in_progress', updated_at=timezone.now())
+        RegistryCardService.invalidate([examination.qr_code for examination in started])
+        for examination in started:
+            examination.status = 'in_progress'
+        return [examination.id for examination in started]
+
+    @staticmethod
+    def group_checkin(clinic_id: int, qr_codes: list = None, employer_id: int = None, day: date = None) -> dict:
+        """
+        Групповая отметка прихода (смена работников одного работодателя)
+
+        Осмотры выбираются по списку QR-кодов или по работодателю и дню (кроме
+        отмененных), запланированные начинаются одним UPDATE в одной транзакции.
+        Карточки всех найденных осмотров возвращаются в ответе (после фиксации -
+        из кэша и с записью в кэш).
+
+        Returns:
+            {'started': ..., 'started_ids': [...], 'not_found': [QR-коды], 'cards': [...]}
+
+        Raises:
+            ValueError: не указаны QR-коды или работодатель с днем, слишком много QR-кодов
+        """
+        if qr_codes is not None:
+            if not isinstance(qr_codes, list) or not qr_codes:
+                raise ValueError("Укажите непустой список qr_codes")
+            if len(qr_codes) > RegistryManifestService.MAX_CHECKINS:
+                raise ValueError(f"Не больше {RegistryManifestService.MAX_CHECKINS} QR-кодов за одну отметку")
+            qr_codes = list(dict.fromkeys(str(qr_code) for qr_code in qr_codes))
+            examinations = MedicalExamination.objects.filter(clinic_id=clinic_id, qr_code__in=qr_codes)
+        elif employer_id and day:
+            examinations = RegistryManifestService.day_examinations(clinic_id, day).filter(
+                employer_id=employer_id
+            ).exclude(status='cancelled').order_by('scheduled_date', 'id')
+        else:
+            raise ValueError("Укажите qr_codes или employer_id и date")
+
+        with transaction.atomic():
+            locked = list(examinations.select_for_update().only('id', 'qr_code', 'status'))
+            started_ids = RegistryCheckinService.start_scheduled(locked)
+
+        found = {examination.qr_code for examination in locked}
+        if qr_codes is not None:
+            ordered = [qr_code for qr_code in qr_codes if qr_code in found]
+            not_found = [qr_code for qr_code in qr_codes if qr_code not in found]
+        else:
+            ordered = [examination.qr_code for examination in locked]
+            not_found = []
+        return {
+            'started': len(started_ids),
+            'started_ids': started_ids,
+            'not_found': not_found,
+            'cards': RegistryCardService.get_cards(ordered),
+        }
@@ -6,7 +6,8 @@ from .models import (
     MedicalExamination,
     ExaminationRoute,
     DoctorExamination,
-    LaboratoryResult
+    LaboratoryResult,
+    ExaminationDueDate
 )
 from apps.organizations.serializers import EmployeeSerializer
 
@@ -40,7 +41,11 @@ class ExaminationRouteSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ExaminationRoute
-        fields = ['id', 'examination', 'doctors_required', 'doctors_required_info']
+        fields = [
+            'id', 'examination', 'doctors_required', 'doctors_required_info',
+            'required_count', 'completed_count', 'is_complete'
+        ]
+        read_only_fields = ['required_count', 'completed_count', 'is_complete']
     
     def get_doctors_required_info(self, obj):
         result = []
@@ -99,3 +104,17 @@ class MedicalExaminationCreateSerializer(serializers.ModelSerializer):
             'examination_type', 'employee', 'clinic', 'scheduled_date', 'reason'
         ]
 
+
+
+class ExaminationDueDateSerializer(serializers.ModelSerializer):
+    employee_name = serializers.CharField(source='employee.full_name', read_only=True)
+    harmful_factor_code = serializers.CharField(source='harmful_factor.code', read_only=True)
+    harmful_factor_name = serializers.CharField(source='harmful_factor.name', read_only=True)
+    
+    class Meta:
+        model = ExaminationDueDate
+        fields = [
+            'id', 'employee', 'employee_name', 'employer', 'harmful_factor',
+            'harmful_factor_code', 'harmful_factor_name',
+            'last_completed_date', 'next_due_date'
+        ]
@@ -1,15 +1,20 @@
 """
 Medical examination services - Логика осмотров
 """
+import heapq
+import math
 import uuid
-from datetime import datetime, timedelta
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q
-from .models import MedicalExamination, ExaminationRoute, DoctorExamination
-from apps.compliance.models import HarmfulFactor
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Max, F, Count, Prefetch, OuterRef, Subquery, IntegerField, Case, When, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from .models import MedicalExamination, ExaminationRoute, DoctorExamination, ExaminationDueDate, ClinicDailyLoad
+from apps.compliance.models import HarmfulFactor, Profession
 from apps.compliance.services import ComplianceService
-from apps.organizations.models import OrganizationMember
+from apps.organizations.models import OrganizationMember, Employee
 
 
 class ExaminationService:
@@ -67,10 +72,8 @@ class ExaminationService:
         if employee.position:
             factors = list(employee.position.harmful_factors.filter(is_active=True))
         
-        # Создаем маршрутный лист
-        route = ExaminationRoute.objects.create(examination=examination)
-        
         # Находим нужных врачей в клинике
+        doctor_ids = set()
         if factors:
             required_doctor_specializations = ComplianceService.get_required_doctors_for_factors(factors)
             
@@ -90,9 +93,8 @@ class ExaminationService:
             ).first()
             
             if profpathologist:
-                route.doctors_required.add(profpathologist)
-            if doctors.exists():
-                route.doctors_required.add(*doctors)
+                doctor_ids.add(profpathologist.id)
+            doctor_ids.update(doctors.values_list('id', flat=True))
         else:
             # Если нет факторов, назначаем профпатолога для общего осмотра
             profpathologist = OrganizationMember.objects.filter(
@@ -101,10 +103,120 @@ class ExaminationService:
                 is_active=True
             ).first()
             if profpathologist:
-                route.doctors_required.add(profpathologist)
+                doctor_ids.add(profpathologist.id)
+        
+        # Маршрутный лист сразу со счетчиками прогресса
+        route = ExaminationRoute.objects.create(
+            examination=examination,
+            required_count=len(doctor_ids),
+            is_complete=not doctor_ids,
+        )
+        if doctor_ids:
+            route.doctors_required.add(*sorted(doctor_ids))
         
         return examination
     
+    @staticmethod
+    @transaction.atomic
+    def bulk_create_examinations(
+        clinic,
+        employer,
+        entries,
+        examination_type: str = 'periodic',
+        batch_size: int = 1000
+    ) -> list:
+        """
+        Массовое создание осмотров с маршрутными листами (для календарного плана)
+        
+        Врачи клиники и вредные факторы должностей загружаются один раз; осмотры,
+        маршрутные листы и связи с врачами создаются через bulk_create пакетами.
+        Маршрут формируется по тем же правилам, что и в create_examination.
+        
+        Args:
+            clinic: Клиника
+            employer: Работодатель
+            entries: [(Employee, scheduled_datetime), ...]
+            
+        Returns:
+            Список созданных MedicalExamination (в порядке entries)
+        """
+        entries = list(entries)
+        if not entries:
+            return []
+        
+        members = list(OrganizationMember.objects.filter(
+            organization=clinic,
+            is_active=True,
+            role__in=['doctor', 'profpathologist']
+        ).order_by('id'))
+        profpathologist = next((m for m in members if m.role == 'profpathologist'), None)
+        general_doctor = members[0] if members else None
+        
+        through = Profession.harmful_factors.through
+        factors_by_position = {}
+        for link in through.objects.filter(
+            profession_id__in={employee.position_id for employee, _ in entries if employee.position_id},
+            harmfulfactor__is_active=True
+        ).select_related('harmfulfactor'):
+            factors_by_position.setdefault(link.profession_id, []).append(link.harmfulfactor)
+        
+        doctors_by_position = {}
+        
+        def route_doctor_ids(position_id):
+            if position_id not in doctors_by_position:
+                factors = factors_by_position.get(position_id, [])
+                if factors:
+                    specializations = set(ComplianceService.get_required_doctors_for_factors(factors))
+                    ids = {m.id for m in members if m.role == 'doctor' and m.specialization in specializations}
+                    if profpathologist:
+                        ids.add(profpathologist.id)
+                else:
+                    # Если нет факторов, назначаем профпатолога (или врача) для общего осмотра
+                    ids = {general_doctor.id} if general_doctor else set()
+                doctors_by_position[position_id] = sorted(ids)
+            return doctors_by_position[position_id]
+        
+        examinations = MedicalExamination.objects.bulk_create([
+            MedicalExamination(
+                examination_type=examination_type,
+                employee=employee,
+                employer=employer or employee.employer,
+                clinic=clinic,
+                scheduled_date=scheduled_date,
+                qr_code=ExaminationService.generate_qr_code(),
+                status='scheduled'
+            )
+            for employee, scheduled_date in entries
+        ], batch_size=batch_size)
+        
+        routes = ExaminationRoute.objects.bulk_create([
+            ExaminationRoute(
+                examination=examination,
+                required_count=len(route_doctor_ids(employee.position_id)),
+                is_complete=not route_doctor_ids(employee.position_id),
+            )
+            for examination, (employee, _) in zip(examinations, entries)
+        ], batch_size=batch_size)
+        
+        route_through = ExaminationRoute.doctors_required.through
+        route_through.objects.bulk_create([
+            route_through(examinationroute_id=route.id, organizationmember_id=doctor_id)
+            for route, (employee, _) in zip(routes, entries)
+            for doctor_id in route_doctor_ids(employee.position_id)
+        ], batch_size=batch_size)
+        
+        # bulk_create не вызывает сигналы - загрузку клиники обновляем сами
+        booked = {}
+        for examination in examinations:
+            key = CapacityService.load_key(examination.clinic_id, examination.scheduled_date, examination.status)
+            booked[key] = booked.get(key, 0) + 1
+        for (clinic_id, day), count in booked.items():
+            CapacityService.book(clinic_id, day, count)
+        
+        for examination in examinations:
+            examination._snapshot_state()
+        return examinations
+    
     @staticmethod
     def start_examination(examination: MedicalExamination) -> MedicalExamination:
         """Начать осмотр (изменить статус на IN_PROGRESS)"""
@@ -184,12 +296,15 @@ class ExaminationService:
         examination.completed_date = timezone.now()
         examination.save()
         
+        # Обновляем сроки следующих осмотров по факторам сотрудника
+        DueDateService.refresh_employees([examination.employee_id])
+        
         # Автоматически генерируем справку 075/у
         from apps.documents.services import DocumentService
         DocumentService.generate_medical_certificate(examination)
         
-        # Отправляем уведомление работодателю о завершении осмотра
-        from apps.authentication.services import GreenAPIService
+        # Уведомление работодателю о завершении осмотра (через очередь, после фиксации)
+        from apps.authentication.services import NotificationService
         if examination.employer and examination.employer.owner.phone_number:
             message = (
                 f"Осмотр сотрудника {examination.employee.full_name} завершен.\n"
@@ -197,16 +312,105 @@ class ExaminationService:
                 f"🏥 Клиника: {examination.clinic.name}\n"
                 f"📄 Справка 075/у сформирована и доступна в системе."
             )
-            try:
-                GreenAPIService.send_whatsapp_message(
-                    examination.employer.owner.phone_number,
-                    message
-                )
-            except Exception:
-                pass  # Не критично
+            NotificationService.enqueue(
+                examination.employer.owner.phone_number,
+                message,
+                dedupe_key=f"exam-completed:{examination.id}"
+            )
         
         return examination
     
+    @staticmethod
+    def count_completed(examination_id: int, delta: int):
+        """
+        Изменить счетчик пройденных врачей маршрута на delta (атомарно, одним UPDATE)
+        
+        Признак is_complete вычисляется в том же запросе по значениям до обновления.
+        """
+        ExaminationRoute.objects.filter(examination_id=examination_id).update(
+            completed_count=Greatest(F('completed_count') + delta, 0),
+            is_complete=Case(
+                When(required_count__lte=F('completed_count') + delta, then=Value(True)),
+                default=Value(False),
+            ),
+        )
+    
+    @staticmethod
+    def refresh_route_counters(route_ids=None, batch_size: int = 5000) -> int:
+        """
+        Пересчитать счетчики маршрутов по врачам маршрута и DoctorExamination
+        
+        Сохраняются только маршруты с расхождениями (проверка пачками по id).
+        
+        Args:
+            route_ids: ID маршрутов (по умолчанию - все)
+        
+        Returns:
+            Количество исправленных маршрутов
+        """
+        def count_of(queryset, field, outer):
+            counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count')
+            return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+        
+        routes = ExaminationRoute.objects.all()
+        if route_ids is not None:
+            routes = routes.filter(id__in=list(route_ids))
+        ids = list(routes.order_by('id').values_list('id', flat=True))
+        
+        fixed = 0
+        for index in range(0, len(ids), batch_size):
+            batch = ExaminationRoute.objects.filter(id__in=ids[index:index + batch_size]).annotate(
+                actual_required=count_of(
+                    ExaminationRoute.doctors_required.through.objects, 'examinationroute_id', 'pk'
+                ),
+                actual_completed=count_of(DoctorExamination.objects, 'examination_id', 'examination_id'),
+            ).annotate(
+                actual_complete=Case(
+                    When(actual_completed__gte=F('actual_required'), then=Value(True)),
+                    default=Value(False),
+                ),
+            )
+            for route in batch.filter(
+                ~Q(required_count=F('actual_required'))
+                | ~Q(completed_count=F('actual_completed'))
+                | ~Q(is_complete=F('actual_complete'))
+            ):
+                route.required_count = route.actual_required
+                route.completed_count = route.actual_completed
+                route.is_complete = route.actual_complete
+                route.save(update_fields=['required_count', 'completed_count', 'is_complete'])
+                fixed += 1
+        return fixed
+    
+    @staticmethod
+    def ready_for_conclusion(queryset=None):
+        """Осмотры в процессе, у которых пройдены все врачи маршрута (индекс по is_complete)"""
+        queryset = queryset if queryset is not None else MedicalExamination.objects.all()
+        return queryset.filter(status='in_progress', route__is_complete=True)
+
+    @staticmethod
+    def with_related(queryset):
+        """
+        План загрузки для MedicalExaminationSerializer: число запросов не зависит
+        от числа осмотров на странице (связи одним запросом на каждую, прогресс -
+        из счетчиков маршрута)
+        """
+        return queryset.select_related(
+            'employee__user', 'employee__employer', 'employee__position', 'employer', 'clinic', 'route'
+        ).prefetch_related(
+            'employee__position__harmful_factors',
+            Prefetch('route__doctors_required', queryset=OrganizationMember.objects.select_related('user')),
+            Prefetch(
+                'doctor_examinations',
+                queryset=DoctorExamination.objects.select_related(
+                    'doctor__user', 'harmful_factor'
+                ).prefetch_related('contraindications_found'),
+            ),
+            'laboratory_results',
+        )
+    
     @staticmethod
     def get_examination_progress(examination: MedicalExamination) -> dict:
         """
@@ -215,14 +419,365 @@ class ExaminationService:
         Returns:
             Словарь с информацией о прогрессе
         """
-        route = examination.route
-        total_doctors = route.doctors_required.count()
-        completed_exams = examination.doctor_examinations.count()
+        # Счетчики хранятся в маршрутном листе (без подсчета связей)
+        try:
+            route = examination.route
+        except ExaminationRoute.DoesNotExist:
+            route = None
+        total_doctors = route.required_count if route else 0
+        completed_exams = route.completed_count if route else 0
         
         return {
             'total_doctors': total_doctors,
             'completed_exams': completed_exams,
             'progress_percent': int((completed_exams / total_doctors * 100)) if total_doctors > 0 else 0,
-            'is_complete': completed_exams >= total_doctors,
+            'is_complete': route.is_complete if route else True,
         }
 
+
+class DueDateService:
+    """
+    Сроки следующих осмотров по парам (сотрудник, вредный фактор)
+    
+    Таблица ExaminationDueDate поддерживается при завершении осмотров и при
+    изменении должности/факторов, поэтому выборка "кому нужен осмотр до даты X"
+    не требует просмотра истории осмотров.
+    """
+    
+    @staticmethod
+    def next_due_date(employee: Employee, factor: HarmfulFactor, last_completed):
+        """Срок следующего осмотра (правило периодичности как в Приложении 3)"""
+        if not last_completed:
+            return employee.hire_date
+        return last_completed.date() + timedelta(days=30 * factor.periodicity_months)
+    
+    @staticmethod
+    @transaction.atomic
+    def refresh_employees(employee_ids) -> int:
+        """
+        Пересчитать сроки для указанных сотрудников (количество запросов не зависит от их числа)
+        
+        Returns:
+            Количество актуальных записей
+        """
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return 0
+        
+        employees = {
+            e.id: e for e in Employee.objects.filter(
+                id__in=employee_ids,
+                is_active=True,
+                position__isnull=False
+            ).only('id', 'employer_id', 'position_id', 'hire_date')
+        }
+        
+        through = Profession.harmful_factors.through
+        factors_by_position = {}
+        for link in through.objects.filter(
+            profession_id__in={e.position_id for e in employees.values()},
+            harmfulfactor__is_active=True
+        ).select_related('harmfulfactor'):
+            factors_by_position.setdefault(link.profession_id, []).append(link.harmfulfactor)
+        
+        last_completed = {
+            (row['examination__employee_id'], row['harmful_factor_id']): row['last_completed']
+            for row in DoctorExamination.objects.filter(
+                examination__employee_id__in=list(employees),
+                examination__status='completed'
+            ).values('examination__employee_id', 'harmful_factor_id').annotate(
+                last_completed=Max('examination__completed_date')
+            ).order_by()
+        }
+        
+        existing = {
+            (d.employee_id, d.harmful_factor_id): d
+            for d in ExaminationDueDate.objects.filter(employee_id__in=employee_ids)
+        }
+        
+        to_create, to_update, actual = [], [], set()
+        for employee in employees.values():
+            for factor in factors_by_position.get(employee.position_id, []):
+                key = (employee.id, factor.id)
+                actual.add(key)
+                last = last_completed.get(key)
+                due = DueDateService.next_due_date(employee, factor, last)
+                
+                record = existing.get(key)
+                if record is None:
+                    to_create.append(ExaminationDueDate(
+                        employee_id=employee.id,
+                        employer_id=employee.employer_id,
+                        harmful_factor_id=factor.id,
+                        last_completed_date=last,
+                        next_due_date=due
+                    ))
+                elif (record.employer_id, record.last_completed_date, record.next_due_date) != (employee.employer_id, last, due):
+                    record.employer_id = employee.employer_id
+                    record.last_completed_date = last
+                    record.next_due_date = due
+                    to_update.append(record)
+        
+        stale_ids = [record.id for key, record in existing.items() if key not in actual]
+        if stale_ids:
+            ExaminationDueDate.objects.filter(id__in=stale_ids).delete()
+        if to_create:
+            ExaminationDueDate.objects.bulk_create(to_create, batch_size=1000)
+        if to_update:
+            ExaminationDueDate.objects.bulk_update(
+                to_update,
+                ['employer', 'last_completed_date', 'next_due_date'],
+                batch_size=1000
+            )
+        
+        return len(actual)
+    
+    @staticmethod
+    def refresh_queryset(employees, batch_size: int = 1000) -> int:
+        """Пересчитать сроки для набора сотрудников пакетами"""
+        total = 0
+        batch = []
+        for employee_id in employees.values_list('id', flat=True).order_by('id').iterator(chunk_size=batch_size):
+            batch.append(employee_id)
+            if len(batch) >= batch_size:
+                total += DueDateService.refresh_employees(batch)
+                batch = []
+        if batch:
+            total += DueDateService.refresh_employees(batch)
+        return total
+    
+    @staticmethod
+    def refresh_for_professions(profession_ids) -> int:
+        """Пересчитать сроки сотрудников, занимающих указанные должности"""
+        return DueDateService.refresh_queryset(
+            Employee.objects.filter(position_id__in=list(profession_ids))
+        )
+    
+    @staticmethod
+    def refresh_for_factor(factor: HarmfulFactor) -> int:
+        """Пересчитать сроки после изменения вредного фактора"""
+        return DueDateService.refresh_queryset(
+            Employee.objects.filter(
+                Q(position__harmful_factors=factor) | Q(due_dates__harmful_factor=factor)
+            ).distinct()
+        )
+    
+    @staticmethod
+    def due_before(employer, date):
+        """Кому нужен осмотр до даты (индексный диапазон по (employer, next_due_date))"""
+        return ExaminationDueDate.objects.filter(
+            employer=employer,
+            next_due_date__lte=date
+        ).order_by('next_due_date')
+
+
+class CapacityService:
+    """
+    Учет загрузки клиник по дням (ClinicDailyLoad)
+    
+    Загрузка складывается из осмотров всех работодателей, поэтому календарные
+    планы разных работодателей не назначают одну клинику сверх capacity_per_day.
+    Выходные и праздники (CLINIC_HOLIDAYS) не считаются рабочими днями.
+    
+    Внутри дня прием делится на слоты (Organization.slot_minutes с exam_day_start
+    до exam_day_end); занятость слота считается по осмотрам через индекс
+    (clinic, scheduled_date), новые записи ставятся в наименее занятые слоты.
+    """
+    
+    # Статусы, не занимающие место в расписании клиники
+    FREE_STATUSES = ('cancelled',)
+    
+    @staticmethod
+    def load_key(clinic_id, scheduled_date, status):
+        """(клиника, день) для загрузки или None, если осмотр место не занимает"""
+        if not clinic_id or not scheduled_date or status in CapacityService.FREE_STATUSES:
+            return None
+        if isinstance(scheduled_date, datetime):
+            scheduled_date = timezone.localdate(scheduled_date) if timezone.is_aware(scheduled_date) else scheduled_date.date()
+        return clinic_id, scheduled_date
+    
+    @staticmethod
+    def is_working_day(day: date) -> bool:
+        if day.weekday() >= 5:
+            return False
+        holidays = getattr(settings, 'CLINIC_HOLIDAYS', [])
+        return day.strftime('%m-%d') not in holidays and day.isoformat() not in holidays
+    
+    @staticmethod
+    def adjust(clinic_id: int, day: date, delta: int):
+        """Изменить загрузку дня на delta (атомарно, без чтения текущего значения)"""
+        if not delta:
+            return
+        updated = ClinicDailyLoad.objects.filter(clinic_id=clinic_id, date=day).update(booked=F('booked') + delta)
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                ClinicDailyLoad.objects.create(clinic_id=clinic_id, date=day, booked=max(delta, 0))
+        except IntegrityError:
+            # Запись создана параллельно
+            ClinicDailyLoad.objects.filter(clinic_id=clinic_id, date=day).update(booked=F('booked') + delta)
+    
+    @staticmethod
+    def book(clinic_id: int, day: date, count: int = 1):
+        CapacityService.adjust(clinic_id, day, count)
+    
+    @staticmethod
+    def release(clinic_id: int, day: date, count: int = 1):
+        CapacityService.adjust(clinic_id, day, -count)
+    
+    @staticmethod
+    def booked_by_day(clinic_id: int, start: date, end: date = None) -> dict:
+        """{день: назначено} для клиники начиная с start (диапазон по индексу (clinic, date))"""
+        loads = ClinicDailyLoad.objects.filter(clinic_id=clinic_id, date__gte=start, booked__gt=0)
+        if end:
+            loads = loads.filter(date__lte=end)
+        return dict(loads.values_list('date', 'booked'))
+    
+    @staticmethod
+    def slot_starts(clinic) -> list:
+        """Начала слотов записи в течение дня (time)"""
+        start = clinic.exam_day_start.hour * 60 + clinic.exam_day_start.minute
+        end = clinic.exam_day_end.hour * 60 + clinic.exam_day_end.minute
+        step = clinic.slot_minutes or 30
+        starts = [time(minute // 60, minute % 60) for minute in range(start, end, step)]
+        return starts or [clinic.exam_day_start]
+    
+    @staticmethod
+    def slot_start(starts: list, moment: time) -> time:
+        """Начало слота, к которому относится время (до начала приема - первый слот)"""
+        return starts[max(bisect_right(starts, moment) - 1, 0)]
+    
+    @staticmethod
+    def slot_capacity(clinic) -> int:
+        """Пациентов на слот: заданное значение или пропускная способность дня, деленная на слоты"""
+        if clinic.slot_capacity:
+            return clinic.slot_capacity
+        return math.ceil((clinic.capacity_per_day or 50) / len(CapacityService.slot_starts(clinic)))
+    
+    @staticmethod
+    def daily_capacity(clinic) -> int:
+        """Мест в день: capacity_per_day, но не больше суммы мест в слотах"""
+        capacity = clinic.capacity_per_day or 50
+        if clinic.slot_capacity:
+            capacity = min(capacity, clinic.slot_capacity * len(CapacityService.slot_starts(clinic)))
+        return capacity
+    
+    @staticmethod
+    def slot_occupancy(clinic, day: date) -> dict:
+        """
+        {начало слота: осмотров} на день (диапазон по индексу (clinic, scheduled_date))
+        
+        Осмотр, назначенный на время внутри слота, относится к этому слоту.
+        """
+        return CapacityService.slot_occupancy_by_day(clinic, [day])[day]
+    
+    @staticmethod
+    def slot_occupancy_by_day(clinic, days) -> dict:
+        """
+        {день: {начало слота: осмотров}} для набора дней - одним запросом
+        
+        Читается весь диапазон от первого до последнего дня (индекс
+        (clinic, scheduled_date)), поэтому план на сотни дней не делает запрос
+        на каждый день.
+        """
+        days = sorted(set(days))
+        starts = CapacityService.slot_starts(clinic)
+        occupancy = {day: {start: 0 for start in starts} for day in days}
+        if not days:
+            return occupancy
+        scheduled = MedicalExamination.objects.filter(
+            clinic=clinic,
+            scheduled_date__gte=timezone.make_aware(datetime.combine(days[0], time.min)),
+            scheduled_date__lt=timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min)),
+        ).exclude(status__in=CapacityService.FREE_STATUSES).values_list('scheduled_date', flat=True)
+        for scheduled_date in scheduled:
+            moment = timezone.localtime(scheduled_date)
+            day_occupancy = occupancy.get(moment.date())
+            if day_occupancy is not None:
+                day_occupancy[CapacityService.slot_start(starts, moment.time())] += 1
+        return occupancy
+    
+    @staticmethod
+    def slot_times(clinic, day: date, count: int, occupancy: dict = None) -> list:
+        """
+        Время прихода для count новых записей на день
+        
+        Каждая запись ставится в наименее занятый слот (при равенстве - в более
+        ранний), поэтому приход распределяется по дню равномерно.
+        occupancy - занятость слотов дня, если уже прочитана (см. slot_occupancy_by_day).
+        
+        Returns:
+            Список time по возрастанию
+        """
+        if occupancy is None:
+            occupancy = CapacityService.slot_occupancy(clinic, day)
+        heap = [(booked, index, start) for index, (start, booked) in enumerate(occupancy.items())]
+        heapq.heapify(heap)
+        times = []
+        for _ in range(count):
+            booked, index, start = heapq.heappop(heap)
+            times.append(start)
+            heapq.heappush(heap, (booked + 1, index, start))
+        return sorted(times)
+    
+    @staticmethod
+    def free_days(clinic, start_date: date, capacity: int = None):
+        """
+        Бесконечный генератор (день, свободно) по рабочим дням со свободными местами
+        
+        Загрузка клиники читается один раз при первом обращении.
+        """
+        capacity = capacity or CapacityService.daily_capacity(clinic)
+        booked = CapacityService.booked_by_day(clinic.id, start_date)
+        day = start_date
+        while True:
+            if CapacityService.is_working_day(day):
+                free = capacity - booked.get(day, 0)
+                if free > 0:
+                    yield day, free
+            day += timedelta(days=1)
+    
+    @staticmethod
+    def allocate(clinic, count: int, start_date: date, capacity: int = None) -> list:
+        """
+        Распределить count осмотров по ближайшим рабочим дням со свободными местами
+        
+        Returns:
+            [(день, количество), ...] по возрастанию дат
+        """
+        allocation = []
+        remaining = count
+        days = CapacityService.free_days(clinic, start_date, capacity)
+        while remaining > 0:
+            day, free = next(days)
+            taken = min(free, remaining)
+            allocation.append((day, taken))
+            remaining -= taken
+        return allocation
+    
+    @staticmethod
+    @transaction.atomic
+    def rebuild(clinic_ids=None) -> int:
+        """
+        Пересчитать загрузку по осмотрам (после массовых операций в обход сигналов)
+        
+        Returns:
+            Количество записей загрузки
+        """
+        examinations = MedicalExamination.objects.exclude(status__in=CapacityService.FREE_STATUSES)
+        loads = ClinicDailyLoad.objects.all()
+        if clinic_ids is not None:
+            examinations = examinations.filter(clinic_id__in=clinic_ids)
+            loads = loads.filter(clinic_id__in=clinic_ids)
+        
+        rows = examinations.annotate(day=TruncDate('scheduled_date')).values(
+            'clinic_id', 'day'
+        ).annotate(booked=Count('id')).order_by()
+        
+        loads.delete()
+        ClinicDailyLoad.objects.bulk_create([
+            ClinicDailyLoad(clinic_id=row['clinic_id'], date=row['day'], booked=row['booked'])
+            for row in rows
+        ], batch_size=1000)
+        return len(rows)
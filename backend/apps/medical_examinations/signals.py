@@ -0,0 +1,140 @@
+"""
+Signals for examination due dates, clinic load, route progress counters
+and registry card cache maintenance
+"""
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from apps.organizations.models import Employee
+from apps.compliance.models import HarmfulFactor, Profession
+from .models import ExaminationDueDate, MedicalExamination, ExaminationRoute, DoctorExamination
+from .services import DueDateService, CapacityService, ExaminationService
+from .registry import RegistryCardService
+
+
+@receiver(post_save, sender=Employee)
+def refresh_employee_due_dates(sender, instance, created, **kwargs):
+    """Пересчет сроков при приеме сотрудника или смене должности/работодателя/статуса"""
+    if created or instance.has_changed('employer_id', 'position_id', 'is_active', 'hire_date'):
+        DueDateService.refresh_employees([instance.id])
+
+
+@receiver(m2m_changed, sender=Profession.harmful_factors.through)
+def refresh_due_dates_on_factor_assignment(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Пересчет сроков при изменении набора вредных факторов должности
+
+    reverse=False: instance - Profession, pk_set - ID факторов
+    reverse=True: instance - HarmfulFactor, pk_set - ID должностей
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        DueDateService.refresh_for_professions([instance.id])
+    elif action == 'post_clear':
+        DueDateService.refresh_queryset(
+            Employee.objects.filter(
+                id__in=ExaminationDueDate.objects.filter(
+                    harmful_factor=instance
+                ).values('employee_id')
+            )
+        )
+    else:
+        DueDateService.refresh_for_professions(pk_set)
+
+
+@receiver(post_save, sender=HarmfulFactor)
+def refresh_due_dates_on_factor_change(sender, instance, created, **kwargs):
+    """Пересчет сроков при изменении периодичности или активности фактора"""
+    if not created:
+        DueDateService.refresh_for_factor(instance)
+
+
+@receiver(post_save, sender=MedicalExamination)
+def update_clinic_load(sender, instance, created, **kwargs):
+    """Перенос загрузки клиники при назначении, переносе или отмене осмотра"""
+    loaded_state = None if created else getattr(instance, '_loaded_state', None)
+    if loaded_state is None and not created:
+        # Объект создан без загрузки из БД - предыдущее состояние неизвестно
+        return
+    
+    previous = CapacityService.load_key(
+        loaded_state['clinic_id'], loaded_state['scheduled_date'], loaded_state['status']
+    ) if loaded_state else None
+    current = CapacityService.load_key(instance.clinic_id, instance.scheduled_date, instance.status)
+    if previous == current:
+        return
+    if previous:
+        CapacityService.release(*previous)
+    if current:
+        CapacityService.book(*current)
+
+
+@receiver(post_delete, sender=MedicalExamination)
+def release_clinic_load(sender, instance, **kwargs):
+    """Освобождение места при удалении осмотра"""
+    loaded_state = getattr(instance, '_loaded_state', None) or {
+        name: instance.__dict__.get(name) for name in MedicalExamination.TRACKED_FIELDS
+    }
+    key = CapacityService.load_key(
+        loaded_state['clinic_id'], loaded_state['scheduled_date'], loaded_state['status']
+    )
+    if key:
+        CapacityService.release(*key)
+
+
+@receiver(post_save, sender=DoctorExamination)
+def count_doctor_examination(sender, instance, created, **kwargs):
+    """Пройденный врач - в счетчик маршрута (в транзакции сохранения результата)"""
+    if created:
+        ExaminationService.count_completed(instance.examination_id, 1)
+    RegistryCardService.invalidate_examinations([instance.examination_id])
+
+
+@receiver(post_delete, sender=DoctorExamination)
+def uncount_doctor_examination(sender, instance, **kwargs):
+    ExaminationService.count_completed(instance.examination_id, -1)
+    RegistryCardService.invalidate_examinations([instance.examination_id])
+
+
+@receiver(m2m_changed, sender=ExaminationRoute.doctors_required.through)
+def recount_route_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Правка врачей маршрута (в т.ч. из админки) - пересчет счетчиков затронутых маршрутов"""
+    if action == 'pre_clear' and reverse:
+        # После очистки со стороны врача его маршруты уже не найти
+        instance._cleared_route_ids = list(instance.routes.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        route_ids = [instance.pk]
+    elif action == 'post_clear':
+        route_ids = getattr(instance, '_cleared_route_ids', [])
+    else:
+        route_ids = pk_set or []
+    if route_ids:
+        ExaminationService.refresh_route_counters(route_ids)
+        RegistryCardService.invalidate_examinations(
+            ExaminationRoute.objects.filter(id__in=route_ids).values_list('examination_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=MedicalExamination)
+@receiver(post_delete, sender=MedicalExamination)
+def invalidate_examination_card(sender, instance, **kwargs):
+    """Статус, дата или удаление осмотра - карточка регистратуры устарела"""
+    RegistryCardService.invalidate([instance.qr_code])
+
+
+@receiver(post_save, sender=ExaminationRoute)
+def invalidate_route_card(sender, instance, created, **kwargs):
+    if not created:
+        RegistryCardService.invalidate_examinations([instance.examination_id])
+
+
+@receiver(post_save, sender=Employee)
+def invalidate_employee_cards(sender, instance, created, **kwargs):
+    """ФИО, ИИН или должность сотрудника - в карточках его осмотров"""
+    # Прочие поля (телефон, подразделение...) в карточку не входят
+    if not created and instance.has_changed('last_name', 'first_name', 'middle_name', 'iin', 'position_id'):
+        RegistryCardService.invalidate_examinations(instance.examinations.values_list('id', flat=True))
@@ -0,0 +1,310 @@
+"""
+Дискретно-событийная симуляция потока пациентов через кабинеты клиники
+
+Кабинет (станция) - регистратура, специализация врача или профпатолог; число
+мест в кабинете - число активных сотрудников клиники этой роли/специализации.
+Маршрут пациента строится по тем же правилам, что и маршрутный лист
+(ExaminationService.bulk_create_examinations): регистратура, врачи по
+вредным факторам должности (в порядке наименьшей очереди), профпатолог в конце.
+
+Достижимая пропускная способность - наибольшее число пациентов в день, при
+котором все пациенты успевают пройти маршрут за рабочий день, а 95-й
+перцентиль суммарного ожидания не превышает допустимого. Случайные длительности
+приема воспроизводимы (seed), поэтому результат детерминирован.
+"""
+import heapq
+import math
+import random
+from collections import Counter, deque
+from django.conf import settings
+from django.utils import timezone
+
+from apps.compliance.models import Profession
+from apps.compliance.services import ComplianceService
+from apps.organizations.models import OrganizationMember, Employee
+from .models import MedicalExamination
+
+REGISTRY = 'registry'
+PROFPATHOLOGIST = 'profpathologist'
+# Разброс длительности приема (логнормальное распределение)
+_SERVICE_SIGMA = 0.3
+# Верхняя граница поиска (пациентов в день)
+_MAX_PATIENTS = 5000
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+
+def simulate_day(stations: dict, routes: list, arrivals: list, service_minutes: dict, rng: random.Random) -> dict:
+    """
+    Прогон одного дня
+
+    Args:
+        stations: {кабинет: число мест}
+        routes: маршрут каждого пациента - список кабинетов (в порядке прихода)
+        arrivals: минута прихода каждого пациента
+        service_minutes: средняя длительность приема по кабинетам (+ 'default')
+
+    Returns:
+        {'makespan', 'waits' (суммарное ожидание по пациентам), 'time_in_clinic', 'stations': {...}}
+    """
+    free = dict(stations)
+    queues = {name: deque() for name in stations}
+    busy = Counter()
+    waits_by_station = {name: [] for name in stations}
+    patient_wait = [0.0] * len(routes)
+    finished = [0.0] * len(routes)
+    remaining = [None] * len(routes)
+    events = []
+    sequence = 0
+
+    def push(time, kind, patient, station=None):
+        nonlocal sequence
+        sequence += 1
+        heapq.heappush(events, (time, sequence, kind, patient, station))
+
+    def service_time(station):
+        mean = service_minutes.get(station, service_minutes.get('default', 10))
+        return rng.lognormvariate(math.log(mean) - _SERVICE_SIGMA ** 2 / 2, _SERVICE_SIGMA)
+
+    def start(now, patient, station, enqueued_at):
+        free[station] -= 1
+        wait = now - enqueued_at
+        waits_by_station[station].append(wait)
+        patient_wait[patient] += wait
+        duration = service_time(station)
+        busy[station] += duration
+        push(now + duration, 'done', patient, station)
+
+    def route_next(now, patient):
+        pending = remaining[patient]
+        if not pending:
+            finished[patient] = now
+            return
+        if pending[0] == REGISTRY:
+            station = REGISTRY
+        elif len(pending) > 1 and pending[-1] == PROFPATHOLOGIST:
+            # Профпатолог - заключение после всех специалистов
+            station = min(pending[:-1], key=lambda name: (len(queues[name]) - free[name]) / stations[name])
+        else:
+            station = min(pending, key=lambda name: (len(queues[name]) - free[name]) / stations[name])
+        pending.remove(station)
+        if free[station] > 0:
+            start(now, patient, station, now)
+        else:
+            queues[station].append((patient, now))
+
+    for patient, (route, arrival) in enumerate(zip(routes, arrivals)):
+        remaining[patient] = [station for station in route if stations.get(station, 0) > 0]
+        push(arrival, 'arrive', patient)
+
+    now = 0.0
+    while events:
+        now, _, kind, patient, station = heapq.heappop(events)
+        if kind == 'done':
+            free[station] += 1
+            if queues[station]:
+                waiting, enqueued_at = queues[station].popleft()
+                start(now, waiting, station, enqueued_at)
+        route_next(now, patient)
+
+    makespan = max(finished) if finished else 0.0
+    return {
+        'makespan': makespan,
+        'waits': patient_wait,
+        'time_in_clinic': [end - arrival for end, arrival in zip(finished, arrivals)],
+        'stations': {
+            name: {
+                'servers': servers,
+                'busy': busy[name],
+                'served': len(waits_by_station[name]),
+                'avg_wait': sum(waits_by_station[name]) / len(waits_by_station[name]) if waits_by_station[name] else 0.0,
+                'p95_wait': _percentile(waits_by_station[name], 0.95),
+            }
+            for name, servers in stations.items()
+        },
+    }
+
+
+class ThroughputSimulationService:
+    """Расчет реальной пропускной способности клиники симуляцией"""
+
+    @staticmethod
+    def clinic_stations(clinic) -> tuple:
+        """
+        Кабинеты клиники по активным сотрудникам
+
+        Returns:
+            ({кабинет: мест}, станция общего осмотра для должностей без факторов или None)
+        """
+        members = list(OrganizationMember.objects.filter(
+            organization=clinic, is_active=True, role__in=['doctor', 'profpathologist', 'registrar']
+        ).order_by('id'))
+        stations = Counter()
+        for member in members:
+            if member.role == 'registrar':
+                stations[REGISTRY] += 1
+            elif member.role == PROFPATHOLOGIST:
+                stations[PROFPATHOLOGIST] += 1
+            elif member.specialization:
+                stations[member.specialization] += 1
+        # Регистрация идет всегда: без регистраторов ее ведет один сотрудник
+        stations[REGISTRY] = stations[REGISTRY] or 1
+
+        # Как в маршрутном листе: общий осмотр - первый врач/профпатолог клиники
+        general = next((m for m in members if m.role in ('doctor', PROFPATHOLOGIST)), None)
+        general_station = None
+        if general is not None:
+            general_station = PROFPATHOLOGIST if general.role == PROFPATHOLOGIST else general.specialization or None
+        return dict(stations), general_station
+
+    @staticmethod
+    def position_mix(clinic, employer=None, year: int = None) -> Counter:
+        """
+        Состав пациентов по должностям: Приложение 3 работодателя за год
+        или (без работодателя) предстоящие назначенные осмотры клиники
+        """
+        if employer is not None:
+            from apps.documents.models import Document, DocumentType
+
+            appendix_3 = Document.objects.filter(
+                document_type=DocumentType.APPENDIX_3, organization=employer, year=year
+            ).first()
+            employee_ids = [e['id'] for e in appendix_3.content.get('employees', [])] if appendix_3 else []
+            positions = Employee.objects.filter(id__in=employee_ids).values_list('position_id', flat=True)
+        else:
+            positions = MedicalExamination.objects.filter(
+                clinic=clinic, status='scheduled', scheduled_date__gte=timezone.now()
+            ).values_list('employee__position_id', flat=True)
+        return Counter(positions)
+
+    @staticmethod
+    def route_mix(position_mix: Counter, stations: dict, general_station: str = None) -> tuple:
+        """
+        Маршруты по составу должностей
+
+        Returns:
+            ({маршрут (tuple кабинетов): пациентов}, {специализация без врача в клинике: пациентов})
+        """
+        through = Profession.harmful_factors.through
+        factors_by_position = {}
+        for link in through.objects.filter(
+            profession_id__in=[p for p in position_mix if p], harmfulfactor__is_active=True
+        ).select_related('harmfulfactor'):
+            factors_by_position.setdefault(link.profession_id, []).append(link.harmfulfactor)
+
+        routes = Counter()
+        missing = Counter()
+        for position_id, count in position_mix.items():
+            factors = factors_by_position.get(position_id, [])
+            route = [REGISTRY]
+            if factors:
+                for specialization in sorted(ComplianceService.get_required_doctors_for_factors(factors)):
+                    if stations.get(specialization):
+                        route.append(specialization)
+                    else:
+                        missing[specialization] += count
+                if stations.get(PROFPATHOLOGIST):
+                    route.append(PROFPATHOLOGIST)
+            elif general_station:
+                route.append(general_station)
+            routes[tuple(route)] += count
+        return dict(routes), dict(missing)
+
+    @staticmethod
+    def run(stations: dict, routes: dict, patients: int, day_minutes: int, service_minutes: dict, seed: int) -> dict:
+        """Прогон дня с patients пациентами, приходящими равномерно"""
+        rng = random.Random(seed)
+        patient_routes = rng.choices(list(routes), weights=list(routes.values()), k=patients)
+        # Приход - равномерно в течение дня, с запасом на самый длинный маршрут
+        longest = max(
+            sum(service_minutes.get(station, service_minutes.get('default', 10)) for station in route)
+            for route in routes
+        )
+        window = max(day_minutes - longest, 0)
+        arrivals = [window * i / patients for i in range(patients)]
+        return simulate_day(stations, patient_routes, arrivals, service_minutes, rng)
+
+    @staticmethod
+    def estimate(
+        stations: dict,
+        routes: dict,
+        day_minutes: int = None,
+        max_wait_minutes: int = None,
+        service_minutes: dict = None,
+        seed: int = 1
+    ) -> dict:
+        """
+        Наибольшее число пациентов в день (поиск удвоением и двоичным поиском)
+
+        Returns:
+            {'patients_per_day', 'bottleneck', 'stations', 'avg_wait', 'p95_wait', 'avg_time_in_clinic'}
+        """
+        day_minutes = day_minutes or getattr(settings, 'CLINIC_DAY_MINUTES', 480)
+        max_wait = max_wait_minutes if max_wait_minutes is not None else getattr(settings, 'CLINIC_MAX_WAIT_MINUTES', 60)
+        service_minutes = service_minutes or getattr(settings, 'EXAM_SERVICE_MINUTES', {'default': 10})
+        if not routes:
+            raise ValueError('Нет пациентов для симуляции: не найден состав осмотров')
+
+        cache = {}
+
+        def simulate(patients):
+            if patients not in cache:
+                result = ThroughputSimulationService.run(stations, routes, patients, day_minutes, service_minutes, seed)
+                result['feasible'] = (
+                    result['makespan'] <= day_minutes and _percentile(result['waits'], 0.95) <= max_wait
+                )
+                cache[patients] = result
+            return cache[patients]
+
+        low, high = 0, 1
+        while high <= _MAX_PATIENTS and simulate(high)['feasible']:
+            low, high = high, high * 2
+        high = min(high, _MAX_PATIENTS + 1)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if simulate(middle)['feasible']:
+                low = middle
+            else:
+                high = middle
+
+        # Показатели - при найденной нагрузке (или при одном пациенте, если недостижимо и это)
+        result = simulate(max(low, 1))
+        station_stats = []
+        for name, stats in result['stations'].items():
+            utilization = stats['busy'] / (stats['servers'] * day_minutes) if stats['servers'] else 0.0
+            station_stats.append({
+                'station': name,
+                'servers': stats['servers'],
+                'served': stats['served'],
+                'utilization': round(utilization, 3),
+                'avg_wait': round(stats['avg_wait'], 1),
+                'p95_wait': round(stats['p95_wait'], 1),
+            })
+        station_stats.sort(key=lambda item: item['utilization'], reverse=True)
+        used = [item for item in station_stats if item['served']]
+
+        return {
+            'patients_per_day': low,
+            'bottleneck': used[0]['station'] if used else None,
+            'stations': station_stats,
+            'avg_wait': round(sum(result['waits']) / len(result['waits']), 1),
+            'p95_wait': round(_percentile(result['waits'], 0.95), 1),
+            'avg_time_in_clinic': round(sum(result['time_in_clinic']) / len(result['time_in_clinic']), 1),
+        }
+
+    @staticmethod
+    def simulate_clinic(clinic, employer=None, year: int = None, seed: int = 1, **options) -> dict:
+        """Симуляция для клиники по ее сотрудникам и составу пациентов (см. position_mix)"""
+        stations, general_station = ThroughputSimulationService.clinic_stations(clinic)
+        mix = ThroughputSimulationService.position_mix(clinic, employer, year)
+        routes, missing = ThroughputSimulationService.route_mix(mix, stations, general_station)
+        result = ThroughputSimulationService.estimate(stations, routes, seed=seed, **options)
+        result['current_capacity'] = clinic.capacity_per_day
+        result['missing_specializations'] = missing
+        result['patients_in_mix'] = sum(mix.values())
+        return result
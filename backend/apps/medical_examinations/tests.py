@@ -1,14 +1,14 @@
 """
 Tests for medical examinations app
 """
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from apps.organizations.models import Organization, OrganizationMember, Employee, ClinicEmployerPartnership
 from apps.compliance.models import Profession, HarmfulFactor
-from .models import MedicalExamination, ExaminationStatus, ExaminationResult
-from .services import ExaminationService
+from .models import MedicalExamination, ExaminationStatus, ExaminationResult, ExaminationDueDate
+from .services import ExaminationService, DueDateService
 
 User = get_user_model()
 
@@ -146,4 +146,453 @@ class MedicalExaminationTestCase(TestCase):
             document_type=DocumentType.MEDICAL_CERTIFICATE
         )
         self.assertGreater(certificates.count(), 0, "Справка 075/у должна быть создана автоматически")
-
+    
+    def test_due_dates_follow_completions_and_factor_changes(self):
+        """Тест: таблица сроков обновляется при завершении осмотра и изменении факторов"""
+        today = timezone.now().date()
+        due = ExaminationDueDate.objects.get(employee=self.employee, harmful_factor=self.harmful_factor)
+        self.assertEqual(due.next_due_date, self.employee.hire_date)
+        self.assertEqual(list(DueDateService.due_before(self.employer, today)), [due])
+        
+        examination = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=timezone.now(),
+            employer=self.employer
+        )
+        ExaminationService.add_doctor_examination(
+            examination=examination,
+            doctor=self.doctor,
+            harmful_factor=self.harmful_factor,
+            result='fit'
+        )
+        ExaminationService.complete_examination(
+            examination=examination,
+            final_result='fit',
+            profpathologist=self.doctor
+        )
+        
+        due.refresh_from_db()
+        self.assertEqual(due.next_due_date, examination.completed_date.date() + timedelta(days=360))
+        self.assertFalse(DueDateService.due_before(self.employer, today).exists())
+        
+        self.profession.harmful_factors.remove(self.harmful_factor)
+        self.assertFalse(ExaminationDueDate.objects.filter(employee=self.employee).exists())
+    
+    def test_clinic_load_ledger_and_allocation(self):
+        """Тест: загрузка клиники учитывает осмотры всех работодателей, выходные пропускаются"""
+        from datetime import date
+        from .models import ClinicDailyLoad
+        from .services import CapacityService
+        
+        monday = date(2031, 3, 3)
+        scheduled = timezone.make_aware(datetime(2031, 3, 3, 9))
+        examination = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=scheduled
+        )
+        self.assertEqual(ClinicDailyLoad.objects.get(clinic=self.clinic, date=monday).booked, 1)
+        
+        # Перенос и отмена переносят/освобождают место
+        examination = MedicalExamination.objects.get(pk=examination.pk)
+        examination.scheduled_date = scheduled + timedelta(days=1)
+        examination.save()
+        loads = dict(ClinicDailyLoad.objects.filter(clinic=self.clinic).values_list('date', 'booked'))
+        self.assertEqual(loads, {monday: 0, date(2031, 3, 4): 1})
+        examination.status = ExaminationStatus.CANCELLED
+        examination.save()
+        self.assertEqual(CapacityService.booked_by_day(self.clinic.id, monday), {})
+        
+        # Занятые другими работодателями дни заполняются до capacity, выходные пропускаются
+        ClinicDailyLoad.objects.filter(clinic=self.clinic, date=monday).update(booked=25)
+        allocation = CapacityService.allocate(self.clinic, 40, monday, capacity=30)
+        self.assertEqual(allocation, [(monday, 5), (date(2031, 3, 4), 30), (date(2031, 3, 5), 5)])
+        allocation = CapacityService.allocate(self.clinic, 35, date(2031, 3, 7), capacity=30)
+        self.assertEqual(allocation, [(date(2031, 3, 7), 30), (date(2031, 3, 10), 5)])
+        # 8 марта - праздник
+        self.assertFalse(CapacityService.is_working_day(date(2032, 3, 8)))
+        
+        # Пересчет по осмотрам
+        self.assertEqual(CapacityService.rebuild([self.clinic.id]), 0)
+        self.assertFalse(ClinicDailyLoad.objects.filter(clinic=self.clinic).exists())
+    
+    def test_bulk_create_examinations_matches_single_route(self):
+        """Тест: массовое создание осмотров дает те же маршруты за постоянное число запросов"""
+        from .models import ClinicDailyLoad
+        
+        profpathologist_user = User.objects.create_user(username='77000000009', phone_number='77000000009')
+        profpathologist = OrganizationMember.objects.create(
+            organization=self.clinic, user=profpathologist_user, role='profpathologist'
+        )
+        employees = [self.employee]
+        for i in range(5):
+            user = User.objects.create_user(username=f'7700000010{i}', phone_number=f'7700000010{i}')
+            employees.append(Employee.objects.create(
+                user=user, employer=self.employer, first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                position=self.profession if i % 2 else None,
+                hire_date=timezone.now().date()
+            ))
+        
+        scheduled = timezone.make_aware(datetime(2031, 3, 3, 9))
+        single = ExaminationService.create_examination(self.employee, 'periodic', self.clinic, scheduled)
+        expected_route = set(single.route.doctors_required.values_list('id', flat=True))
+        
+        with self.assertNumQueries(8):
+            examinations = ExaminationService.bulk_create_examinations(
+                self.clinic, self.employer, [(employee, scheduled) for employee in employees]
+            )
+        
+        self.assertEqual(len(examinations), 6)
+        self.assertEqual(len({e.qr_code for e in examinations}), 6)
+        for examination, employee in zip(examinations, employees):
+            doctors = set(examination.route.doctors_required.values_list('id', flat=True))
+            if employee.position_id:
+                self.assertEqual(doctors, expected_route)
+            else:
+                self.assertEqual(doctors, {self.doctor.id})
+        self.assertEqual(expected_route, {self.doctor.id, profpathologist.id})
+        self.assertEqual(ClinicDailyLoad.objects.get(clinic=self.clinic, date=scheduled.date()).booked, 7)
+    
+    def test_throughput_simulation_finds_bottleneck(self):
+        """Тест: симуляция потока пациентов - узкое место и расчетная пропускная способность"""
+        from rest_framework.test import APIClient
+        from .simulation import ThroughputSimulationService
+        
+        service_minutes = {'registry': 3, 'ЛОР': 10, 'Терапевт': 5, 'default': 10}
+        routes = {('registry', 'ЛОР', 'Терапевт'): 1}
+        one_lor = ThroughputSimulationService.estimate(
+            {'registry': 1, 'ЛОР': 1, 'Терапевт': 1}, routes, day_minutes=480,
+            max_wait_minutes=60, service_minutes=service_minutes
+        )
+        # Один ЛОР по 10 минут: не больше 48 пациентов за 8 часов
+        self.assertEqual(one_lor['bottleneck'], 'ЛОР')
+        self.assertTrue(30 <= one_lor['patients_per_day'] <= 48, one_lor['patients_per_day'])
+        
+        two_lor = ThroughputSimulationService.estimate(
+            {'registry': 1, 'ЛОР': 2, 'Терапевт': 1}, routes, day_minutes=480,
+            max_wait_minutes=60, service_minutes=service_minutes
+        )
+        self.assertGreater(two_lor['patients_per_day'], one_lor['patients_per_day'] * 1.4)
+        self.assertEqual(two_lor['bottleneck'], 'Терапевт')
+        # Детерминированность при одинаковом seed
+        self.assertEqual(one_lor, ThroughputSimulationService.estimate(
+            {'registry': 1, 'ЛОР': 1, 'Терапевт': 1}, routes, day_minutes=480,
+            max_wait_minutes=60, service_minutes=service_minutes
+        ))
+        
+        # Клиника: состав - предстоящие осмотры; специализация без врача попадает в отчет
+        eye_factor = HarmfulFactor.objects.create(
+            code='1.1.2', name='Пыль', periodicity_months=12, required_doctors=['Окулист']
+        )
+        self.profession.harmful_factors.add(eye_factor)
+        ExaminationService.create_examination(
+            self.employee, 'periodic', self.clinic, timezone.now() + timedelta(days=3)
+        )
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.post(
+            f'/api/organizations/organizations/{self.clinic.id}/simulate_capacity/',
+            {'apply': True}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['missing_specializations'], {'Окулист': 1})
+        self.assertEqual(response.data['bottleneck'], 'ЛОР')
+        self.assertTrue(response.data['applied'])
+        self.clinic.refresh_from_db()
+        self.assertEqual(self.clinic.capacity_per_day, response.data['patients_per_day'])
+        
+        client.force_authenticate(self.doctor_user)
+        response = client.post(f'/api/organizations/organizations/{self.clinic.id}/simulate_capacity/', {}, format='json')
+        self.assertEqual(response.status_code, 403)
+    
+    def test_examinations_list_query_budget(self):
+        """Тест: число запросов списка осмотров не зависит от размера страницы"""
+        from rest_framework.test import APIClient
+        from .models import LaboratoryResult
+        
+        users = User.objects.bulk_create([
+            User(username=f'7702{i:07d}', phone_number=f'7702{i:07d}') for i in range(220)
+        ])
+        # Часть сотрудников без должности: маршрут общего осмотра, пустые вредные факторы
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user, employer=self.employer, first_name='Тест', last_name=f'Список{i}',
+                position=self.profession if i % 3 else None,
+                hire_date=timezone.now().date() - timedelta(days=400)
+            )
+            for i, user in enumerate(users)
+        ])
+        scheduled_date = timezone.now() + timedelta(days=7)
+        examinations = ExaminationService.bulk_create_examinations(
+            self.clinic, self.employer, [(employee, scheduled_date) for employee in employees]
+        )
+        for examination in examinations[-30:]:
+            ExaminationService.add_doctor_examination(
+                examination, self.doctor, self.harmful_factor, result='fit', findings='Норма'
+            )
+            LaboratoryResult.objects.create(examination=examination, test_name='Аудиометрия', result_value='Норма')
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        for page_size in (20, 200):
+            with self.assertNumQueries(10):
+                response = client.get('/api/examinations/examinations/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+        
+        # Прогресс в списке совпадает с прогрессом осмотра, загруженного отдельно
+        listed = {item['id']: item for item in response.data['results']}
+        examination = MedicalExamination.objects.get(id=examinations[-1].id)
+        self.assertEqual(listed[examination.id]['progress'], ExaminationService.get_examination_progress(examination))
+        self.assertEqual(listed[examination.id]['progress']['completed_exams'], 1)
+        self.assertEqual(len(listed[examination.id]['doctor_examinations']), 1)
+        self.assertTrue(any(item['employee_info']['harmful_factors'] == [] for item in listed.values()))
+    
+    def test_route_progress_counters_and_repair(self):
+        """Тест: счетчики маршрута при создании, результатах врачей, правке маршрута и восстановлении"""
+        from io import StringIO
+        from django.core.management import call_command
+        from rest_framework.test import APIClient
+        from .models import ExaminationRoute
+        
+        examination = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=timezone.now() + timedelta(days=1),
+            employer=self.employer
+        )
+        route = ExaminationRoute.objects.get(examination=examination)
+        self.assertEqual((route.required_count, route.completed_count, route.is_complete), (1, 0, False))
+        
+        ExaminationService.start_examination(examination)
+        ExaminationService.add_doctor_examination(examination, self.doctor, self.harmful_factor, result='fit')
+        route.refresh_from_db()
+        self.assertEqual((route.required_count, route.completed_count, route.is_complete), (1, 1, True))
+        self.assertEqual(list(ExaminationService.ready_for_conclusion()), [examination])
+        
+        # Правка маршрута: добавлен терапевт - осмотр снова не завершен
+        therapist_user = User.objects.create_user(username='77021491011', phone_number='77021491011')
+        therapist = OrganizationMember.objects.create(
+            organization=self.clinic, user=therapist_user, role='doctor', specialization='Терапевт'
+        )
+        route.doctors_required.add(therapist)
+        route.refresh_from_db()
+        self.assertEqual((route.required_count, route.completed_count, route.is_complete), (2, 1, False))
+        
+        # Изменение в обход сервисов исправляется командой
+        ExaminationRoute.objects.filter(id=route.id).update(completed_count=0, is_complete=True)
+        out = StringIO()
+        call_command('repair_route_counters', stdout=out)
+        self.assertIn('Исправлено маршрутов: 1', out.getvalue())
+        route.refresh_from_db()
+        self.assertEqual((route.required_count, route.completed_count, route.is_complete), (2, 1, False))
+        
+        ExaminationService.add_doctor_examination(examination, therapist, self.harmful_factor, result='fit')
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.get('/api/examinations/examinations/ready_for_conclusion/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [examination.id])
+        self.assertEqual(response.data['results'][0]['progress']['progress_percent'], 100)
+    
+    def test_registry_card_is_cached_and_invalidated(self):
+        """Тест: карточка регистратуры из кэша без запросов, сброс при изменении осмотра и маршрута"""
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        from .registry import RegistryCardService
+        
+        cache.clear()
+        examination = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=timezone.now() + timedelta(days=1),
+            employer=self.employer
+        )
+        card = RegistryCardService.get_card(examination.qr_code)
+        self.assertEqual(card['patient']['full_name'], self.employee.full_name)
+        self.assertEqual(
+            [(c['specialization'], c['done']) for c in card['route']], [('ЛОР', False)]
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(RegistryCardService.get_card(examination.qr_code), card)
+        
+        # Начало осмотра и результат врача сбрасывают карточку
+        ExaminationService.start_examination(examination)
+        ExaminationService.add_doctor_examination(examination, self.doctor, self.harmful_factor, result='fit')
+        card = RegistryCardService.get_card(examination.qr_code)
+        self.assertEqual(card['status'], 'in_progress')
+        self.assertEqual(card['route'][0]['done'], True)
+        self.assertEqual(card['progress'], {'required': 1, 'completed': 1, 'is_complete': True})
+        
+        # Поля вне карточки (подразделение) осмотры сотрудника не трогают
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.employee.department = 'Цех 2'
+        with CaptureQueriesContext(connection) as queries:
+            self.employee.save()
+        self.assertFalse([
+            query['sql'] for query in queries if 'medical_examinations_medicalexamination' in query['sql']
+        ])
+        
+        # Изменение данных сотрудника
+        self.employee.last_name = 'Петров'
+        self.employee.save()
+        self.assertTrue(RegistryCardService.get_card(examination.qr_code)['patient']['full_name'].startswith('Петров'))
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        response = client.get('/api/examinations/examinations/card/', {'qr_code': examination.qr_code})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], examination.id)
+        response = client.get('/api/examinations/examinations/card/', {'qr_code': 'unknown'})
+        self.assertEqual(response.status_code, 404)
+        
+        # Работодатель карточки регистратуры не получает
+        client.force_authenticate(self.employer_user)
+        response = client.get('/api/examinations/examinations/card/', {'qr_code': examination.qr_code})
+        self.assertEqual(response.status_code, 404)
+    
+    @override_settings(REGISTRY_SYNC_OVERLAP_SECONDS=0)
+    def test_registry_manifest_delta_sync_and_checkins(self):
+        """Тест: манифест регистратуры на день, синхронизация изменений по версии, загрузка отметок прихода"""
+        from rest_framework.test import APIClient
+        from .registry import RegistryManifestService
+        
+        scheduled = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(10, 0)))
+        examination = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=scheduled,
+            employer=self.employer
+        )
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        url = '/api/examinations/examinations/registry_manifest/'
+        params = {'clinic_id': self.clinic.id, 'date': scheduled.date().isoformat()}
+        
+        manifest = client.get(url, params).data
+        self.assertTrue(manifest['full'])
+        entry = manifest['examinations'][0]
+        self.assertEqual(entry['qr_hash'], RegistryManifestService.qr_hash(examination.qr_code))
+        self.assertEqual((entry['time'], entry['status']), ('10:00', 'scheduled'))
+        self.assertNotIn(examination.qr_code, str(manifest))
+        
+        # Без изменений - пустая дельта; результат врача - осмотр в дельте
+        delta = client.get(url, {**params, 'since': manifest['version']}).data
+        self.assertEqual((delta['examinations'], delta['ids'], delta['version']), ([], [examination.id], manifest['version']))
+        ExaminationService.add_doctor_examination(examination, self.doctor, self.harmful_factor, result='fit')
+        delta = client.get(url, {**params, 'since': manifest['version']}).data
+        self.assertEqual(delta['examinations'][0]['route'][0]['done'], True)
+        self.assertNotEqual(delta['version'], manifest['version'])
+        self.assertEqual(client.get(url, {**params, 'since': 'bad'}).status_code, 400)
+        
+        # Отметки прихода: чужой хэш не принимается, повтор не меняет осмотр
+        response = client.post('/api/examinations/examinations/registry_checkins/', {
+            'clinic_id': self.clinic.id,
+            'checkins': [
+                {'examination_id': examination.id, 'qr_hash': 'bad'},
+                {'examination_id': examination.id, 'qr_hash': entry['qr_hash']},
+                {'examination_id': examination.id, 'qr_hash': entry['qr_hash']},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['started'], 1)
+        self.assertEqual(
+            [item['result'] for item in response.data['results']], ['not_found', 'started', 'already_started']
+        )
+        delta = client.get(url, {**params, 'since': delta['version']}).data
+        self.assertEqual(delta['examinations'][0]['status'], 'in_progress')
+        
+        # Перенос на другой день - осмотр исчезает из ids дня
+        examination = MedicalExamination.objects.get(id=examination.id)
+        examination.scheduled_date = scheduled + timedelta(days=1)
+        examination.save()
+        self.assertEqual(client.get(url, {**params, 'since': delta['version']}).data['ids'], [])
+        
+        # Правка сотрудника не перезаписывает updated_at завершенной истории
+        past = ExaminationService.create_examination(
+            employee=self.employee,
+            examination_type='periodic',
+            clinic=self.clinic,
+            scheduled_date=timezone.now() - timedelta(days=365),
+            employer=self.employer
+        )
+        past.status = 'completed'
+        past.save()
+        past_updated_at = MedicalExamination.objects.get(id=past.id).updated_at
+        current_updated_at = MedicalExamination.objects.get(id=examination.id).updated_at
+        self.employee.last_name = 'Петров'
+        self.employee.save()
+        self.assertEqual(MedicalExamination.objects.get(id=past.id).updated_at, past_updated_at)
+        self.assertGreater(MedicalExamination.objects.get(id=examination.id).updated_at, current_updated_at)
+        
+        client.force_authenticate(self.employer_user)
+        self.assertEqual(client.get(url, params).status_code, 404)
+    
+    def test_group_checkin_starts_shift_with_single_update(self):
+        """Тест: групповая отметка прихода - один UPDATE, карточки сброшены, загрузка клиники не меняется"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIClient
+        from .models import ClinicDailyLoad
+        from .registry import RegistryCardService
+        
+        scheduled = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9, 0)))
+        employees = [self.employee]
+        for i in range(3):
+            user = User.objects.create_user(username=f'7700000020{i}', phone_number=f'7700000020{i}')
+            employees.append(Employee.objects.create(
+                user=user, employer=self.employer, first_name=f'Рабочий{i}', last_name='Сменный',
+                position=self.profession, hire_date=timezone.now().date() - timedelta(days=365)
+            ))
+        examinations = [
+            ExaminationService.create_examination(
+                employee=employee,
+                examination_type='periodic',
+                clinic=self.clinic,
+                scheduled_date=scheduled + timedelta(minutes=15 * i),
+                employer=self.employer
+            )
+            for i, employee in enumerate(employees)
+        ]
+        ExaminationService.start_examination(examinations[1])
+        examinations[2].status = 'cancelled'
+        examinations[2].save()
+        self.assertEqual(RegistryCardService.get_card(examinations[0].qr_code)['status'], 'scheduled')
+        booked = ClinicDailyLoad.objects.get(clinic=self.clinic, date=scheduled.date()).booked
+        
+        client = APIClient()
+        client.force_authenticate(self.clinic_user)
+        url = '/api/examinations/examinations/group_checkin/'
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(url, {
+                'clinic_id': self.clinic.id, 'employer_id': self.employer.id, 'date': scheduled.date().isoformat()
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [query['sql'].split()[1] for query in queries if query['sql'].startswith('UPDATE')],
+            ['"medical_examinations_medicalexamination"']
+        )
+        self.assertEqual(sorted(response.data['started_ids']), [examinations[0].id, examinations[3].id])
+        # Отмененный осмотр в смену не входит
+        self.assertEqual(
+            [card['id'] for card in response.data['cards']],
+            [examinations[0].id, examinations[1].id, examinations[3].id]
+        )
+        self.assertEqual({card['status'] for card in response.data['cards']}, {'in_progress'})
+        self.assertEqual(RegistryCardService.get_card(examinations[0].qr_code)['status'], 'in_progress')
+        self.assertEqual(ClinicDailyLoad.objects.get(clinic=self.clinic, date=scheduled.date()).booked, booked)
+        
+        # По QR-кодам: повторная отметка ничего не начинает, неизвестный код - в not_found
+        response = client.post(url, {
+            'clinic_id': self.clinic.id, 'qr_codes': [examinations[3].qr_code, 'unknown']
+        }, format='json')
+        self.assertEqual((response.data['started'], response.data['not_found']), (0, ['unknown']))
+        self.assertEqual(response.data['cards'][0]['id'], examinations[3].id)
+        self.assertEqual(client.post(url, {'clinic_id': self.clinic.id}, format='json').status_code, 400)
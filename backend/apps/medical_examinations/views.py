@@ -4,6 +4,7 @@ Medical examination views
 from django.db import models
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import MedicalExamination, DoctorExamination, LaboratoryResult
@@ -14,12 +15,23 @@ from .serializers import (
     LaboratoryResultSerializer
 )
 from .services import ExaminationService
+from .registry import RegistryCardService
 from apps.compliance.models import HarmfulFactor
 
 
+class ExaminationPagination(PageNumberPagination):
+    """Страницы осмотров: ?page_size=N (до 200)"""
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class MedicalExaminationViewSet(viewsets.ModelViewSet):
     """ViewSet для медицинских осмотров"""
     permission_classes = [IsAuthenticated]
+    pagination_class = ExaminationPagination
+    # Действия только для чтения - с полным планом загрузки (ExaminationService.with_related);
+    # после изменений осмотр сериализуется заново, без устаревшей предзагрузки
+    READ_ACTIONS = ('list', 'retrieve', 'ready_for_conclusion')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -57,7 +69,10 @@ class MedicalExaminationViewSet(viewsets.ModelViewSet):
         if employee:
             queryset = queryset | MedicalExamination.objects.filter(employee=employee)
         
-        return queryset.distinct()
+        queryset = queryset.distinct()
+        if self.action in self.READ_ACTIONS:
+            queryset = ExaminationService.with_related(queryset).order_by('-scheduled_date', '-id')
+        return queryset
     
     def create(self, request, *args, **kwargs):
         """Создание осмотра с автоматической генерацией маршрута"""
@@ -159,6 +174,133 @@ class MedicalExaminationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(examination)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def ready_for_conclusion(self, request):
+        """Осмотры в процессе, у которых пройдены все врачи маршрута (очередь профпатолога)"""
+        queryset = ExaminationService.ready_for_conclusion(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def card(self, request):
+        """
+        Карточка регистратуры по QR-коду: пациент, кабинеты маршрута, статус
+        
+        Компактная замена by_qr для сканера; карточка отдается из кэша.
+        Доступна сотрудникам клиники осмотра.
+        """
+        qr_code = request.query_params.get('qr_code')
+        if not qr_code:
+            return Response({'error': 'Укажите QR код'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        card = RegistryCardService.get_card(qr_code)
+        if card is None:
+            return Response({'error': 'Осмотр не найден'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if not self._is_clinic_member(request.user, card['clinic_id']):
+            # Чужой клинике не раскрываем, что такой QR-код существует
+            return Response({'error': 'Осмотр не найден'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(card)
+    
+    @action(detail=False, methods=['get'])
+    def registry_manifest(self, request):
+        """
+        Манифест регистратуры на день: ?clinic_id=ID&date=YYYY-MM-DD[&since=версия]
+        
+        Планшет скачивает манифест заранее и разрешает сканы без сети по хэшу
+        QR-кода; с since отдаются только изменения после этой версии.
+        """
+        from datetime import date
+        from .registry import RegistryManifestService
+        
+        clinic_id = request.query_params.get('clinic_id')
+        try:
+            day = date.fromisoformat(request.query_params.get('date', ''))
+        except ValueError:
+            return Response({'error': 'Укажите дату в формате YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        if not clinic_id or not str(clinic_id).isdigit():
+            return Response({'error': 'Укажите clinic_id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not self._is_clinic_member(request.user, clinic_id):
+            return Response({'error': 'Клиника не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            manifest = RegistryManifestService.build_manifest(
+                int(clinic_id), day, since=request.query_params.get('since')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(manifest)
+    
+    @action(detail=False, methods=['post'])
+    def registry_checkins(self, request):
+        """
+        Загрузка отметок прихода с планшета регистратуры
+        
+        Тело: {"clinic_id": ID, "checkins": [{"examination_id": ID, "qr_hash": "..."}, ...]}
+        """
+        from .registry import RegistryManifestService
+        
+        clinic_id = request.data.get('clinic_id')
+        if not clinic_id or not str(clinic_id).isdigit():
+            return Response({'error': 'Укажите clinic_id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not self._is_clinic_member(request.user, clinic_id):
+            return Response({'error': 'Клиника не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            result = RegistryManifestService.apply_checkins(int(clinic_id), request.data.get('checkins'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
+    @action(detail=False, methods=['post'])
+    def group_checkin(self, request):
+        """
+        Групповая отметка прихода: начать осмотры смены и вернуть их карточки
+        
+        Тело: {"clinic_id": ID, "qr_codes": [...]} или {"clinic_id": ID, "employer_id": ID, "date": "YYYY-MM-DD"}
+        """
+        from datetime import date
+        from .registry import RegistryCheckinService
+        
+        clinic_id = request.data.get('clinic_id')
+        if not clinic_id or not str(clinic_id).isdigit():
+            return Response({'error': 'Укажите clinic_id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not self._is_clinic_member(request.user, clinic_id):
+            return Response({'error': 'Клиника не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        employer_id = request.data.get('employer_id')
+        day = None
+        if request.data.get('qr_codes') is None:
+            try:
+                day = date.fromisoformat(str(request.data.get('date', '')))
+                employer_id = int(employer_id)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'Укажите qr_codes или employer_id и date (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            result = RegistryCheckinService.group_checkin(
+                int(clinic_id), qr_codes=request.data.get('qr_codes'), employer_id=employer_id, day=day
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
+    @staticmethod
+    def _is_clinic_member(user, clinic_id) -> bool:
+        """Пользователь - владелец или сотрудник клиники"""
+        from apps.organizations.models import Organization
+        from django.db.models import Q
+        return Organization.objects.filter(
+            Q(owner=user) | Q(members__user=user),
+            org_type='clinic',
+            id=clinic_id
+        ).exists()
+
     @action(detail=False, methods=['get'])
     def by_qr(self, request):
         """Найти осмотр по QR коду"""
@@ -170,7 +312,7 @@ class MedicalExaminationViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            examination = MedicalExamination.objects.get(qr_code=qr_code)
+            examination = ExaminationService.with_related(MedicalExamination.objects.all()).get(qr_code=qr_code)
             serializer = self.get_serializer(examination)
             return Response(serializer.data)
         except MedicalExamination.DoesNotExist:
@@ -2,6 +2,7 @@
 Admin configuration for organizations app
 """
 from django.contrib import admin
+from django.utils import timezone
 from .models import Organization, OrganizationMember, Employee, ClinicEmployerPartnership
 
 
@@ -11,6 +12,30 @@ class OrganizationAdmin(admin.ModelAdmin):
     list_filter = ['org_type', 'created_at']
     search_fields = ['name', 'bin']
     readonly_fields = ['created_at', 'updated_at']
+    actions = ['create_season_appendix_3_job', 'create_season_final_act_job']
+
+    def _create_season_jobs(self, request, queryset, job_type):
+        from apps.documents.jobs import DocumentJobService
+
+        clinics = queryset.filter(org_type='clinic')
+        for clinic in clinics:
+            DocumentJobService.create_season_job(
+                job_type, timezone.now().year, clinic_id=clinic.id, created_by=request.user
+            )
+        self.message_user(
+            request,
+            f"Создано заданий: {clinics.count()}. Выполняются командой run_document_jobs."
+        )
+
+    @admin.action(description='Сформировать Приложение 3 для всех партнеров клиники')
+    def create_season_appendix_3_job(self, request, queryset):
+        from apps.documents.models import DocumentJobType
+        self._create_season_jobs(request, queryset, DocumentJobType.SEASON_APPENDIX_3)
+
+    @admin.action(description='Сформировать заключительные акты для всех партнеров клиники')
+    def create_season_final_act_job(self, request, queryset):
+        from apps.documents.models import DocumentJobType
+        self._create_season_jobs(request, queryset, DocumentJobType.SEASON_FINAL_ACT)
 
 
 @admin.register(OrganizationMember)
@@ -0,0 +1,45 @@
+"""
+Разбор ИИН (индивидуальный идентификационный номер РК)
+
+Формат: YYMMDD + разряд века и пола + порядковый номер.
+7-я цифра: 1/2 - XIX век, 3/4 - XX век, 5/6 - XXI век; нечетная - мужской пол,
+четная - женский.
+"""
+from datetime import date
+
+# 7-я цифра ИИН -> первые две цифры года рождения
+_CENTURY_BY_DIGIT = {1: 18, 2: 18, 3: 19, 4: 19, 5: 20, 6: 20}
+
+
+def birth_date_from_iin(iin: str):
+    """
+    Дата рождения из ИИН
+
+    Returns:
+        date или None, если ИИН пустой или некорректный
+    """
+    if not iin or len(iin) < 6 or not iin[:6].isdigit():
+        return None
+
+    century_digit = int(iin[6]) if len(iin) > 6 and iin[6].isdigit() else 0
+    century = _CENTURY_BY_DIGIT.get(century_digit)
+    if century is None:
+        # Разряд века не указан - определяем по году (как в старых выгрузках)
+        century = 19 if int(iin[0]) >= 5 else 20
+
+    try:
+        return date(century * 100 + int(iin[0:2]), int(iin[2:4]), int(iin[4:6]))
+    except ValueError:
+        return None
+
+
+def gender_from_iin(iin: str):
+    """
+    Пол из ИИН (7-я цифра: четная = женский, нечетная = мужской)
+
+    Returns:
+        'male' / 'female' (значения Employee.gender) или None
+    """
+    if not iin or len(iin) < 7 or not iin[6].isdigit() or iin[6] == '0':
+        return None
+    return 'female' if int(iin[6]) % 2 == 0 else 'male'
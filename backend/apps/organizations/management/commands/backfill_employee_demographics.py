@@ -0,0 +1,60 @@
+"""
+Заполнение даты рождения и пола сотрудников из ИИН
+Использование: python manage.py backfill_employee_demographics [--employer ID] [--batch-size 2000] [--dry-run]
+
+Обрабатываются только сотрудники с пустыми полями. Записи обновляются
+пачками через bulk_update (сигналы не вызываются); updated_at обновляется,
+чтобы сохраненные документы переформировались по изменившемуся отпечатку.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.organizations.models import Employee
+
+
+class Command(BaseCommand):
+    help = 'Заполнение даты рождения и пола сотрудников из ИИН (пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employer', type=int, help='ID работодателя (по умолчанию - все)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, без записи')
+
+    def handle(self, *args, **options):
+        queryset = Employee.objects.exclude(iin='').filter(
+            Q(date_of_birth__isnull=True) | Q(gender__isnull=True) | Q(gender='')
+        ).only('id', 'iin', 'date_of_birth', 'gender').order_by('id')
+        if options['employer']:
+            queryset = queryset.filter(employer_id=options['employer'])
+
+        batch_size = options['batch_size']
+        scanned = updated = 0
+        last_id = 0
+
+        # Пагинация по id: обновленные записи выпадают из выборки, смещение не нужно
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            scanned += len(batch)
+
+            now = timezone.now()
+            changed = []
+            for employee in batch:
+                if employee.fill_demographics_from_iin():
+                    employee.updated_at = now
+                    changed.append(employee)
+
+            if changed and not options['dry_run']:
+                with transaction.atomic():
+                    Employee.objects.bulk_update(
+                        changed, ['date_of_birth', 'gender', 'updated_at'], batch_size=batch_size
+                    )
+            updated += len(changed)
+            self.stdout.write(f"  {scanned} проверено, {updated} обновлено")
+
+        prefix = 'Будет обновлено' if options['dry_run'] else 'Обновлено'
+        self.stdout.write(self.style.SUCCESS(f'✅ {prefix}: {updated} из {scanned}'))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0006_add_employee_form3_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['employer', 'date_of_birth'], name='organizatio_employe_dfbd7f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['employer', 'gender'], name='organizatio_employe_9c8eb4_idx'),
+        ),
+    ]
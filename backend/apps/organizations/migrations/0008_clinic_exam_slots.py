@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:41
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0007_employee_demographics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='exam_day_end',
+            field=models.TimeField(default=datetime.time(17, 0), verbose_name='Окончание приема'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='exam_day_start',
+            field=models.TimeField(default=datetime.time(9, 0), verbose_name='Начало приема'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='slot_capacity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Пациентов на слот (0 - из пропускной способности в день)'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='slot_minutes',
+            field=models.PositiveIntegerField(default=30, verbose_name='Длина слота записи (минуты)'),
+        ),
+    ]
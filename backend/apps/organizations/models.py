@@ -1,6 +1,8 @@
 """
 Organization models - Работодатели и Клиники
 """
+from datetime import time
+from decimal import Decimal, InvalidOperation
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -42,6 +44,14 @@ class Organization(models.Model):
         default=50,
         verbose_name='Пропускная способность в день (для клиник)'
     )
+    # Запись на осмотр по времени (для клиник): приход пациентов распределяется по слотам дня
+    exam_day_start = models.TimeField(default=time(9, 0), verbose_name='Начало приема')
+    exam_day_end = models.TimeField(default=time(17, 0), verbose_name='Окончание приема')
+    slot_minutes = models.PositiveIntegerField(default=30, verbose_name='Длина слота записи (минуты)')
+    slot_capacity = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Пациентов на слот (0 - из пропускной способности в день)'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -163,10 +173,78 @@ class Employee(models.Model):
         verbose_name = 'Сотрудник'
         verbose_name_plural = 'Сотрудники'
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['employer', 'date_of_birth']),
+            models.Index(fields=['employer', 'gender']),
+        ]
 
+    # Поля, изменения которых отслеживаются между загрузкой и сохранением
+    TRACKED_FIELDS = (
+        'employer_id', 'position_id', 'is_active', 'hire_date', 'iin',
+        'last_name', 'first_name', 'middle_name',
+    )
+    
     def __str__(self):
         return f"{self.last_name} {self.first_name} - {self.position.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_state()
+        return instance
+    
+    def save(self, *args, **kwargs):
+        derived_fields = self.fill_demographics_from_iin()
+        update_fields = kwargs.get('update_fields')
+        if derived_fields and update_fields is not None and 'iin' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(derived_fields)
+        super().save(*args, **kwargs)
+        # Сигналы post_save уже видели изменения - фиксируем новое состояние
+        self._snapshot_state()
+    
+    def _snapshot_state(self):
+        self._loaded_state = {
+            name: self.__dict__.get(name) for name in self.TRACKED_FIELDS
+        }
+    
+    def fill_demographics_from_iin(self) -> list:
+        """
+        Дата рождения и пол из ИИН
+
+        Заполняются, если пусты или были получены из прежнего ИИН; значения,
+        указанные вручную, не перезаписываются.
+
+        Returns:
+            Список измененных полей
+        """
+        from .iin import birth_date_from_iin, gender_from_iin
+
+        loaded_state = getattr(self, '_loaded_state', None)
+        previous_iin = loaded_state.get('iin') if loaded_state else None
+        if loaded_state and previous_iin == self.iin and self.date_of_birth and self.gender:
+            return []
+
+        changed = []
+        for field_name, parse in (('date_of_birth', birth_date_from_iin), ('gender', gender_from_iin)):
+            derived = parse(self.iin)
+            current = getattr(self, field_name)
+            if derived is None or current == derived:
+                continue
+            if not current or current == parse(previous_iin):
+                setattr(self, field_name, derived)
+                changed.append(field_name)
+        return changed
+    
+    def has_changed(self, *field_names) -> bool:
+        """Изменились ли поля с момента загрузки из БД (новый объект - всегда True)"""
+        loaded_state = getattr(self, '_loaded_state', None)
+        if loaded_state is None:
+            return True
+        return any(
+            loaded_state.get(name) != self.__dict__.get(name)
+            for name in (field_names or self.TRACKED_FIELDS)
+        )
+    
     @property
     def full_name(self):
         return f"{self.last_name} {self.first_name} {self.middle_name}".strip()
@@ -255,6 +333,16 @@ class ClinicEmployerPartnership(models.Model):
     def __str__(self):
         return f"{self.clinic.name} ↔ {self.employer.name} ({self.get_status_display()})"
     
+    def price_for(self, service: str = 'periodic_exam'):
+        """Цена услуги по партнерству (индивидуальная из pricing или стандартная)"""
+        price = (self.pricing or {}).get(service)
+        if price not in (None, ''):
+            try:
+                return Decimal(str(price))
+            except InvalidOperation:
+                pass
+        return self.default_price or Decimal('0')
+    
     def is_active(self):
         """Проверка, активно ли партнерство"""
         if self.status != self.PartnershipStatus.ACTIVE:
@@ -14,9 +14,19 @@ class OrganizationSerializer(serializers.ModelSerializer):
         model = Organization
         fields = [
             'id', 'name', 'org_type', 'bin', 'address', 'phone', 'email',
-            'capacity_per_day', 'created_at'
+            'capacity_per_day', 'exam_day_start', 'exam_day_end', 'slot_minutes', 'slot_capacity',
+            'created_at'
         ]
         read_only_fields = ['created_at']
+    
+    def validate(self, attrs):
+        start = attrs.get('exam_day_start', getattr(self.instance, 'exam_day_start', None))
+        end = attrs.get('exam_day_end', getattr(self.instance, 'exam_day_end', None))
+        if start and end and start >= end:
+            raise serializers.ValidationError({'exam_day_end': 'Окончание приема должно быть позже начала'})
+        if attrs.get('slot_minutes') == 0:
+            raise serializers.ValidationError({'slot_minutes': 'Длина слота должна быть больше нуля'})
+        return attrs
 
 
 class OrganizationMemberSerializer(serializers.ModelSerializer):
@@ -48,9 +58,13 @@ class EmployeeSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'full_name']
     
     def get_harmful_factors(self, obj):
+        if obj.position is None:
+            return []
+        # Фильтр в Python: используется предзагрузка position__harmful_factors, если она есть
         return [
             {'id': f.id, 'code': f.code, 'name': f.name}
-            for f in obj.position.harmful_factors.filter(is_active=True)
+            for f in obj.position.harmful_factors.all()
+            if f.is_active
         ]
 
 
@@ -77,7 +91,7 @@ class EmployeeCreateSerializer(serializers.ModelSerializer):
         phone_number = validated_data.pop('phone_number')
         
         # Нормализуем номер телефона
-        from apps.authentication.services import OTPService, GreenAPIService
+        from apps.authentication.services import OTPService, NotificationService
         from django.conf import settings
         
         normalized_phone = OTPService.normalize_phone(phone_number)
@@ -99,7 +113,7 @@ class EmployeeCreateSerializer(serializers.ModelSerializer):
         validated_data['user'] = user
         employee = super().create(validated_data)
         
-        # Отправляем приветственное сообщение сотруднику через WhatsApp
+        # Приветственное сообщение сотруднику через WhatsApp (очередь уведомлений)
         try:
             employer = validated_data.get('employer')
             site_url = getattr(settings, 'FRONTEND_URL', 'https://profmed.kz')
@@ -115,7 +129,9 @@ class EmployeeCreateSerializer(serializers.ModelSerializer):
                 f"3. Введите код для входа\n\n"
                 f"После входа вы сможете просматривать свои медицинские осмотры и результаты."
             )
-            GreenAPIService.send_whatsapp_message(normalized_phone, welcome_message)
+            NotificationService.enqueue(
+                normalized_phone, welcome_message, dedupe_key=f"employee-welcome:{employee.id}"
+            )
         except Exception as e:
             # Не блокируем создание если не удалось отправить сообщение
             print(f"Не удалось отправить приветственное сообщение сотруднику: {e}")
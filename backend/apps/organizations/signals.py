@@ -1,35 +1,108 @@
 """
 Signals for automatic document updates
 """
-from django.db.models.signals import post_save, post_delete
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from .models import Employee
-from apps.documents.services import DocumentService
+from apps.documents.models import DocumentType
+from apps.documents.services import DocumentService, DocumentQueueService
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
+
+def _auto_update_mode() -> str:
+    """Режим автообновления Приложения 3: deferred / incremental / full / off"""
+    return getattr(settings, 'APPENDIX_3_AUTO_UPDATE', 'deferred')
+
+
+def _mark_appendix_3_dirty(employer_id: int, year: int):
+    """Отметить Приложение 3 работодателя в очереди после фиксации транзакции"""
+    def mark():
+        try:
+            DocumentQueueService.mark_dirty(DocumentType.APPENDIX_3, employer_id, year)
+        except Exception as e:
+            logger.error(f"Ошибка постановки Приложения 3 в очередь: {e}")
+
+    transaction.on_commit(mark)
+
+
+@receiver(pre_save, sender=Employee)
+def remember_previous_employer(sender, instance, **kwargs):
+    """Запоминаем прежнего работодателя, чтобы убрать строку из его Приложения 3"""
+    instance._previous_employer_id = None
+    if instance.pk and _auto_update_mode() in ('deferred', 'incremental'):
+        loaded_state = getattr(instance, '_loaded_state', None)
+        if loaded_state is not None:
+            instance._previous_employer_id = loaded_state['employer_id']
+        else:
+            instance._previous_employer_id = Employee.objects.filter(
+                pk=instance.pk
+            ).values_list('employer_id', flat=True).first()
+
 
 @receiver(post_save, sender=Employee)
-@receiver(post_delete, sender=Employee)
 def auto_update_appendix_3(sender, instance, **kwargs):
     """
     Автоматически обновляет Приложение 3 при изменении сотрудников
-    
+
     Вызывается при:
     - Создании нового сотрудника
     - Обновлении существующего сотрудника
-    - Удалении сотрудника
+
+    В отложенном режиме работодатель только помечается в очереди
+    переформирования (обрабатывается командой process_document_queue).
+    В инкрементальном режиме пересчитывается только строка измененного
+    сотрудника. Полная пересборка доступна через DocumentService.generate_appendix_3
+    (POST generate_appendix_3, команда rebuild_appendix_3).
     """
-    if not instance.employer:
+    mode = _auto_update_mode()
+    if mode == 'off' or not instance.employer_id:
         return
-    
+
     # Обновляем Приложение 3 для текущего года
     current_year = timezone.now().year
-    
+
     try:
-        DocumentService.generate_appendix_3(instance.employer, current_year)
+        if mode == 'full':
+            DocumentService.generate_appendix_3(instance.employer, current_year)
+            return
+
+        previous_employer_id = getattr(instance, '_previous_employer_id', None)
+        employer_changed = previous_employer_id and previous_employer_id != instance.employer_id
+
+        if mode == 'deferred':
+            if employer_changed:
+                _mark_appendix_3_dirty(previous_employer_id, current_year)
+            _mark_appendix_3_dirty(instance.employer_id, current_year)
+            return
+
+        if employer_changed:
+            DocumentService.remove_appendix_3_row(previous_employer_id, instance.id, current_year)
+        DocumentService.update_appendix_3_row(instance.employer, instance.id, current_year)
     except Exception as e:
         # Логируем ошибку, но не блокируем сохранение сотрудника
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Ошибка автоматического обновления Приложения 3: {e}")
 
+
+@receiver(post_delete, sender=Employee)
+def auto_remove_from_appendix_3(sender, instance, **kwargs):
+    """Удаляет строку сотрудника из Приложения 3 при удалении сотрудника"""
+    mode = _auto_update_mode()
+    if mode == 'off' or not instance.employer_id:
+        return
+
+    current_year = timezone.now().year
+
+    try:
+        if mode == 'full':
+            DocumentService.generate_appendix_3(instance.employer, current_year)
+        elif mode == 'deferred':
+            _mark_appendix_3_dirty(instance.employer_id, current_year)
+        else:
+            DocumentService.remove_appendix_3_row(instance.employer_id, instance.id, current_year)
+    except Exception as e:
+        logger.error(f"Ошибка автоматического обновления Приложения 3: {e}")
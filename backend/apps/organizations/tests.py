@@ -91,3 +91,42 @@ class ClinicEmployerPartnershipTestCase(TestCase):
         
         self.assertTrue(partnership.is_public)
 
+    
+    def test_employee_demographics_from_iin(self):
+        """Тест: дата рождения и пол заполняются из ИИН при сохранении и командой"""
+        from datetime import date
+        from io import StringIO
+        from django.core.management import call_command
+        
+        employee_user = User.objects.create_user(username=self.employee_phone, phone_number=self.employee_phone)
+        employee = Employee.objects.create(
+            user=employee_user,
+            employer=self.employer,
+            first_name='Айгуль',
+            last_name='Сериковна',
+            iin='900215400123',
+            hire_date=timezone.now().date()
+        )
+        self.assertEqual(employee.date_of_birth, date(1990, 2, 15))
+        self.assertEqual(employee.gender, 'female')
+        
+        # Смена ИИН пересчитывает выведенные значения
+        employee = Employee.objects.get(pk=employee.pk)
+        employee.iin = '010320500456'
+        employee.save(update_fields=['iin'])
+        employee.refresh_from_db()
+        self.assertEqual((employee.date_of_birth, employee.gender), (date(2001, 3, 20), 'male'))
+        
+        # Указанные вручную значения не перезаписываются
+        employee.gender = 'female'
+        employee.save()
+        employee.iin = '010320500457'
+        employee.save()
+        employee.refresh_from_db()
+        self.assertEqual(employee.gender, 'female')
+        
+        # Старые записи без заполненных полей - пакетное заполнение
+        Employee.objects.filter(pk=employee.pk).update(date_of_birth=None, gender=None)
+        call_command('backfill_employee_demographics', batch_size=1, stdout=StringIO())
+        employee.refresh_from_db()
+        self.assertEqual((employee.date_of_birth, employee.gender), (date(2001, 3, 20), 'male'))
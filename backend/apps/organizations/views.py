@@ -138,9 +138,9 @@ class OrganizationViewSet(viewsets.ModelViewSet):
             member.is_active = True
             member.save()
         
-        # Отправляем приветственное сообщение медработнику через WhatsApp
+        # Приветственное сообщение медработнику через WhatsApp (очередь уведомлений)
         try:
-            from apps.authentication.services import GreenAPIService
+            from apps.authentication.services import NotificationService
             from django.conf import settings
             
             role_display = dict(OrganizationMember.ROLE_CHOICES).get(member.role, member.role)
@@ -158,7 +158,11 @@ class OrganizationViewSet(viewsets.ModelViewSet):
                 f"3. Введите код для входа\n\n"
                 f"После входа вы сможете работать с осмотрами и пациентами."
             )
-            GreenAPIService.send_whatsapp_message(normalized_phone, welcome_message)
+            NotificationService.enqueue(
+                normalized_phone,
+                welcome_message,
+                dedupe_key=f"member-welcome:{organization.id}:{member.user_id}"
+            )
         except Exception as e:
             # Не блокируем создание если не удалось отправить сообщение
             print(f"Не удалось отправить приветственное сообщение: {e}")
@@ -166,6 +170,58 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         serializer = OrganizationMemberSerializer(member)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['post'])
+    def simulate_capacity(self, request, pk=None):
+        """
+        Симуляция реальной пропускной способности клиники
+        
+        Body (все необязательно): employer_id, year - состав пациентов из Приложения 3
+        (иначе - предстоящие осмотры клиники), day_minutes, max_wait_minutes, seed,
+        apply: true - записать результат в capacity_per_day (его использует планировщик)
+        """
+        from django.utils import timezone
+        from apps.medical_examinations.simulation import ThroughputSimulationService
+        
+        clinic = self.get_object()
+        if clinic.org_type != 'clinic':
+            return Response({'error': 'Симуляция доступна только для клиник'}, status=status.HTTP_400_BAD_REQUEST)
+        is_manager = clinic.owner_id == request.user.id or clinic.members.filter(
+            user=request.user, role='admin', is_active=True
+        ).exists()
+        if not is_manager:
+            return Response(
+                {'error': 'Только владелец или администратор клиники может рассчитывать пропускную способность'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            employer = None
+            if request.data.get('employer_id'):
+                employer = Organization.objects.get(id=request.data['employer_id'], org_type='employer')
+            options = {
+                key: int(request.data[key])
+                for key in ('day_minutes', 'max_wait_minutes')
+                if request.data.get(key) not in (None, '')
+            }
+            result = ThroughputSimulationService.simulate_clinic(
+                clinic,
+                employer=employer,
+                year=int(request.data.get('year', timezone.now().year)),
+                seed=int(request.data.get('seed', 1)),
+                **options
+            )
+        except Organization.DoesNotExist:
+            return Response({'error': 'Работодатель не найден'}, status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        result['applied'] = False
+        if str(request.data.get('apply', '')).lower() in ('1', 'true', 'yes') and result['patients_per_day'] > 0:
+            clinic.capacity_per_day = result['patients_per_day']
+            clinic.save(update_fields=['capacity_per_day', 'updated_at'])
+            result['applied'] = True
+        return Response(result)
+    
     @action(detail=True, methods=['get'])
     def members(self, request, pk=None):
         """Получить список участников организации"""
@@ -244,6 +300,51 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         
         serializer.save()
     
+    @action(detail=False, methods=['get'])
+    def due(self, request):
+        """Сотрудники, которым нужен осмотр до даты (по вредным факторам)"""
+        from datetime import date
+        from apps.medical_examinations.services import DueDateService
+        from apps.medical_examinations.serializers import ExaminationDueDateSerializer
+        from django.db.models import Q
+        
+        employer_id = request.query_params.get('employer_id')
+        before = request.query_params.get('before')
+        
+        if not employer_id:
+            return Response(
+                {'error': 'Укажите employer_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            before_date = date.fromisoformat(before) if before else date.today()
+        except ValueError:
+            return Response(
+                {'error': 'Неверный формат даты, ожидается YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        employer = Organization.objects.filter(
+            Q(owner=request.user) | Q(members__user=request.user, members__role__in=['hr', 'admin', 'safety']),
+            id=employer_id,
+            org_type='employer'
+        ).first()
+        
+        if not employer:
+            return Response(
+                {'error': 'Работодатель не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        due_dates = DueDateService.due_before(employer, before_date).select_related('employee', 'harmful_factor')
+        page = self.paginate_queryset(due_dates)
+        if page is not None:
+            serializer = ExaminationDueDateSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = ExaminationDueDateSerializer(due_dates, many=True)
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['post'])
     def import_excel(self, request):
         """Импорт сотрудников из Excel"""
@@ -316,18 +417,17 @@ class ClinicEmployerPartnershipViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Отправляем уведомление клинике
-        from apps.authentication.services import GreenAPIService
-        try:
-            message = (
-                f"Новый запрос на партнерство от {employer.name}\n\n"
-                f"Работодатель: {employer.name}\n"
-                f"Предлагаемая цена: {default_price} тенге\n\n"
-                f"Войдите в систему для подтверждения."
-            )
-            GreenAPIService.send_whatsapp_message(clinic.owner.phone_number, message)
-        except Exception:
-            pass
+        # Уведомление клинике (очередь уведомлений)
+        from apps.authentication.services import NotificationService
+        message = (
+            f"Новый запрос на партнерство от {employer.name}\n\n"
+            f"Работодатель: {employer.name}\n"
+            f"Предлагаемая цена: {default_price} тенге\n\n"
+            f"Войдите в систему для подтверждения."
+        )
+        NotificationService.enqueue(
+            clinic.owner.phone_number, message, dedupe_key=f"partnership-request:{partnership.id}"
+        )
         
         serializer = self.get_serializer(partnership)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -361,17 +461,18 @@ class ClinicEmployerPartnershipViewSet(viewsets.ModelViewSet):
             partnership.expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
         partnership.save()
         
-        # Отправляем уведомление работодателю
-        from apps.authentication.services import GreenAPIService
-        try:
-            message = (
-                f"Партнерство с клиникой {partnership.clinic.name} подтверждено!\n\n"
-                f"Цена: {default_price} тенге\n"
-                f"Теперь вы можете назначать осмотры в этой клинике."
-            )
-            GreenAPIService.send_whatsapp_message(partnership.employer.owner.phone_number, message)
-        except Exception:
-            pass
+        # Уведомление работодателю (очередь уведомлений)
+        from apps.authentication.services import NotificationService
+        message = (
+            f"Партнерство с клиникой {partnership.clinic.name} подтверждено!\n\n"
+            f"Цена: {default_price} тенге\n"
+            f"Теперь вы можете назначать осмотры в этой клинике."
+        )
+        NotificationService.enqueue(
+            partnership.employer.owner.phone_number,
+            message,
+            dedupe_key=f"partnership-confirmed:{partnership.id}:{partnership.confirmed_at.isoformat()}"
+        )
         
         serializer = self.get_serializer(partnership)
         return Response(serializer.data)
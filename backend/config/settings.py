@@ -40,7 +40,7 @@ INSTALLED_APPS = [
     'apps.subscriptions',
     'apps.compliance',
     'apps.organizations.apps.OrganizationsConfig',
-    'apps.medical_examinations',
+    'apps.medical_examinations.apps.MedicalExaminationsConfig',
     'apps.documents',
 ]
 
@@ -163,6 +163,20 @@ CORS_ALLOW_CREDENTIALS = True
 GREEN_API_ID_INSTANCE = env('GREEN_API_ID_INSTANCE', default='')
 GREEN_API_TOKEN = env('GREEN_API_TOKEN', default='')
 GREEN_API_URL = env('GREEN_API_URL', default='https://7105.api.green-api.com')
+# Размер пула keep-alive соединений (и потоков отправки GreenAPIService.send_many), таймауты (секунды)
+GREEN_API_POOL_SIZE = int(env('GREEN_API_POOL_SIZE', default=16))
+GREEN_API_CONNECT_TIMEOUT = float(env('GREEN_API_CONNECT_TIMEOUT', default=3.05))
+GREEN_API_READ_TIMEOUT = float(env('GREEN_API_READ_TIMEOUT', default=10))
+
+# Notification Outbox Settings (команда send_notifications)
+# Сообщений в минуту на инстанс Green-API; индивидуальные лимиты: "instance=rate,..."
+NOTIFICATION_RATE_PER_MINUTE = float(env('NOTIFICATION_RATE_PER_MINUTE', default=60))
+NOTIFICATION_INSTANCE_RATES = env.dict('NOTIFICATION_INSTANCE_RATES', cast={'value': float}, default={})
+NOTIFICATION_MAX_ATTEMPTS = int(env('NOTIFICATION_MAX_ATTEMPTS', default=6))
+NOTIFICATION_RETRY_BASE_SECONDS = int(env('NOTIFICATION_RETRY_BASE_SECONDS', default=30))
+# Сообщение "в отправке" дольше этого времени после запланированного начала считается
+# брошенным упавшим обработчиком (секунды, больше GREEN_API_CONNECT/READ_TIMEOUT)
+NOTIFICATION_STALE_SECONDS = int(env('NOTIFICATION_STALE_SECONDS', default=120))
 
 # OTP Settings
 OTP_CODE_LENGTH = int(env('OTP_CODE_LENGTH', default=6))
@@ -171,3 +185,39 @@ OTP_EXPIRY_MINUTES = int(env('OTP_EXPIRY_MINUTES', default=5))
 # Custom User Model
 AUTH_USER_MODEL = 'authentication.User'
 
+
+# Clinic Schedule Settings
+# Нерабочие дни клиник помимо субботы и воскресенья: "MM-DD" (ежегодно) или "YYYY-MM-DD"
+CLINIC_HOLIDAYS = env.list('CLINIC_HOLIDAYS', default=[
+    '01-01', '01-02', '03-08', '03-21', '03-22', '03-23', '05-01', '05-07',
+    '05-09', '07-06', '08-30', '10-25', '12-16',
+])
+# Симуляция пропускной способности (simulate_capacity): длительность приема в минутах
+# по кабинетам ("registry" - регистратура, "default" - врач без отдельной настройки),
+# длина рабочего дня и допустимое ожидание пациента в очередях (минуты)
+EXAM_SERVICE_MINUTES = env.dict('EXAM_SERVICE_MINUTES', cast={'value': float}, default={
+    'registry': 3, 'profpathologist': 8, 'default': 10,
+})
+CLINIC_DAY_MINUTES = int(env('CLINIC_DAY_MINUTES', default=480))
+CLINIC_MAX_WAIT_MINUTES = int(env('CLINIC_MAX_WAIT_MINUTES', default=60))
+# Карточки регистратуры (сканер QR): время жизни в кэше, секунды (сбрасываются при изменениях)
+EXAM_CARD_CACHE_SECONDS = int(env('EXAM_CARD_CACHE_SECONDS', default=3600))
+# Манифест регистратуры: запас при синхронизации изменений по версии, секунды
+REGISTRY_SYNC_OVERLAP_SECONDS = int(env('REGISTRY_SYNC_OVERLAP_SECONDS', default=60))
+
+
+# Documents Settings
+# Автообновление Приложения 3 при изменении сотрудников:
+# deferred - отметка в очереди (process_document_queue), incremental - пересчет строки сотрудника,
+# full - полная пересборка, off - отключено
+APPENDIX_3_AUTO_UPDATE = env('APPENDIX_3_AUTO_UPDATE', default='deferred')
+# Период тишины перед переформированием и максимальная задержка (секунды)
+DOCUMENT_QUEUE_QUIET_SECONDS = int(env('DOCUMENT_QUEUE_QUIET_SECONDS', default=30))
+DOCUMENT_QUEUE_MAX_DELAY_SECONDS = int(env('DOCUMENT_QUEUE_MAX_DELAY_SECONDS', default=600))
+# Повтор после ошибки: задержка первого повтора (дальше удваивается) и число попыток
+DOCUMENT_QUEUE_RETRY_SECONDS = int(env('DOCUMENT_QUEUE_RETRY_SECONDS', default=60))
+DOCUMENT_QUEUE_MAX_ATTEMPTS = int(env('DOCUMENT_QUEUE_MAX_ATTEMPTS', default=5))
+# Объединение одновременных запросов формирования документа (single-flight):
+# время жизни блокировки и максимальное ожидание результата (секунды)
+DOCUMENT_SINGLE_FLIGHT_LOCK_SECONDS = int(env('DOCUMENT_SINGLE_FLIGHT_LOCK_SECONDS', default=120))
+DOCUMENT_SINGLE_FLIGHT_WAIT_SECONDS = int(env('DOCUMENT_SINGLE_FLIGHT_WAIT_SECONDS', default=60))